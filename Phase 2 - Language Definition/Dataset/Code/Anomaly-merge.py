@@ -1,12 +1,9 @@
 import pandas as pd
-import os
+from paths import output_path
 
-# Path alla cartella
-BASE_PATH = "/home/michael/Weather-and-climate-change/Phase 2 - Language Definition/Dataset"
-
-# Nome del file
-INPUT_FILE = os.path.join(BASE_PATH, "WeatherReport.csv")
-OUTPUT_FILE = os.path.join(BASE_PATH, "WeatherReport_ISO.csv")
+# Nome del file (cartella di output della pipeline)
+INPUT_FILE = output_path("WeatherReport.csv")
+OUTPUT_FILE = output_path("WeatherReport_ISO.csv")
 
 # Carica il file CSV
 df = pd.read_csv(INPUT_FILE)
@@ -1,48 +1,36 @@
-import pandas as pd
-import glob
-import os
-
-# Directory che contiene i file CSV
-INPUT_FOLDER = "/home/michael/Weather-and-climate-change/Phase 2 - Language Definition/Dataset/Dataset_API"
-
-all_rows = []
-
-# Cerca tutti i file del tipo open-meteo-*.csv nella directory indicata
-pattern = os.path.join(INPUT_FOLDER, "open-meteo-*.csv")
-
-for filepath in glob.glob(pattern):
-
-    # Estrae il nome della città dal file (es: open-meteo-Arco.csv → Arco)
-    city = os.path.basename(filepath).replace("open-meteo-", "").replace(".csv", "")
-
-    # Carica i dati saltando le prime 3 righe
-    df = pd.read_csv(filepath, skiprows=3)
-
-    # Crea il DataFrame finale con le colonne richieste
-    df_out = pd.DataFrame({
-        "City": city,
-        "Date": df["time"],
-        "WeatherCode": df["weather_code (wmo code)"],
-        "MaxHumidity (Percentage)": df["relative_humidity_2m_max (%)"],
-        "MinHumidity (Percentage)": df["relative_humidity_2m_min (%)"],
-        "MeanHumidity (Percentage)": df["relative_humidity_2m_mean (%)"],
-        "WindDirection (Degree)": df["winddirection_10m_dominant (°)"],
-        "MaxTemperature (Celsius)": df["temperature_2m_max (°C)"],
-        "MinTemperature (Celsius)": df["temperature_2m_min (°C)"],
-        "Precipitation (mm)": df["precipitation_sum (mm)"],
-        "PrecipitationHours (h)": df["precipitation_hours (h)"],
-        "WindGusts (km/h)": df["wind_gusts_10m_mean (km/h)"],
-        "WindSpeed (km/h)": df["wind_speed_10m_mean (km/h)"],
-        "MeanTemperature (Celsius)": df["temperature_2m_mean (°C)"]
-    })
-
-    all_rows.append(df_out)
-
-# Unisce tutti i file
-final_df = pd.concat(all_rows, ignore_index=True)
-
-# Salva il file finale nella stessa directory
-OUTPUT_FILE = os.path.join(INPUT_FOLDER, "weather_output.csv")
-final_df.to_csv(OUTPUT_FILE, index=False)
-
-print("File creato:", OUTPUT_FILE)
+import argparse
+from stations import CHUNK_SIZE, data_keys, map_chunks
+from reports import OUTPUT_FILES, MINIMUM_YEARS, REPORT_CHUNK_SIZE, ChunkedCSVWriter, report_outputs_chunk
+from functools import partial
+from contextlib import ExitStack
+from paths import output_path
+from instrument import span
+
+# Un solo passaggio sulle serie Open-Meteo scrive i quattro file del WeatherReport:
+#   WeatherReport.csv          → colonne rinominate
+#   WeatherReport_ISO.csv      → + Date_ISO e DateTime_xsd (come Anomaly-merge.py)
+#   WeatherReport_Station.csv  → + CityCode, stazione attiva più vicina (come city-fixed.py)
+#   WeatherReportMinimum.csv   → versione ridotta per Karma (come Minimum-weatherreport.py)
+
+parser = argparse.ArgumentParser(description="Streams the WeatherReport CSVs, one chunk of stations at a time")
+parser.add_argument('--first-year', type=int, default=MINIMUM_YEARS[0], help="First year of WeatherReportMinimum.csv")
+parser.add_argument('--last-year', type=int, default=MINIMUM_YEARS[1], help="Last year of WeatherReportMinimum.csv")
+args = parser.parse_args()
+
+# Stazioni con una serie Open-Meteo, dal registro di WeatherStation.csv
+keys = data_keys()
+chunk_size = min(CHUNK_SIZE, REPORT_CHUNK_SIZE)
+
+# Un chunk di stazioni alla volta: in memoria c'è solo il testo CSV del chunk corrente
+worker = partial(report_outputs_chunk, first_year=args.first_year, last_year=args.last_year)
+with span('stream') as current, ExitStack() as stack:
+    writers = {name: stack.enter_context(ChunkedCSVWriter(output_path(file_name)))
+               for name, file_name in OUTPUT_FILES.items()}
+    for texts in map_chunks(worker, keys, chunk_size):
+        for name, text in texts.items():
+            writers[name].write(text)
+    current.rows = writers['report'].rows
+
+print(f"{len(keys)} stazioni in chunk da {chunk_size}")
+for name, writer in writers.items():
+    print(f"File creato: {writer.path} ({writer.rows} righe)")
@@ -1,128 +1,37 @@
 import pandas as pd
-import os
-from datetime import datetime
+from functools import partial
+from stations import data_keys, map_chunks, concat_chunks
+from microclimate import microclimate_chunk, window_chunk, WINDOW_YEARS, WINDOW_STEP
+from paths import output_path
+from instrument import span
 
 # =======================================================
 # 📝 1. PROJECT CONFIGURATION
 # =======================================================
-## 🏙️ Cities and Paths
-CITIES = [
-    'Trento', 'Povo', 'Rovereto', 'Tenno', 'Mezzana',
-    'Predazzo', 'Lavarone', 'Telve', 'Cavalese', 'Arco'
-]
-BASE_PATH = '/home/michael/Weather-and-climate-change/Phase 2 - Language Definition/Dataset/Dataset_API/'
-FILE_PATTERN = 'open-meteo-{city}.csv'
 
 ## 💾 Output File
-OUTPUT_MICROCLIMA = 'microclima.csv' # Kept original name for consistency
-
-## 🏷️ Column Names (from CSV dataset)
-TEMP_MEAN_COL = 'temperature_2m_mean (°C)'
-HUM_MEAN_COL = 'relative_humidity_2m_mean (%)'
-WIND_SPEED_COL = 'wind_speed_10m_mean (km/h)'
-WIND_DIR_COL = 'winddirection_10m_dominant (°)'
-PREC_COL = 'precipitation_sum (mm)' # Not used in final calculations, but kept for completeness
+OUTPUT_MICROCLIMA = output_path('microclima.csv') # Kept original name for consistency
+# Time series of the classes: one row per city, season and rolling window of years
+OUTPUT_WINDOWS = output_path('microclima_windows.csv')
 
 # =======================================================
 # ⚙️ 2. MAIN ANALYSIS PROCESS
 # =======================================================
 microclima_rows = []
 
-for city in CITIES:
-    file_name = FILE_PATTERN.format(city=city)
-    file_path = os.path.join(BASE_PATH, file_name)
-
-    print(f"\n🔍 Processing: **{city}** (File: {file_name})")
-
-    try:
-        # 1. Reading the CSV: Skips the first 3 rows (metadata)
-        df = pd.read_csv(file_path, skiprows=3, dayfirst=True)
-
-        # 2. Checking for Essential Columns
-        required_cols = [TEMP_MEAN_COL, HUM_MEAN_COL, WIND_SPEED_COL, WIND_DIR_COL]
-        if not all(col in df.columns for col in required_cols):
-            print(f"❌ ERROR in {file_name}: Missing columns. Required: {required_cols}")
-            continue
-
-        # 3. Converting 'time' Column to datetime format
-        df['time'] = pd.to_datetime(df['time'], dayfirst=True)
-
-        # -----------------------------------------------
-        # 🛠️ METEOROLOGICAL CALCULATIONS
-        # -----------------------------------------------
-
-        ### Temperature Range
-        min_temp = df[TEMP_MEAN_COL].min()
-        max_temp = df[TEMP_MEAN_COL].max()
-        temp_range_str = f"{min_temp:.1f}°C - {max_temp:.1f}°C"
-
-        ### Humidity Range
-        min_hum = df[HUM_MEAN_COL].min()
-        max_hum = df[HUM_MEAN_COL].max()
-        hum_range_str = f"{min_hum:.0f}% - {max_hum:.0f}%"
-
-        ### Wind Analysis
-        avg_wind_speed = df[WIND_SPEED_COL].mean()
-        # Calculate dominant direction (mode), use 0 if empty
-        dominant_wind_dir = df[WIND_DIR_COL].mode().iloc[0] if not df[WIND_DIR_COL].mode().empty else 0
-
-        # Wind Strength Classification (Custom Scale)
-        if avg_wind_speed < 5:
-            wind_strength = "light winds"
-        elif avg_wind_speed < 15:
-            wind_strength = "moderate winds"
-        elif avg_wind_speed < 30:
-            wind_strength = "strong winds"
-        else:
-            wind_strength = "severe winds"
+# Una riga per stazione, calcolata dai worker un chunk di stazioni alla volta
+keys = data_keys()
+with span('compute') as current:
+    for rows in map_chunks(microclimate_chunk, keys):
+        microclima_rows.extend(rows)
+    current.rows = len(microclima_rows)
 
-        wind_pattern_str = (
-            f"{wind_strength}, avg {avg_wind_speed:.1f} km/h, dominant {dominant_wind_dir}°"
-        )
-        
-        # -----------------------------------------------
-        # 🌡️ MICROCLIMATE CLASSIFICATION (Based on Maximum Temperature)
-        # -----------------------------------------------
-        if max_temp < 12:
-            microclimate = "alpine cold microclimate"
-            type_micro = "cold"
-        elif max_temp < 18:
-            microclimate = "cool microclimate"
-            type_micro = "mild"
-        elif max_temp < 24:
-            microclimate = "temperate microclimate"
-            type_micro = "temperate"
-        elif max_temp < 30:
-            microclimate = "warm microclimate"
-            type_micro = "warm"
-        else:
-            microclimate = "very warm microclimate"
-            type_micro = "hot"
-
-        # Analysis Period
-        start_year = df['time'].dt.year.min()
-        end_year = df['time'].dt.year.max()
-        analysis_period = f"{start_year}-{end_year}"
-
-        # -----------------------------------------------
-        # 🏗️ CONSTRUCTING THE RESULT ROW
-        # -----------------------------------------------
-        microclima_row = {
-            'City': city,
-            'MicroClimate': f"{microclimate} ({analysis_period})",
-            'TypeMicroCustom': type_micro,
-            'TemperatureRange': temp_range_str,
-            'HumidityRange': hum_range_str,
-            'WindPattern': wind_pattern_str
-        }
-
-        microclima_rows.append(microclima_row)
-        print(f"✅ Data extracted and classified: {microclimate} ({type_micro})")
-
-    except FileNotFoundError:
-        print(f"❌ ERROR: File not found for {city} at path {file_path}")
-    except Exception as e:
-        print(f"❌ Generic ERROR reading/processing {file_name}: {e}")
+# Stesse grandezze su finestre mobili di WINDOW_YEARS anni, per stagione e sull'anno intero
+with span('windows') as current:
+    windows_df = concat_chunks(map_chunks(partial(window_chunk, window_years=WINDOW_YEARS, step=WINDOW_STEP), keys), keys)
+    if len(windows_df):
+        windows_df = windows_df.sort_values(['City', 'Season', 'StartYear'], kind='stable')
+    current.rows = len(windows_df)
 
 # =======================================================
 # 📤 3. EXPORTING RESULTS
@@ -133,7 +42,8 @@ if microclima_rows:
     final_df = pd.DataFrame(microclima_rows)
 
     # Writing the DataFrame to a CSV file
-    final_df.to_csv(OUTPUT_MICROCLIMA, index=False)
+    with span('export', rows=len(final_df)):
+        final_df.to_csv(OUTPUT_MICROCLIMA, index=False)
     
     # Printing the summary
     print(f"✅ SUCCESS! File '{OUTPUT_MICROCLIMA}' created.")
@@ -145,4 +55,15 @@ if microclima_rows:
     print("="*55)
 else:
     print("❌ No data generated. Check directory, file names, and columns.")
-    print("="*55)
\ No newline at end of file
+    print("="*55)
+
+if len(windows_df):
+    with span('export_windows', rows=len(windows_df)):
+        windows_df.to_csv(OUTPUT_WINDOWS, index=False)
+    changes = (windows_df.groupby(['City', 'Season'], observed=True)['TypeMicroCustom'].nunique() > 1).sum()
+    print(f"✅ {len(windows_df)} windowed microclimates ({WINDOW_YEARS}-year windows) → '{OUTPUT_WINDOWS}'")
+    print(f"   City/season series whose class changes over time: {changes}")
+    print("="*55)
+else:
+    print(f"❌ No windowed microclimate generated ({WINDOW_YEARS} years of data per station needed).")
+    print("="*55)
@@ -1,20 +1,33 @@
 import pandas as pd
-import os
+from paths import output_path
 
-# Path alla cartella
-BASE_PATH = "/home/michael/Weather-and-climate-change/Phase 2 - Language Definition/Dataset"
+# File input/output (cartella di output della pipeline)
+INPUT_FILE = output_path("WeatherReport_Station.csv")
+OUTPUT_FILE = output_path("WeatherReportMinimum.csv")
 
-# File input/output
-INPUT_FILE = os.path.join(BASE_PATH, "WeatherReport-minimum.csv")
-OUTPUT_FILE = os.path.join(BASE_PATH, "WeatherReportMinimum2.csv")
+# Colonne della versione ridotta usata per la mappatura Karma
+columns_map = {
+    "City": "City",
+    "WeatherCode": "WeatherCode",
+    "MeanHumidity (Percentage)": "MeanHumidity (Percentage)",
+    "WindDirection (Degree)": "WindDirection (Degree)",
+    "Precipitation (mm)": "Precipitation (mm)",
+    "WindGusts (km/h)": "WindGusts (km/h)",
+    "WindSpeed (km/h)": "WindSpeed (km/h)",
+    "MeanTemperature (Celsius)": "MeanTemperature (Celsius)",
+    "DateTime_xsd": "Date",
+    "CityCode": "StationCode"
+}
 
 # Carica il CSV
-df = pd.read_csv(INPUT_FILE)
+df = pd.read_csv(INPUT_FILE, usecols=list(columns_map))
+df = df[list(columns_map)].rename(columns=columns_map)
 df["Date"] = pd.to_datetime(df["Date"])
 # Filtra le righe con anno tra 2010 e 2025 (inclusi)
-df_filtered = df[(df["Date"].dt.year >= 2010) & (df["Date"].dt.year <= 2025)]
+df_filtered = df[(df["Date"].dt.year >= 2010) & (df["Date"].dt.year <= 2025)].copy()
+df_filtered["Date"] = df_filtered["Date"].dt.strftime("%Y-%m-%dT%H:%M:%S")
 
 # Salva il nuovo file
-df_filtered.to_csv("dati_meteo_2010_2025.csv", index=False)
+df_filtered.to_csv(OUTPUT_FILE, index=False)
 
-print("File generato: dati_meteo_2010_2025.csv")
+print("File generato:", OUTPUT_FILE)
@@ -0,0 +1,322 @@
+import numpy as np
+import pandas as pd
+from openmeteo_loader import FILE_PATTERN, source_path, load_available
+from store import open_store
+from instrument import traced
+
+# =======================================================
+# 🌡️ DATA-DRIVEN ANOMALY DETECTION
+# =======================================================
+# Every city/day is compared with the climatology of the same day of the
+# year: percentiles of the reference years over a window of ±HALF_WINDOW
+# days. Consecutive exceedances are grouped into events with a run-length
+# encoding, and the severity is the highest percentile level reached.
+# Everything works on (city, day) matrices, no Python loop over the days.
+
+## 📅 Reference climatology (WMO normal 1991-2020) and day-of-year window
+REFERENCE_YEARS = (1991, 2020)
+HALF_WINDOW = 7
+
+# Severity of the percentile levels, from the weakest to the strongest
+SEVERITIES = ['Low', 'Medium', 'High', 'Critical']
+
+## 🔎 Detectors: Anomaly name → TypeAnomaly, variable, tail, percentile levels, minimum duration
+# 'floor' ignores values below a physical minimum (e.g. 10 mm for a torrential rain)
+DETECTORS = {
+    'Extreme Heat Wave': {
+        'type': 'Too Hot Temperature',
+        'variable': 'temperature_2m_max (°C)',
+        'tail': 'high',
+        'levels': (0.90, 0.95, 0.99, 0.999),
+        'min_days': 3,
+    },
+    'Intense Cold Peak': {
+        'type': 'Too Cold Temperature',
+        'variable': 'temperature_2m_min (°C)',
+        'tail': 'low',
+        'levels': (0.05, 0.02, 0.01, 0.001),
+        'min_days': 1,
+    },
+    'Torrential Rainfall': {
+        'type': 'Excessive Precipitation',
+        'variable': 'precipitation_sum (mm)',
+        'tail': 'high',
+        'levels': (0.98, 0.99, 0.995, 0.999),
+        'min_days': 1,
+        'floor': 10.0,
+    },
+    'Record Wind': {
+        'type': 'Excessive Wind',
+        'variable': 'wind_gusts_10m_mean (km/h)',
+        'tail': 'high',
+        'levels': (0.98, 0.99, 0.995, 0.999),
+        'min_days': 1,
+    },
+}
+
+## 🏜️ Drought: runs of dry days longer than the usual dry spells of the city
+DROUGHT = {
+    'name': 'Severe Drought',
+    'type': 'Prolonged Low Precipitation',
+    'variable': 'precipitation_sum (mm)',
+    'dry_day_mm': 1.0,
+    'levels': (0.90, 0.95, 0.99, 0.999),
+    'min_days': 10,
+}
+
+# Non-leap years skip slot 59 (29 February), so 1 March is always slot 60
+DAYS_IN_YEAR = 366
+
+
+# -----------------------------------------------
+# 🧮 (CITY, DAY) MATRICES
+# -----------------------------------------------
+def to_matrix(df, columns):
+    """{column: float32 array (n_cities, n_days)} plus the city list and the date range.
+
+    df is the stacked frame of openmeteo_loader.load_all (date index, City categorical).
+    """
+    cities = list(df['City'].cat.categories)
+    dates = pd.date_range(df.index.min(), df.index.max(), freq='D')
+    rows = df['City'].cat.codes.to_numpy()
+    cols = (df.index - dates[0]).days.to_numpy()
+    matrices = {}
+    for column in columns:
+        matrix = np.full((len(cities), len(dates)), np.nan, dtype=np.float32)
+        matrix[rows, cols] = df[column].to_numpy(dtype=np.float32)
+        matrices[column] = matrix
+    return matrices, cities, dates
+
+
+def day_of_year_slots(dates):
+    """0..365 slot of each date, with 29 February on its own slot in every year."""
+    dates = pd.DatetimeIndex(dates)
+    slots = dates.dayofyear.to_numpy() - 1
+    shift = ~dates.is_leap_year & (slots >= 59)
+    return slots + shift
+
+
+def _quantiles(sorted_values, counts, q):
+    """Linear-interpolated quantile q along the last axis, NaNs sorted to the end."""
+    position = np.clip(counts - 1, 0, None) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, np.clip(counts - 1, 0, None))
+    low_values = np.take_along_axis(sorted_values, lower[..., None], axis=-1)[..., 0]
+    high_values = np.take_along_axis(sorted_values, upper[..., None], axis=-1)[..., 0]
+    result = low_values + (high_values - low_values) * (position - lower)
+    return np.where(counts > 0, result, np.nan)
+
+
+def window_samples(matrix, dates, reference=REFERENCE_YEARS, half_window=HALF_WINDOW):
+    """Reference values around every day of year: (n_cities, 366, years * window), NaN-padded."""
+    years = dates.year.to_numpy()
+    slots = day_of_year_slots(dates)
+    in_reference = (years >= reference[0]) & (years <= reference[1])
+    if not in_reference.any():
+        raise ValueError(f"No data in the reference period {reference[0]}-{reference[1]}")
+
+    # (city, year, slot) cube of the reference years, NaN where a day does not exist
+    ref_years = years[in_reference] - reference[0]
+    n_years = reference[1] - reference[0] + 1
+    cube = np.full((matrix.shape[0], n_years, DAYS_IN_YEAR), np.nan, dtype=np.float32)
+    cube[:, ref_years, slots[in_reference]] = matrix[:, in_reference]
+
+    # Circular window of ±half_window days around every slot → (city, slot, year * window)
+    offsets = np.arange(-half_window, half_window + 1)
+    window_slots = (np.arange(DAYS_IN_YEAR)[:, None] + offsets[None, :]) % DAYS_IN_YEAR
+    samples = cube[:, :, window_slots]                      # city, year, slot, window
+    return samples.transpose(0, 2, 1, 3).reshape(matrix.shape[0], DAYS_IN_YEAR, -1)
+
+
+def baseline_percentiles(samples, levels):
+    """Percentile thresholds (n_cities, 366, n_levels) per city and day of year."""
+    samples = np.sort(samples, axis=-1)
+    counts = np.count_nonzero(~np.isnan(samples), axis=-1)
+    return np.stack([_quantiles(samples, counts, q) for q in levels], axis=-1)
+
+
+def baseline_moments(samples):
+    """Mean and standard deviation (n_cities, 366) per city and day of year."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nanmean(samples, axis=-1), np.nanstd(samples, axis=-1)
+
+
+def z_score(value, mean, std):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(std > 0, (value - mean) / std, np.nan)
+
+
+# -----------------------------------------------
+# 📏 RUN-LENGTH ENCODING
+# -----------------------------------------------
+def runs(mask):
+    """(city, start, length) of every run of True along the days of a 2D mask."""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    city_start, start = np.nonzero(edges == 1)
+    _, end = np.nonzero(edges == -1)
+    # Both lists are sorted by (city, day), so starts and ends pair up
+    return city_start, start, end - start
+
+
+def run_maximum(values, city, start, length):
+    """Maximum of values over each run (values is a 2D city × day array)."""
+    if len(start) == 0:
+        return np.zeros(0, dtype=values.dtype)
+    flat = values.reshape(-1)
+    offsets = city * values.shape[1] + start
+    # reduceat over (start, end) pairs: the even slots hold the maximum of each run
+    bounds = np.stack([offsets, offsets + length], axis=1).reshape(-1)
+    bounds = np.minimum(bounds, flat.size - 1)
+    maxima = np.maximum.reduceat(flat, bounds)[::2]
+    # A run that ends on the very last cell lost its last element in the clip above
+    last = offsets + length == flat.size
+    maxima[last] = np.maximum(maxima[last], flat[-1])
+    return maxima
+
+
+# -----------------------------------------------
+# 🔎 DETECTORS
+# -----------------------------------------------
+# Columns of anomaly.csv, in the order _events writes them
+EVENT_COLUMNS = ['TypeAnomaly', 'Severity', 'DetectionDate', 'DetectionTime', 'Anomaly', 'City',
+                 'StartDate', 'EndDate', 'DurationDays', 'PeakValue', 'Threshold', 'ZScore']
+
+
+def _events(name, spec, city, start, length, detection, level, peak, threshold, score, cities, dates):
+    """Event table; detection is the day index on which the run became an anomaly."""
+    return pd.DataFrame({
+        'TypeAnomaly': spec['type'],
+        'Severity': np.array(SEVERITIES)[level - 1],
+        'DetectionDate': dates[detection].strftime('%d/%m/%Y'),
+        'DetectionTime': '00:00:00',
+        'Anomaly': name,
+        'City': np.array(cities)[city],
+        'StartDate': dates[start].strftime('%d/%m/%Y'),
+        'EndDate': dates[start + length - 1].strftime('%d/%m/%Y'),
+        'DurationDays': length,
+        'PeakValue': np.round(peak.astype(np.float64), 1),
+        'Threshold': np.round(threshold.astype(np.float64), 1),
+        'ZScore': np.round(np.asarray(score, dtype=np.float64), 2),
+    })
+
+
+def detect_threshold_events(name, spec, matrix, dates, cities, reference=REFERENCE_YEARS,
+                            half_window=HALF_WINDOW):
+    """Events of one percentile detector (heat, cold, rain, wind)."""
+    samples = window_samples(matrix, dates, reference, half_window)
+    slots = day_of_year_slots(dates)
+    daily = baseline_percentiles(samples, spec['levels'])[:, slots, :]      # city, day, level
+
+    # Lower tail: flip the signs so that "exceeding" always means bigger
+    sign = 1 if spec['tail'] == 'high' else -1
+    values = sign * matrix
+    limits = sign * daily
+    with np.errstate(invalid='ignore'):
+        level = (values[..., None] > limits).sum(axis=-1).astype(np.int8)
+        if 'floor' in spec:
+            level[matrix < spec['floor']] = 0
+
+    city, start, length = runs(level > 0)
+    keep = length >= spec['min_days']
+    city, start, length = city[keep], start[keep], length[keep]
+
+    peak_level = run_maximum(level, city, start, length)
+    peak = sign * run_maximum(np.nan_to_num(values, nan=-np.inf), city, start, length)
+    threshold = daily[city, start, 0]
+    # Peak distance from the climatological mean of the first day, in standard deviations
+    mean, std = baseline_moments(samples)
+    score = z_score(peak, mean[city, slots[start]], std[city, slots[start]])
+    detection = start + spec['min_days'] - 1
+    return _events(name, spec, city, start, length, detection, peak_level, peak, threshold, score,
+                   cities, dates)
+
+
+def detect_droughts(matrix, dates, cities, reference=REFERENCE_YEARS, spec=DROUGHT):
+    """Dry spells longer than the dry-spell percentiles of the reference years."""
+    dry = matrix < spec['dry_day_mm']
+    city, start, length = runs(dry)
+
+    # Percentiles of the dry-spell lengths per city, from the spells that start in the reference years
+    years = dates.year.to_numpy()[start]
+    in_reference = (years >= reference[0]) & (years <= reference[1])
+    n_cities = len(cities)
+    longest = np.bincount(city, minlength=n_cities).max() if len(city) else 0
+    spells = np.full((n_cities, max(longest, 1)), np.nan, dtype=np.float32)
+    rank = np.arange(len(city)) - np.searchsorted(city, city)
+    spells[city[in_reference], rank[in_reference]] = length[in_reference]
+    spells.sort(axis=-1)
+    counts = np.count_nonzero(~np.isnan(spells), axis=-1)
+    limits = np.stack([_quantiles(spells, counts, q) for q in spec['levels']], axis=-1)
+
+    level = (length[:, None] > limits[city]).sum(axis=-1)
+    keep = (level > 0) & (length >= spec['min_days'])
+    city, start, length, level = city[keep], start[keep], length[keep], level[keep]
+    # Detected on the first day the spell is longer than the lowest percentile (and min_days)
+    detection = start + np.maximum(np.floor(limits[city, 0]).astype(np.int64), spec['min_days'] - 1)
+    return _events(spec['name'], spec, city, start, length, detection, level, length.astype(np.float32),
+                   limits[city, 0], np.full(len(city), np.nan), cities, dates)
+
+
+def anomaly_columns(detectors=DETECTORS, drought=DROUGHT):
+    columns = {spec['variable'] for spec in detectors.values()}
+    if drought:
+        columns.add(drought['variable'])
+    return sorted(columns)
+
+
+def detect_anomalies(df, reference=REFERENCE_YEARS, half_window=HALF_WINDOW, detectors=DETECTORS,
+                     drought=DROUGHT):
+    """All anomaly events of the stacked Open-Meteo frame, sorted by detection date and city."""
+    matrices, cities, dates = to_matrix(df, anomaly_columns(detectors, drought))
+    return detect_in_matrices(matrices, cities, dates, reference, half_window, detectors, drought)
+
+
+def detect_in_matrices(matrices, cities, dates, reference=REFERENCE_YEARS, half_window=HALF_WINDOW,
+                       detectors=DETECTORS, drought=DROUGHT):
+    """Same as detect_anomalies on (city, day) matrices, e.g. slices of the daily store."""
+    frames = [
+        detect_threshold_events(name, spec, matrices[spec['variable']], dates, cities, reference, half_window)
+        for name, spec in detectors.items()
+    ]
+    if drought:
+        frames.append(detect_droughts(matrices[drought['variable']], dates, cities, reference, drought))
+
+    return sort_events(pd.concat(frames, ignore_index=True))
+
+
+def sort_events(events):
+    """Events ordered by detection date, then city (stable, so chunks can be merged)."""
+    order = np.lexsort((
+        events['City'].astype(str).to_numpy(),
+        pd.to_datetime(events['DetectionDate'], format='%d/%m/%Y').to_numpy(),
+    ))
+    return events.iloc[order].reset_index(drop=True)
+
+
+# -----------------------------------------------
+# 🧩 ONE CHUNK OF STATIONS (process pool worker)
+# -----------------------------------------------
+@traced(rows=lambda result: len(result[0]))
+def detect_chunk(keys, reference=REFERENCE_YEARS, half_window=HALF_WINDOW, first_day=None, last_day=None):
+    """Loads a chunk of stations and detects their events: (events, files_info).
+
+    Every station has its own climatology, so the chunks are independent.
+    With an up-to-date daily store the matrices are read from it directly.
+    """
+    store = open_store(keys)
+    if store is not None:
+        files_info = [{"City": city, "FileName": FILE_PATTERN.format(city=city),
+                       "FilePath": source_path(city), "Loaded": True} for city in keys]
+        matrices, cities, dates = store.matrices(keys, anomaly_columns(), first_day=first_day, last_day=last_day)
+        return detect_in_matrices(matrices, cities, dates, reference, half_window), files_info
+
+    df, files_info = load_available(keys)
+    if df is None:
+        return pd.DataFrame(columns=EVENT_COLUMNS), files_info
+    if first_day is not None:
+        df = df[df.index >= first_day]
+    if last_day is not None:
+        df = df[df.index <= last_day]
+    return detect_anomalies(df, reference=reference, half_window=half_window), files_info
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from paths import CODE_DIR, output_path
+from instrument import read_trace
+from pipeline import STAGES, stage_dependencies, topological_order
+from synthetic_data import generate
+
+# =======================================================
+# 📈 SCALING BENCHMARK OF THE PIPELINE STAGES
+# =======================================================
+# For every size N (stations) a synthetic dataset of N × YEARS is written
+# once with synthetic_data.py (reused while its parameters do not change),
+# then the stages run one after the other on it, each in its own process
+# as pipeline.py runs them, starting cold: empty output folder, no clean
+# ilmeteo.it files and no Open-Meteo cache. Per stage and size:
+#
+#   seconds, station-days/s, peak RSS of the stage (its pool workers included)
+#
+# and per stage the scaling exponent between consecutive sizes
+# (time ∝ N^k: k ≈ 1 is linear, k > 1 means the stage will not scale).
+#
+#   python benchmark_pipeline.py                      # 10, 100, 1000 stations × 10 years
+#   python benchmark_pipeline.py --stations 10 50 --years 5 --stage season --stage anomaly
+#
+# The spans of the stage scripts go to <work>/out-<N>x<Y>/logs/trace.jsonl
+# with one WEATHER_RUN_ID per stage (python instrument.py --file ... --run ...);
+# the peak RSS comes from there too.
+
+SIZES = [10, 100, 1000]
+YEARS = 10
+LAST_YEAR = 2024
+
+WORK_DIR = output_path(os.path.join('benchmarks', 'pipeline'))
+REPORT_CSV = output_path(os.path.join('benchmarks', 'pipeline_scaling.csv'))
+REPORT_JSON = output_path(os.path.join('benchmarks', 'pipeline_scaling.json'))
+
+# Raw merge, WeatherReport, analyses and RDF export (the store feeds the analyses)
+DEFAULT_STAGES = ['ilmeteo_merge', 'daily_store', 'weather_report', 'season', 'microclimate',
+                  'climate_trend', 'anomaly'] + [name for name in STAGES if name.startswith('ttl_')]
+
+
+def benchmark_args(name, first_year, last_year):
+    """Extra arguments of a stage on the synthetic period."""
+    if name == 'ilmeteo_merge':
+        return ['--full']
+    if name == 'anomaly':
+        # The default 1991-2020 reference is outside the synthetic years
+        return ['--reference', str(first_year), str(last_year)]
+    return []
+
+
+# -----------------------------------------------
+# ⏱️ ONE STAGE
+# -----------------------------------------------
+def run_stage(name, args, env, log_path):
+    """(exit code, seconds, peak RSS in MB of the largest process of the stage, workers included)."""
+    stage = STAGES[name]
+    command = [sys.executable, os.path.join(CODE_DIR, stage['script'])] + stage.get('args', []) + args
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        result = subprocess.run(command, cwd=env['WEATHER_OUTPUT_DIR'], env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - start
+    # Every process of the stage writes its own high-water mark in the trace (instrument.py)
+    trace = read_trace(os.path.join(env['WEATHER_OUTPUT_DIR'], 'logs', 'trace.jsonl'), run=env['WEATHER_RUN_ID'])
+    peak = max((r['peak_rss_mb'] for r in trace), default=float('nan'))
+    return result.returncode, seconds, peak
+
+
+def reset_outputs(dataset_dir, output_dir):
+    """Cold start: no outputs, no merged ilmeteo.it files, no Open-Meteo cache."""
+    for folder in (output_dir, os.path.join(dataset_dir, 'Dataset_Clean_ilmeteo.it'),
+                   os.path.join(dataset_dir, 'Dataset_API', 'cache')):
+        shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(os.path.join(output_dir, 'logs'), exist_ok=True)
+    os.makedirs(os.path.join(dataset_dir, 'Dataset_Clean_ilmeteo.it'), exist_ok=True)
+
+
+# -----------------------------------------------
+# 📏 ONE SIZE
+# -----------------------------------------------
+def run_size(n_stations, years, stages, work_dir, seed=0):
+    label = f"{n_stations}x{years}"
+    dataset_dir = os.path.join(work_dir, f"data-{label}")
+    output_dir = os.path.join(work_dir, f"out-{label}")
+
+    start = time.perf_counter()
+    manifest = generate(dataset_dir, n_stations, years, LAST_YEAR, seed)
+    print(f"🧪 {n_stations} stations × {years} years: {manifest['station_days']} station-days, "
+          f"{manifest['files']} files ({time.perf_counter() - start:.1f}s to prepare)")
+
+    reset_outputs(dataset_dir, output_dir)
+    env = dict(os.environ, WEATHER_DATASET_DIR=dataset_dir, WEATHER_OUTPUT_DIR=output_dir, WEATHER_TRACE='1')
+    env.pop('WEATHER_TRACE_FILE', None)
+    stamp = time.strftime('%Y%m%dT%H%M%S')
+
+    rows = []
+    for name in stages:
+        args = benchmark_args(name, manifest['first_year'], manifest['last_year'])
+        log_path = os.path.join(output_dir, 'logs', f"{name}.log")
+        # One run id per stage: ttl_export.py runs as several stages
+        env['WEATHER_RUN_ID'] = f"bench-{label}-{name}-{stamp}"
+        returncode, seconds, peak = run_stage(name, args, env, log_path)
+        rows.append({
+            'stations': n_stations, 'years': years, 'station_days': manifest['station_days'],
+            'stage': name, 'seconds': round(seconds, 3),
+            'station_days_per_sec': round(manifest['station_days'] / seconds, 1),
+            'peak_rss_mb': round(peak, 1), 'exit_code': returncode,
+        })
+        mark = '✅' if returncode == 0 else f"❌ exit {returncode}, see {log_path}"
+        print(f"   {name:<20} {seconds:>8.2f}s {rows[-1]['station_days_per_sec']:>12.0f} station-days/s "
+              f"{peak:>8.1f} MB  {mark}")
+    return rows
+
+
+# -----------------------------------------------
+# 📊 CURVES
+# -----------------------------------------------
+def scaling_table(results):
+    """One row per stage: seconds and peak MB at every size, and the time exponent between sizes."""
+    table = results.pivot_table(index='stage', columns='stations', values=['seconds', 'peak_rss_mb'], sort=False)
+    sizes = sorted(results['stations'].unique())
+    rows = []
+    for stage in table.index:
+        row = {'stage': stage}
+        for n in sizes:
+            row[f"s@{n}"] = table.loc[stage, ('seconds', n)]
+            row[f"MB@{n}"] = table.loc[stage, ('peak_rss_mb', n)]
+        for small, large in zip(sizes, sizes[1:]):
+            ratio = table.loc[stage, ('seconds', large)] / table.loc[stage, ('seconds', small)]
+            row[f"k {small}→{large}"] = round(float(np.log(ratio) / np.log(large / small)), 2)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# =======================================================
+# ⚙️ MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Times the pipeline stages on synthetic datasets of growing size")
+    parser.add_argument('--stations', type=int, nargs='+', default=SIZES, help="Sizes to run (stations)")
+    parser.add_argument('--years', type=int, default=YEARS, help=f"Years of every station (up to {LAST_YEAR})")
+    parser.add_argument('--stage', action='append', choices=sorted(STAGES),
+                        help="Only this stage (repeatable; the ones it needs are not added)")
+    parser.add_argument('--all-stages', action='store_true', help="Every stage of pipeline.py")
+    parser.add_argument('--work-dir', default=WORK_DIR, help="Where the datasets and outputs are written")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    selected = set(STAGES) if args.all_stages else set(args.stage or DEFAULT_STAGES)
+    stages = [name for name in topological_order(stage_dependencies(STAGES)) if name in selected]
+
+    results = []
+    for n_stations in sorted(args.stations):
+        results.extend(run_size(n_stations, args.years, stages, os.path.abspath(args.work_dir), args.seed))
+        # Written after every size: a 1000-station run takes a while
+        pd.DataFrame(results).to_csv(REPORT_CSV, index=False)
+
+    results = pd.DataFrame(results)
+    scaling = scaling_table(results[results['exit_code'] == 0])
+    with open(REPORT_JSON, 'w', encoding='utf-8') as f:
+        json.dump({'years': args.years, 'runs': results.to_dict('records'),
+                   'scaling': scaling.to_dict('records')}, f, indent=1)
+
+    print("\n📈 Seconds, peak MB and time exponent k (time ∝ stations^k) per stage")
+    print(scaling.to_string(index=False))
+    print(f"\n📝 {REPORT_CSV}\n📝 {REPORT_JSON}")
+    if (results['exit_code'] != 0).any():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+import os
+import io
+import re
+import sys
+import glob
+import gzip
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from paths import PROJECT_DIR, output_path
+from instrument import peak_rss_mb
+
+# =======================================================
+# 📝 1. CONFIGURATION
+# =======================================================
+# Loads the Phase 4 KG into a local in-process store (rdflib or Oxigraph),
+# runs every competency query of Evaluation/CQs and Queries.txt N times and
+# reports load time, latency percentiles, result counts and memory. The
+# results are compared with the outputs saved in CQs-query-output.xlsx so
+# the script can be used as a regression gate (--check).
+#
+# The Phase 4 folder has no WeatherReport triples: CQ 1.2, 2.3, 3.4 and 3.5
+# need the export of ttl_export.py as well, e.g.
+#   python benchmark_queries.py --data ../../../Phase\ 4\ -\ Entity\ Definition/*.ttl \
+#       --data ../Output/ttl/weatherreport.ttl.gz
+#
+# Optional dependencies: pip install rdflib   (or: pip install pyoxigraph)
+#                        pip install openpyxl (to read the expected outputs)
+
+KG_FILES = os.path.join(PROJECT_DIR, 'Phase 4 - Entity Definition', '*.ttl')
+QUERY_FILE = os.path.join(PROJECT_DIR, 'Evaluation', 'CQs and Queries.txt')
+EXPECTED_FILE = os.path.join(PROJECT_DIR, 'Evaluation', 'CQs-query-output.xlsx')
+
+REPORT_FILE = output_path(os.path.join('benchmarks', 'sparql_benchmark.json'))
+
+# Relative tolerance when comparing numbers (the saved outputs are float32)
+FLOAT_TOLERANCE = 1e-4
+
+CQ_ID = re.compile(r'(\d+\.\d+)')
+
+
+# =======================================================
+# 📄 2. QUERY FILE AND EXPECTED OUTPUTS
+# =======================================================
+def parse_query_file(path=QUERY_FILE):
+    """{cq id: {'title': ..., 'query': ...}} from the '=====' separated text file."""
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    queries = {}
+    title, body = None, []
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('==='):
+            text = stripped.strip('=').strip()
+            if text:
+                # Title line between two '====' rulers: starts a new query
+                if title is not None:
+                    queries[title[0]] = {'title': title[1], 'query': '\n'.join(body).strip()}
+                match = CQ_ID.search(text)
+                title = (match.group(1) if match else text, text)
+                body = []
+            continue
+        body.append(line)
+    if title is not None:
+        queries[title[0]] = {'title': title[1], 'query': '\n'.join(body).strip()}
+    return queries
+
+
+def read_expected(path=EXPECTED_FILE):
+    """{cq id: DataFrame} from the Output column of the evaluation workbook."""
+    sheet = pd.read_excel(path)
+    expected = {}
+    for _, row in sheet.iterrows():
+        match = CQ_ID.search(str(row['Query']))
+        if match and isinstance(row['Output'], str):
+            expected[match.group(1)] = pd.read_csv(io.StringIO(row['Output']), dtype=str, keep_default_na=False)
+    return expected
+
+
+# =======================================================
+# 🗄️ 3. STORE BACKENDS
+# =======================================================
+def _open_text(path):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')
+
+
+def _rdf_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'nt' if name.endswith('.nt') else 'turtle'
+
+
+class RdflibStore:
+    name = 'rdflib'
+
+    def __init__(self):
+        import rdflib
+        self.graph = rdflib.Graph()
+
+    def load(self, path):
+        with _open_text(path) as f:
+            # publicID fisso: il path con spazi non è un IRI base valido
+            self.graph.parse(f, format=_rdf_format(path), publicID='file:///' + os.path.basename(path))
+
+    def __len__(self):
+        return len(self.graph)
+
+    def query(self, text):
+        result = self.graph.query(text)
+        columns = [str(v) for v in result.vars]
+        rows = [['' if value is None else str(value) for value in row] for row in result]
+        return columns, rows
+
+
+class OxigraphStore:
+    name = 'oxigraph'
+
+    def __init__(self):
+        import pyoxigraph
+        self.ox = pyoxigraph
+        self.store = pyoxigraph.Store()
+
+    def load(self, path):
+        fmt = self.ox.RdfFormat.N_TRIPLES if _rdf_format(path) == 'nt' else self.ox.RdfFormat.TURTLE
+        with _open_text(path) as f:
+            self.store.load(f.read(), format=fmt)
+
+    def __len__(self):
+        return len(self.store)
+
+    def query(self, text):
+        result = self.store.query(text)
+        columns = [v.value for v in result.variables]
+        rows = [['' if s[c] is None else s[c].value for c in columns] for s in result]
+        return columns, rows
+
+
+BACKENDS = {'rdflib': RdflibStore, 'oxigraph': OxigraphStore}
+
+
+# =======================================================
+# 🔍 4. RESULT COMPARISON
+# =======================================================
+def _same_value(a, b):
+    if a == b:
+        return True
+    try:
+        x, y = float(a), float(b)
+    except ValueError:
+        return False
+    return abs(x - y) <= FLOAT_TOLERANCE * max(1.0, abs(x), abs(y))
+
+
+def compare_results(columns, rows, expected):
+    """Rows matched / missing / unexpected against the saved output.
+
+    Order and duplicate rows are ignored: the saved outputs come from a store
+    that loaded some files twice, so the same solution can appear more than once.
+    """
+    if [c.lower() for c in columns] != [c.lower() for c in expected.columns]:
+        return {'matches': False, 'reason': f"columns {columns} != {list(expected.columns)}"}
+    remaining = list(dict.fromkeys(tuple(r) for r in expected.itertuples(index=False)))
+    unexpected = 0
+    for row in dict.fromkeys(tuple(r) for r in rows):
+        for i, candidate in enumerate(remaining):
+            if all(_same_value(a, b) for a, b in zip(row, candidate)):
+                del remaining[i]
+                break
+        else:
+            unexpected += 1
+    return {
+        'matches': unexpected == 0 and not remaining,
+        'missing_rows': len(remaining),
+        'unexpected_rows': unexpected,
+    }
+
+
+# =======================================================
+# ⏱️ 5. BENCHMARK
+# =======================================================
+def run_benchmark(backend='rdflib', data_files=None, repeat=5, warmup=1, only=None, expected=None):
+    store = BACKENDS[backend]()
+
+    data_files = data_files or sorted(glob.glob(KG_FILES))
+    start = time.perf_counter()
+    for path in data_files:
+        store.load(path)
+    load_seconds = time.perf_counter() - start
+
+    report = {
+        'backend': backend,
+        'files': data_files,
+        'triples': len(store),
+        'load_seconds': round(load_seconds, 3),
+        'rss_after_load_mb': round(peak_rss_mb(), 1),
+        'queries': {},
+    }
+    print(f"📦 {backend}: {report['triples']} triples from {len(data_files)} files in {load_seconds:.2f}s")
+
+    for cq, info in parse_query_file().items():
+        if only and cq not in only:
+            continue
+        timings = []
+        try:
+            for i in range(warmup + repeat):
+                start = time.perf_counter()
+                columns, rows = store.query(info['query'])
+                if i >= warmup:
+                    timings.append(time.perf_counter() - start)
+        except Exception as e:
+            report['queries'][cq] = {'title': info['title'], 'error': str(e)}
+            print(f"❌ CQ {cq}: {e}")
+            continue
+
+        ms = np.array(timings) * 1000
+        entry = {
+            'title': info['title'],
+            'results': len(rows),
+            'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p90_ms': round(float(np.percentile(ms, 90)), 2),
+            'p99_ms': round(float(np.percentile(ms, 99)), 2),
+            'min_ms': round(float(ms.min()), 2),
+            'max_ms': round(float(ms.max()), 2),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        if expected is not None and cq in expected:
+            entry['expected'] = compare_results(columns, rows, expected[cq])
+        report['queries'][cq] = entry
+
+        check = ''
+        if 'expected' in entry:
+            check = ' ✅ matches saved output' if entry['expected']['matches'] else ' ⚠️ differs from saved output'
+        print(f"🔎 CQ {cq}: {entry['results']} rows, p50 {entry['p50_ms']} ms, "
+              f"p90 {entry['p90_ms']} ms{check}")
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the competency queries on a local RDF store")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='rdflib')
+    parser.add_argument('--data', action='append', nargs='+',
+                        help="RDF files to load (.ttl/.nt, optionally .gz); default: Phase 4 .ttl files")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per query")
+    parser.add_argument('--cq', action='append', help="Only run this CQ id (e.g. 5.1); repeatable")
+    parser.add_argument('--check', action='store_true',
+                        help="Exit with status 1 if a query fails or differs from CQs-query-output.xlsx")
+    parser.add_argument('--report', default=REPORT_FILE, help="JSON report path")
+    args = parser.parse_args()
+
+    expected = None
+    try:
+        expected = read_expected()
+    except (ImportError, FileNotFoundError) as e:
+        print(f"⚠️ Expected outputs not available ({e}): results will not be compared.")
+
+    data_files = [path for group in args.data for path in group] if args.data else None
+    report = run_benchmark(args.backend, data_files, args.repeat, args.warmup, args.cq, expected)
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"\n📝 Report written to {args.report}")
+
+    if args.check:
+        failed = [cq for cq, q in report['queries'].items()
+                  if 'error' in q or not q.get('expected', {'matches': True})['matches']]
+        if failed:
+            print(f"❌ Regression in CQ {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,17 @@
 import pandas as pd
-import os
+from spatial import assign_station_codes
+from paths import output_path
 
-# Path alla cartella
-BASE_PATH = "/home/michael/Weather-and-climate-change/Phase 2 - Language Definition/Dataset"
-
-# File input/output
-INPUT_FILE = os.path.join(BASE_PATH, "WeatherReport.csv")
-OUTPUT_FILE = os.path.join(BASE_PATH, "WeatherReport_ISO.csv")
+# File input/output (le date ISO sono aggiunte da Anomaly-merge.py)
+INPUT_FILE = output_path("WeatherReport_ISO.csv")
+OUTPUT_FILE = output_path("WeatherReport_Station.csv")
 
 # Carica il CSV
 df = pd.read_csv(INPUT_FILE)
 
-# Mapping città → codici
-city_codes = {
-    "Lavarone": "T0032",
-    "Trento": "T0356",
-    "Povo": "T0142",
-    "Mezzana": "T0071",
-    "Arco": "T0322",
-    "Tenno": "T0200",
-    "Cavalese": "T0367",
-    "Telve": "T0392",
-    "Predazzo": "T0389",
-    "Rovereto":"T0147"
-}
-
-# Aggiunge la colonna CityCode
-df["CityCode"] = df["City"].map(city_codes)
+# Aggiunge la colonna CityCode: stazione più vicina alla città (indice spaziale su
+# WeatherStation.csv) tra quelle attive nel giorno del report
+df["CityCode"] = assign_station_codes(df["City"], pd.to_datetime(df["Date_ISO"]))
 
 # Controllo: eventuali città non presenti nel mapping
 missing_codes = df[df["CityCode"].isna()]["City"].unique()
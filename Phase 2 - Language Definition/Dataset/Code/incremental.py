@@ -0,0 +1,478 @@
+import os
+import json
+import time
+import argparse
+import calendar
+from datetime import date as calendar_date, timedelta
+import numpy as np
+import pandas as pd
+from openmeteo_loader import load_all
+from store import open_store
+from anomalies import (REFERENCE_YEARS, HALF_WINDOW, DETECTORS, DROUGHT, SEVERITIES, DAYS_IN_YEAR,
+                       to_matrix, day_of_year_slots, runs, z_score)
+from trends import TREND_VARIABLES, unit_of
+from paths import output_path
+
+# =======================================================
+# 📝 1. CONFIGURATION
+# =======================================================
+# Daily refresh of the anomaly and climate-trend outputs without going back
+# to the full 1990-2025 history. The sufficient statistics are kept in one
+# .npz file and every new (city, day) observation updates them in O(1):
+#   - per city and day of year: histograms of the reference values (for the
+#     percentile thresholds) and Welford mean/variance (for the z-scores),
+#     both over the ±HALF_WINDOW window, exactly as anomalies.py;
+#   - per city and detector: the state of the current run of exceedances;
+#   - per city: the current dry spell and the histogram of the reference dry spells;
+#   - per city and variable: the regression sums n, Σx, Σy, Σxy, Σx², Σy².
+# Only the new Anomaly rows are appended to anomaly.csv, and the ClimateTrend
+# rows are rewritten from the sums. Rows are emitted on the detection day,
+# with the severity and duration reached so far.
+#
+#   python incremental.py --init   # build the state from the full history
+#   python incremental.py          # process the days after the last update
+
+STATE_FILE = output_path(os.path.join('state', 'incremental_state.npz'))
+ANOMALY_OUTPUT = output_path('anomaly.csv')
+TREND_OUTPUT = output_path('climate_trend_analysis.csv')
+
+## 📊 Histogram bins (low, high, step) of the detector variables
+HIST_BINS = {
+    'temperature_2m_max (°C)': (-40.0, 50.0, 0.2),
+    'temperature_2m_min (°C)': (-40.0, 50.0, 0.2),
+    'precipitation_sum (mm)': (0.0, 300.0, 0.5),
+    'wind_gusts_10m_mean (km/h)': (0.0, 200.0, 0.5),
+}
+
+# Longest dry spell kept in the spell histogram (longer ones fall in the last bin)
+MAX_SPELL = 400
+
+## 📈 Regression sums of the trend variables; x is in years since EPOCH
+TREND_COLS = TREND_VARIABLES
+EPOCH = pd.Timestamp('1990-01-01')
+EPOCH_DATE = calendar_date(1990, 1, 1)
+
+
+# =======================================================
+# 📊 2. HISTOGRAM QUANTILES
+# =======================================================
+def day_date(day):
+    return EPOCH_DATE + timedelta(days=int(day))
+
+
+def day_slot(day):
+    """Same slot as anomalies.day_of_year_slots, for a single day (no pandas overhead)."""
+    date = day_date(day)
+    slot = date.timetuple().tm_yday - 1
+    return slot + 1 if not calendar.isleap(date.year) and slot >= 59 else slot
+
+
+def to_bins(values, variable):
+    low, high, step = HIST_BINS[variable]
+    n_bins = int(round((high - low) / step))
+    bins = np.floor((np.nan_to_num(values, nan=low) - low) / step).astype(np.int64)
+    return np.clip(bins, 0, n_bins - 1), n_bins
+
+
+def histogram_quantiles(hist, levels, variable):
+    """Quantiles (..., n_levels) of binned counts, interpolated inside the bin as in _quantiles."""
+    low, _, step = HIST_BINS[variable]
+    cum = hist.cumsum(axis=-1)
+    total = cum[..., -1]
+    position = np.clip(total - 1, 0, None)[..., None] * np.asarray(levels)        # ..., level
+    # First bin whose cumulative count is above the 0-based rank
+    bin_index = (cum[..., None, :] <= position[..., None]).sum(axis=-1)
+    bin_index = np.minimum(bin_index, hist.shape[-1] - 1)
+    before = np.take_along_axis(cum, bin_index, axis=-1) - np.take_along_axis(hist, bin_index, axis=-1)
+    inside = np.take_along_axis(hist, bin_index, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(inside > 0, (position - before + 0.5) / inside, 0.5)
+    values = low + step * (bin_index + np.clip(fraction, 0, 1))
+    return np.where(total[..., None] > 0, values, np.nan)
+
+
+# =======================================================
+# 🏗️ 3. STATE FROM THE FULL HISTORY
+# =======================================================
+def _window_targets(city, slots, half_window):
+    """(city, slot) pairs of the ±half_window window of every observation."""
+    offsets = np.arange(-half_window, half_window + 1)
+    return np.repeat(city, len(offsets)), ((slots[:, None] + offsets[None, :]) % DAYS_IN_YEAR).reshape(-1)
+
+
+def _run_state(mask, values, levels):
+    """Length, start index, peak level and peak value of the run still open on the last day."""
+    n_cities, n_days = mask.shape
+    city, start, length = runs(mask)
+    open_run = start + length == n_days
+    state = {
+        'length': np.zeros(n_cities, dtype=np.int32),
+        'start': np.zeros(n_cities, dtype=np.int64),
+        'peak_level': np.zeros(n_cities, dtype=np.int8),
+        'peak': np.full(n_cities, -np.inf, dtype=np.float64),
+    }
+    for c, s in zip(city[open_run], start[open_run]):
+        state['length'][c] = n_days - s
+        state['start'][c] = s
+        if levels is not None:
+            state['peak_level'][c] = levels[c, s:].max()
+            state['peak'][c] = np.nanmax(values[c, s:])
+    return state
+
+
+def build_state(df, reference=REFERENCE_YEARS, half_window=HALF_WINDOW):
+    """Sufficient statistics of the whole stacked Open-Meteo frame."""
+    columns = sorted(set(HIST_BINS) | set(TREND_COLS))
+    matrices, cities, dates = to_matrix(df, columns)
+    n_cities = len(cities)
+    years = dates.year.to_numpy()
+    slots = day_of_year_slots(dates)
+    in_reference = (years >= reference[0]) & (years <= reference[1])
+    day_ordinal = (dates - EPOCH).days.to_numpy()
+
+    # Observed range of each city: a series that ends early (failed or late download)
+    # must still take its next days in the update
+    observed = np.zeros((n_cities, len(dates)), dtype=bool)
+    for values in matrices.values():
+        observed |= ~np.isnan(values)
+    has_data = observed.any(axis=1)
+    first_column = np.where(has_data, observed.argmax(axis=1), 0)
+    last_column = np.where(has_data, len(dates) - 1 - observed[:, ::-1].argmax(axis=1), -1)
+
+    state = {'meta': {
+        'cities': cities,
+        'reference': list(reference),
+        'half_window': half_window,
+        'first_day': [int(day_ordinal[0] + column) for column in first_column],
+        'last_day': [int(day_ordinal[0] + column) for column in last_column],
+    }}
+
+    # --- Histograms and Welford moments of the reference window ---
+    city_grid, day_grid = np.nonzero(np.ones((n_cities, in_reference.sum()), dtype=bool))
+    ref_days = np.flatnonzero(in_reference)[day_grid]
+    target_city, target_slot = _window_targets(city_grid, slots[ref_days], half_window)
+    for variable in HIST_BINS:
+        values = matrices[variable][city_grid, ref_days].astype(np.float64)
+        valid = np.repeat(~np.isnan(values), 2 * half_window + 1)
+        repeated = np.repeat(values, 2 * half_window + 1)[valid]
+        cell = target_city[valid] * DAYS_IN_YEAR + target_slot[valid]
+        bins, n_bins = to_bins(repeated, variable)
+        size = n_cities * DAYS_IN_YEAR
+        hist = np.bincount(cell * n_bins + bins, minlength=size * n_bins)
+        state[f"hist/{variable}"] = hist.reshape(n_cities, DAYS_IN_YEAR, n_bins).astype(np.uint16)
+
+        count = np.bincount(cell, minlength=size).astype(np.float64)
+        total = np.bincount(cell, weights=repeated, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, 0.0)
+        m2 = np.bincount(cell, weights=(repeated - mean[cell]) ** 2, minlength=size)
+        state[f"count/{variable}"] = count.reshape(n_cities, DAYS_IN_YEAR)
+        state[f"mean/{variable}"] = mean.reshape(n_cities, DAYS_IN_YEAR)
+        state[f"m2/{variable}"] = m2.reshape(n_cities, DAYS_IN_YEAR)
+
+    # --- Open runs of the detectors on the last day ---
+    for name, spec in DETECTORS.items():
+        variable = spec['variable']
+        levels = daily_levels(state, spec, matrices[variable], slots)
+        sign = 1 if spec['tail'] == 'high' else -1
+        run = _run_state(levels > 0, sign * matrices[variable].astype(np.float64), levels)
+        run['start'] = run['start'] + day_ordinal[0]
+        for key, value in run.items():
+            state[f"run/{name}/{key}"] = value
+
+    # --- Dry spells: histogram of the reference spells and open spell ---
+    precipitation = matrices[DROUGHT['variable']]
+    dry = precipitation < DROUGHT['dry_day_mm']
+    city, start, length = runs(dry)
+    closed = start + length < len(dates)
+    counted = closed & in_reference[start]
+    spells = np.zeros((n_cities, MAX_SPELL + 1), dtype=np.int32)
+    np.add.at(spells, (city[counted], np.minimum(length[counted], MAX_SPELL)), 1)
+    state['spells'] = spells
+    dry_run = _run_state(dry, None, None)
+    state['dry/length'] = dry_run['length']
+    state['dry/start'] = dry_run['start'] + day_ordinal[0]
+
+    # --- Regression sums per city and variable ---
+    x = (day_ordinal / 365.25)[None, :]
+    for variable in TREND_COLS:
+        y = matrices[variable].astype(np.float64)
+        valid = ~np.isnan(y)
+        xv, yv = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+        state[f"sums/{variable}"] = np.stack([
+            valid.sum(axis=1), xv.sum(axis=1), yv.sum(axis=1),
+            (xv * yv).sum(axis=1), (xv * xv).sum(axis=1), (yv * yv).sum(axis=1),
+        ], axis=1).astype(np.float64)
+
+    return state
+
+
+def daily_levels(state, spec, matrix, slots):
+    """Percentile level (0-4) of every (city, day), thresholds read from the histograms."""
+    variable = spec['variable']
+    levels = np.zeros(matrix.shape, dtype=np.int8)
+    sign = 1 if spec['tail'] == 'high' else -1
+    for slot in np.unique(slots):
+        days = np.flatnonzero(slots == slot)
+        limits = histogram_quantiles(state[f"hist/{variable}"][:, slot, :], spec['levels'], variable)
+        with np.errstate(invalid='ignore'):
+            level = (sign * matrix[:, days, None] > sign * limits[:, None, :]).sum(axis=-1)
+        if 'floor' in spec:
+            level[matrix[:, days] < spec['floor']] = 0
+        levels[:, days] = level
+    return levels
+
+
+# =======================================================
+# 💾 4. PERSISTENCE
+# =======================================================
+def save_state(state, path=STATE_FILE):
+    arrays = {key: value for key, value in state.items() if key != 'meta'}
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, meta=np.array(json.dumps(state['meta'])), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_state(path=STATE_FILE):
+    with np.load(path) as data:
+        state = {key: data[key] for key in data.files if key != 'meta'}
+        state['meta'] = json.loads(str(data['meta']))
+    return state
+
+
+# =======================================================
+# ⚡ 5. O(1) UPDATE OF ONE DAY
+# =======================================================
+def _anomaly_row(name, spec, city, day, start, length, level, peak, threshold, score):
+    return {
+        'TypeAnomaly': spec['type'],
+        'Severity': SEVERITIES[level - 1],
+        'DetectionDate': day_date(day).strftime('%d/%m/%Y'),
+        'DetectionTime': '00:00:00',
+        'Anomaly': name,
+        'City': city,
+        'StartDate': day_date(start).strftime('%d/%m/%Y'),
+        'EndDate': day_date(day).strftime('%d/%m/%Y'),
+        'DurationDays': int(length),
+        'PeakValue': round(float(peak), 1),
+        'Threshold': round(float(threshold), 1),
+        'ZScore': round(float(score), 2),
+    }
+
+
+def update_day(state, c, day, values):
+    """Adds one observation of city index c (values: {column: value}); returns the new anomaly rows."""
+    meta = state['meta']
+    city = meta['cities'][c]
+    date = day_date(day)
+    slot = day_slot(day)
+    reference = meta['reference']
+    half_window = meta['half_window']
+    rows = []
+
+    # Regression sums
+    x = day / 365.25
+    for variable in TREND_COLS:
+        y = values.get(variable, np.nan)
+        if not np.isnan(y):
+            state[f"sums/{variable}"][c] += [1.0, x, y, x * y, x * x, y * y]
+
+    # Reference window (only when the day belongs to the reference years, e.g. a correction)
+    if reference[0] <= date.year <= reference[1]:
+        window = (slot + np.arange(-half_window, half_window + 1)) % DAYS_IN_YEAR
+        for variable in HIST_BINS:
+            y = values.get(variable, np.nan)
+            if np.isnan(y):
+                continue
+            bins, _ = to_bins(np.array([y]), variable)
+            state[f"hist/{variable}"][c, window, bins[0]] += 1
+            # Welford on the 2 * half_window + 1 slots of the window
+            count = state[f"count/{variable}"][c, window] + 1
+            mean = state[f"mean/{variable}"][c, window]
+            delta = y - mean
+            mean = mean + delta / count
+            state[f"m2/{variable}"][c, window] += delta * (y - mean)
+            state[f"count/{variable}"][c, window] = count
+            state[f"mean/{variable}"][c, window] = mean
+
+    # Percentile detectors
+    for name, spec in DETECTORS.items():
+        variable = spec['variable']
+        y = values.get(variable, np.nan)
+        key = f"run/{name}/"
+        limits = histogram_quantiles(state[f"hist/{variable}"][c, slot], spec['levels'], variable)
+        sign = 1 if spec['tail'] == 'high' else -1
+        level = int((sign * y > sign * limits).sum()) if not np.isnan(y) else 0
+        if 'floor' in spec and not y >= spec['floor']:
+            level = 0
+        if level == 0:
+            state[key + 'length'][c] = 0
+            continue
+        if state[key + 'length'][c] == 0:
+            state[key + 'start'][c] = day
+            state[key + 'peak_level'][c] = 0
+            state[key + 'peak'][c] = -np.inf
+        state[key + 'length'][c] += 1
+        state[key + 'peak_level'][c] = max(state[key + 'peak_level'][c], level)
+        state[key + 'peak'][c] = max(state[key + 'peak'][c], sign * y)
+        if state[key + 'length'][c] == spec['min_days']:
+            start = state[key + 'start'][c]
+            start_slot = day_slot(start)
+            start_limit = histogram_quantiles(state[f"hist/{variable}"][c, start_slot], spec['levels'], variable)
+            count = state[f"count/{variable}"][c, start_slot]
+            std = np.sqrt(state[f"m2/{variable}"][c, start_slot] / count) if count else np.nan
+            peak = sign * state[key + 'peak'][c]
+            score = z_score(peak, state[f"mean/{variable}"][c, start_slot], std)
+            rows.append(_anomaly_row(name, spec, city, day, start, spec['min_days'],
+                                     state[key + 'peak_level'][c], peak, start_limit[0], score))
+
+    # Dry spells
+    precipitation = values.get(DROUGHT['variable'], np.nan)
+    if precipitation < DROUGHT['dry_day_mm']:
+        if state['dry/length'][c] == 0:
+            state['dry/start'][c] = day
+        state['dry/length'][c] += 1
+        length = state['dry/length'][c]
+        limits = spell_limits(state, c)
+        detection_length = max(int(np.floor(limits[0])), DROUGHT['min_days'] - 1) + 1
+        if length == detection_length:
+            level = int((length > limits).sum())
+            rows.append(_anomaly_row(DROUGHT['name'], DROUGHT, city, day, state['dry/start'][c], length,
+                                     level, length, limits[0], np.nan))
+    else:
+        length = state['dry/length'][c]
+        start_year = day_date(state['dry/start'][c]).year
+        if length and reference[0] <= start_year <= reference[1]:
+            state['spells'][c, min(length, MAX_SPELL)] += 1
+        state['dry/length'][c] = 0
+
+    meta['last_day'][c] = max(meta['last_day'][c], int(day))
+    return rows
+
+
+def spell_limits(state, c):
+    """Dry-spell length percentiles of city c (same interpolation as anomalies._quantiles)."""
+    cum = state['spells'][c].cumsum()
+    total = cum[-1]
+    if total == 0:
+        return np.full(len(DROUGHT['levels']), np.inf)
+    position = (total - 1) * np.asarray(DROUGHT['levels'])
+    lower = np.floor(position)
+    # Spell length at 0-based rank r = first length whose cumulative count is above r
+    low_values = np.searchsorted(cum, lower, side='right')
+    high_values = np.searchsorted(cum, np.minimum(lower + 1, total - 1), side='right')
+    return low_values + (high_values - low_values) * (position - lower)
+
+
+def update_state(state, df):
+    """Feeds the rows of df newer than the last processed day; returns the new anomaly rows."""
+    meta = state['meta']
+    index = {city: i for i, city in enumerate(meta['cities'])}
+    city = df['City'].astype(str).map(index).fillna(-1).astype(int).to_numpy()
+    day = (df.index - EPOCH).days.to_numpy()
+
+    # Only the days after the last update of each city, in date order
+    last_day = np.append(np.asarray(meta['last_day']), np.iinfo(np.int64).max)
+    new = np.flatnonzero((city >= 0) & (day > last_day[city]))
+    new = new[np.argsort(day[new], kind='stable')]
+
+    columns = sorted(set(HIST_BINS) | set(TREND_COLS))
+    values = {col: df[col].to_numpy(dtype=np.float64)[new] for col in columns}
+    rows = []
+    for i, position in enumerate(new):
+        observation = {col: values[col][i] for col in columns}
+        rows.extend(update_day(state, city[position], int(day[position]), observation))
+    return pd.DataFrame(rows)
+
+
+def load_tail(cities, after_day):
+    """Stacked frame of the days after after_day: only those store rows are read when the store is up to date."""
+    columns = sorted(set(HIST_BINS) | set(TREND_COLS))
+    first_date = EPOCH + pd.Timedelta(days=after_day + 1)
+    store = open_store(cities)
+    if store is None:
+        df = load_all(cities)
+        return df[df.index >= first_date]
+    matrices, keys, dates = store.matrices(cities, columns, first_day=first_date)
+    df = pd.DataFrame({col: matrices[col].ravel() for col in columns},
+                      index=pd.DatetimeIndex(np.tile(dates.to_numpy(), len(keys)), name='time'))
+    df.insert(0, 'City', pd.Categorical.from_codes(np.repeat(np.arange(len(keys)), len(dates)), categories=keys))
+    return df[df[columns].notna().any(axis=1)]
+
+
+# =======================================================
+# 📈 6. CLIMATE TREND FROM THE SUMS
+# =======================================================
+def trend_rates(state, variable):
+    """OLS slope per city (units per year) from the regression sums."""
+    n, sx, sy, sxy, sxx, _ = state[f"sums/{variable}"].T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (n * sxy - sx * sy) / (n * sxx - sx * sx)
+
+
+def update_trend_table(state, table):
+    """Refreshes the OLS columns of the whole-period rows of climate_trend_analysis.csv.
+
+    Sen's slope and Mann-Kendall need the whole annual series: they keep the
+    values of the last CreateClimateTrend.py run.
+    """
+    meta = state['meta']
+    table = table.copy()
+    for variable in TREND_COLS:
+        unit = unit_of(variable)
+        for c, (city, rate) in enumerate(zip(meta['cities'], trend_rates(state, variable))):
+            rows = (table['City'] == city) & (table['ParameterMeasuredCustom'] == variable) & \
+                   (table['Window'] == 'full')
+            start_year = day_date(meta['first_day'][c]).year
+            end_year = day_date(meta['last_day'][c]).year
+            years_diff = end_year - start_year
+            table.loc[rows, 'TimeWindowCustom'] = f"{start_year}-{end_year} ({years_diff:.1f} years)"
+            table.loc[rows, 'VariationCustom'] = f"{rate * years_diff:.2f}{unit} (total change)"
+            table.loc[rows, 'RateCustom'] = f"{rate:.4f}{unit}/year"
+    return table
+
+
+# =======================================================
+# 🚀 7. MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Incremental update of anomaly.csv and climate_trend_analysis.csv")
+    parser.add_argument('--init', action='store_true', help="Rebuild the state from the full history")
+    parser.add_argument('--state', default=STATE_FILE, help="State file (.npz)")
+    args = parser.parse_args()
+
+    if args.init or not os.path.exists(args.state):
+        # Tutte le stazioni del registro (lo stato è O(stazioni), non O(giorni))
+        df = load_all()
+        start = time.perf_counter()
+        state = build_state(df)
+        save_state(state, args.state)
+        print(f"✅ State built from {len(df)} observations in {time.perf_counter() - start:.2f}s → {args.state}")
+        return
+
+    state = load_state(args.state)
+    # Solo i giorni dopo l'ultimo aggiornamento della città più indietro
+    df = load_tail(state['meta']['cities'], min(state['meta']['last_day']))
+    start = time.perf_counter()
+    new_rows = update_state(state, df)
+    elapsed = time.perf_counter() - start
+    save_state(state, args.state)
+
+    if len(new_rows):
+        header = not os.path.exists(ANOMALY_OUTPUT)
+        new_rows.to_csv(ANOMALY_OUTPUT, mode='a', header=header, index=False)
+    print(f"✅ {len(new_rows)} new anomalies in {elapsed:.3f}s")
+
+    if os.path.exists(TREND_OUTPUT):
+        table = pd.read_csv(TREND_OUTPUT)
+        if 'Window' in table.columns:
+            update_trend_table(state, table).to_csv(TREND_OUTPUT, index=False)
+            print("✅ Climate trend rates updated.")
+    else:
+        print("⚠️ climate_trend_analysis.csv not found: run CreateClimateTrend.py once first.")
+    if len(new_rows):
+        print(new_rows.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
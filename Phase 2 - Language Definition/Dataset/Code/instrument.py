@@ -0,0 +1,268 @@
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import functools
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from collections import defaultdict
+from paths import output_path
+
+# =======================================================
+# ⏱️ TIMING SPANS OF THE PIPELINE SCRIPTS
+# =======================================================
+# A span measures one step (parsing, grouping, export, one city...):
+#
+#   with span('export', rows=len(df)):
+#       df.to_csv(...)
+#
+#   @traced('season_chunk', rows=len)     # worker of a process pool
+#   def season_chunk(keys): ...
+#
+# Every finished span is one JSON line appended to Output/logs/trace.jsonl
+# (wall seconds, rows, rows/s, peak RSS of the process so far), written
+# with a single O_APPEND write so the workers of a pool can share the file.
+# All the processes of a run (a script, or a whole pipeline.py run) share
+# WEATHER_RUN_ID; at exit a script records a 'script' span (import to exit)
+# and prints the summary of its own spans, and `python instrument.py`
+# summarises a whole run again.
+#
+# Tracing is opt-in: pipeline.py and benchmark_pipeline.py turn it on for
+# their stages, a script run on its own writes nothing.
+#
+# Environment:
+#   WEATHER_TRACE=1         spans written (0 or unset: none)
+#   WEATHER_TRACE_FILE      another JSON-lines file
+#   WEATHER_PROFILE=1       cProfile of the main process, dumped to
+#                           Output/logs/profile/<script>-<pid>.prof (pstats,
+#                           snakeviz); py-spy needs nothing from here:
+#                           py-spy record -o out.svg -- python Create-Season.py
+
+TRACE_ENABLED = os.environ.get('WEATHER_TRACE', '0') not in ('', '0')
+TRACE_FILE = os.environ.get('WEATHER_TRACE_FILE') or os.path.join('logs', 'trace.jsonl')
+PROFILE_ENABLED = os.environ.get('WEATHER_PROFILE', '0') not in ('', '0')
+PROFILE_DIR = os.path.join('logs', 'profile')
+
+SCRIPT = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+# Inherited by the worker processes and by the scripts started by pipeline.py
+os.environ.setdefault('WEATHER_RUN_ID', f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+RUN_ID = os.environ['WEATHER_RUN_ID']
+
+# Open spans of the current thread (pipeline.py runs stages from a thread pool)
+_local = threading.local()
+# pipeline.py prints the summary of the whole run itself
+SUMMARY_AT_EXIT = True
+_START = time.perf_counter()
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _trace_path():
+    return TRACE_FILE if os.path.isabs(TRACE_FILE) else output_path(TRACE_FILE)
+
+
+def peak_rss_mb():
+    """High-water mark of the resident memory of this process (MB)."""
+    # Linux: ru_maxrss also keeps the memory of the parent at exec time
+    # (a script started by pipeline.py would never report less than it)
+    try:
+        with open('/proc/self/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows: no resource module, the peak is unknown
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def emit(record):
+    line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+    fd = os.open(_trace_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+class Span:
+    """A running span: set .rows (or add fields to .extra) before it ends."""
+
+    def __init__(self, name, rows=None, city=None, **extra):
+        self.name = name
+        self.rows = rows
+        self.city = city
+        self.extra = extra
+        self.seconds = None
+
+    def record(self):
+        record = {
+            'run': RUN_ID, 'script': SCRIPT, 'pid': os.getpid(), 'span': self.name,
+            'parent': _stack()[-1].name if _stack() else None,
+            'seconds': round(self.seconds, 4), 'peak_rss_mb': peak_rss_mb(),
+        }
+        if self.city is not None:
+            record['city'] = self.city
+        if self.rows is not None:
+            record['rows'] = int(self.rows)
+            record['rows_per_sec'] = round(self.rows / self.seconds, 1) if self.seconds > 0 else None
+        record.update(self.extra)
+        return record
+
+
+@contextmanager
+def span(name, rows=None, city=None, **extra):
+    """Times the block; yields the Span so that rows can be set inside it."""
+    current = Span(name, rows, city, **extra)
+    start = time.perf_counter()
+    _stack().append(current)
+    try:
+        yield current
+    finally:
+        _stack().pop()
+        current.seconds = time.perf_counter() - start
+        if TRACE_ENABLED:
+            emit(current.record())
+
+
+def _keys_label(keys):
+    keys = list(keys)
+    return keys[0] if len(keys) == 1 else f"{keys[0]}..{keys[-1]} ({len(keys)})" if keys else ''
+
+
+def traced(name=None, rows=None):
+    """Decorator: one span per call. rows(result) gives the rows processed.
+
+    When the first argument is a list of station keys (a chunk worker) the
+    span records them as its city.
+    """
+    def decorate(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            city = None
+            if args and isinstance(args[0], str):
+                city = args[0]
+            elif args and isinstance(args[0], (list, tuple)) and all(isinstance(k, str) for k in args[0]):
+                city = _keys_label(args[0])
+            with span(label, city=city) as current:
+                result = function(*args, **kwargs)
+                if rows is not None and result is not None:
+                    current.rows = rows(result)
+            return result
+        return wrapper
+    return decorate
+
+
+# -----------------------------------------------
+# 📊 SUMMARY
+# -----------------------------------------------
+def read_trace(path=None, run=None, script=None):
+    """Span records of a run (default: the last run in the file), optionally of one script."""
+    path = path or _trace_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if run is None and records:
+        run = records[-1]['run']
+    return [r for r in records if r['run'] == run and (script is None or r['script'] == script)]
+
+
+def summarise(records, by_city=False):
+    """One row per (script, span[, city]): calls, total seconds, rows, rows/s, max peak RSS."""
+    groups = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_rss_mb': 0.0})
+    for r in records:
+        key = (r['script'], r['span']) + ((r.get('city', ''),) if by_city else ())
+        group = groups[key]
+        group['calls'] += 1
+        group['seconds'] += r['seconds']
+        group['rows'] += r.get('rows', 0) or 0
+        group['peak_rss_mb'] = max(group['peak_rss_mb'], r['peak_rss_mb'])
+    rows = []
+    for key, group in groups.items():
+        rows.append(dict(zip(['script', 'span', 'city'], key), **group,
+                         rows_per_sec=round(group['rows'] / group['seconds'], 1)
+                         if group['rows'] and group['seconds'] > 0 else None))
+    return sorted(rows, key=lambda row: -row['seconds'])
+
+
+def print_summary(rows, title):
+    if not rows:
+        return
+    print(f"\n⏱️ {title}")
+    print(f"   {'script':<28} {'span':<36} {'calls':>5} {'seconds':>9} {'rows':>10} {'rows/s':>11} {'peak MB':>8}")
+    for row in rows:
+        name = row['span'] + (f" [{row['city']}]" if row.get('city') else '')
+        rate = f"{row['rows_per_sec']:.0f}" if row['rows_per_sec'] else '-'
+        print(f"   {row['script']:<28} {name:<36} {row['calls']:>5} {row['seconds']:>9.2f} "
+              f"{row['rows'] or '-':>10} {rate:>11} {row['peak_rss_mb']:>8.1f}")
+
+
+def _is_main_process():
+    # Not a worker of a process pool
+    return multiprocessing.parent_process() is None
+
+
+def _script_end():
+    if not _is_main_process():
+        return
+    # Whole script, from the import of this module to the exit
+    script = Span('script')
+    script.seconds = time.perf_counter() - _START
+    emit(script.record())
+    if SUMMARY_AT_EXIT:
+        print_summary(summarise(read_trace(run=RUN_ID, script=SCRIPT)), f"Timing of {SCRIPT} (run {RUN_ID})")
+
+
+def _dump_profile(profiler):
+    if not _is_main_process():
+        return
+    profiler.disable()
+    path = output_path(os.path.join(PROFILE_DIR, f"{os.path.splitext(SCRIPT)[0]}-{os.getpid()}.prof"))
+    profiler.dump_stats(path)
+    print(f"🔬 cProfile → {path}")
+
+
+# Only for scripts (not python -c, the interpreter prompt or this CLI)
+if TRACE_ENABLED and SCRIPT.endswith('.py') and SCRIPT != os.path.basename(__file__):
+    atexit.register(_script_end)
+if PROFILE_ENABLED and SCRIPT != os.path.basename(__file__):
+    import cProfile
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+    atexit.register(_dump_profile, _profiler)
+
+
+# =======================================================
+# ⚙️ COMMAND LINE
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Summary of the timing spans of a run")
+    parser.add_argument('--run', default=None, help="Run id (default: the last run of the trace file)")
+    parser.add_argument('--file', default=None, help="Trace file (default: Output/%s)" % TRACE_FILE)
+    parser.add_argument('--by-city', action='store_true', help="One row per city/chunk as well")
+    args = parser.parse_args()
+
+    records = read_trace(args.file, args.run)
+    if not records:
+        raise SystemExit("❌ No spans recorded")
+    print_summary(summarise(records, args.by_city), f"Run {records[0]['run']}: {len(records)} spans")
+
+
+if __name__ == '__main__':
+    main()
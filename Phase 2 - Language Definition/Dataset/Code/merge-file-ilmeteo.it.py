@@ -1,10 +1,24 @@
 import os
+import re
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+from paths import RAW_DIR, CLEAN_DIR
+from validation import validate_ilmeteo_files, read_report, write_report, print_summary, report_paths, ERROR
+from instrument import span
 
-# Base directory
-base_dir = os.path.expanduser("~/Scaricati/Tenno")
-output_file = os.path.join(base_dir, "Tenno_2000_2025_clean.csv")
+# --- 1. CONFIGURATION ---
+
+OUTPUT_PATTERN = "{city}_2000_2025_clean.csv"
+
+# Manifest with mtime/size/hash of every raw file already merged
+MANIFEST_FILE = os.path.join(CLEAN_DIR, "manifest.json")
+
+FIRST_YEAR = 2000
+LAST_YEAR = 2025
 
 # Month mapping (for sorting)
 months = {
@@ -12,6 +26,7 @@ months = {
     "Maggio": 5, "Giugno": 6, "Luglio": 7, "Agosto": 8,
     "Settembre": 9, "Ottobre": 10, "Novembre": 11, "Dicembre": 12
 }
+month_names = {num: name for name, num in months.items()}
 
 # Columns to keep and rename
 columns_map = {
@@ -27,6 +42,11 @@ columns_map = {
     "FENOMENI": "Phenomena"
 }
 
+numeric_cols = [
+    "MeanTemp", "MinTemperature", "MaxTemperature",
+    "MeanHumidity", "WindSpeed", "WindGusts", "Rainfall"
+]
+
 # Common translation dictionary for Phenomena
 phenomena_translation = {
     "pioggia": "rain",
@@ -42,84 +62,340 @@ phenomena_translation = {
     "coperto": "overcast"
 }
 
-# Funzione per tradurre fenomeni multipli
+# Multi-hot bitmask of the (translated) phenomena: one bit per phenomenon
+PHENOMENA_FLAGS = {
+    "rain": 1,
+    "thunderstorm": 2,
+    "snow": 4,
+    "sleet": 8,
+    "hail": 16,
+    "mist": 32,
+    "fog": 64,
+    "clear": 128,
+    "partly cloudy": 256,
+    "overcast": 512
+}
+
+# Precompiled alternations, longest first so "pioggia temporale" wins over "pioggia"
+PHENOMENA_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(phenomena_translation, key=len, reverse=True)) + r")\b"
+)
+FLAGS_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(PHENOMENA_FLAGS, key=len, reverse=True)) + r")\b"
+)
+
+# Raw numeric columns, parsed straight to float32 by the C parser
+RAW_DTYPES = {raw: "float32" for raw, col in columns_map.items() if col in numeric_cols}
+
+
+# --- 2. CLEANING OF A SINGLE MONTHLY FILE ---
+
+# Funzione per tradurre fenomeni multipli (una sola volta per valore distinto)
 def translate_phenomena(text):
-    if pd.isna(text):
-        return np.nan
-    parts = text.lower().strip().split()
-    translated = []
-    skip_next = False
-    for i, part in enumerate(parts):
-        if skip_next:
-            skip_next = False
+    text = " ".join(text.lower().split())
+    return PHENOMENA_PATTERN.sub(lambda m: phenomena_translation[m.group(1)], text)
+
+
+def phenomena_mask(text):
+    mask = 0
+    for name in FLAGS_PATTERN.findall(text):
+        mask |= PHENOMENA_FLAGS[name]
+    return mask
+
+
+def categorical_lookup(series, function):
+    """Applies function to the distinct values only; returns (codes, one result per category)."""
+    cat = series.astype("category")
+    values = [function(c) for c in cat.cat.categories]
+    return cat.cat.codes.to_numpy(), values
+
+
+def translate_column(series):
+    """Italian phenomena → English categorical column."""
+    codes, values = categorical_lookup(series, translate_phenomena)
+    categories = pd.Index(values).unique()
+    remap = categories.get_indexer(values)
+    codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def phenomena_flags(series):
+    """English phenomena → uint16 multi-hot column (0 when no phenomenon was reported)."""
+    codes, values = categorical_lookup(series, phenomena_mask)
+    masks = np.append(np.array(values, dtype=np.uint16), np.uint16(0))
+    # code -1 (missing) points to the trailing 0
+    return masks[codes]
+
+
+def read_month_file(file_path):
+    """Reads one monthly file. Returns (path, DataFrame or None, error, parse info for the validation)."""
+    try:
+        # C parser: only the mapped columns, comma decimals parsed directly to float32
+        read_args = dict(sep=';', usecols=lambda col: col in columns_map)
+        unparsed = 0
+        try:
+            df = pd.read_csv(file_path, decimal=',', dtype={**RAW_DTYPES, "FENOMENI": str}, **read_args)
+        except ValueError:
+            # Valori non numerici sporadici: lettura come testo e conversione tollerante
+            df = pd.read_csv(file_path, dtype=str, **read_args)
+            for raw in RAW_DTYPES:
+                if raw in df.columns:
+                    values = df[raw].str.replace(",", ".", regex=False)
+                    df[raw] = pd.to_numeric(values, errors="coerce").astype("float32")
+                    # Testo non vuoto diventato NaN: valore scartato (riportato nel controllo qualità)
+                    unparsed += int((df[raw].isna() & values.str.strip().fillna("").ne("")).sum())
+
+        # Ensure all expected columns exist (add missing as empty), keep and rename
+        missing = [col for col in columns_map if col not in df.columns]
+        for col in missing:
+            df[col] = np.float32(np.nan) if col in RAW_DTYPES else np.nan
+        df = df[list(columns_map)].rename(columns=columns_map)
+
+        info = {"missing_columns": [columns_map[col] for col in missing], "unparsed_values": unparsed}
+        return file_path, df, None, info
+
+    except Exception as e:
+        return file_path, None, str(e), None
+
+
+def validate_city(parsed, keep_invalid=False):
+    """Checks the freshly parsed files of a city in one vectorized pass.
+
+    parsed is a list of (file dict, DataFrame, parse info). Returns (quality
+    row per file, DataFrame to merge, keys of the invalid files): the rows of
+    the files that passed (all of them with keep_invalid), implausible values
+    already set to NaN.
+    """
+    batch = pd.concat([df for _, df, _ in parsed], ignore_index=True)
+    groups = np.repeat(np.arange(len(parsed)), [len(df) for _, df, _ in parsed])
+    rows = validate_ilmeteo_files(
+        batch, groups,
+        [f["year"] for f, _, _ in parsed], [f["month"] for f, _, _ in parsed],
+        [info["missing_columns"] for _, _, info in parsed], [info["unparsed_values"] for _, _, info in parsed],
+    )
+    quality = [{"File": f["key"], "City": f["city"], "Year": f["year"], "Month": f["month"], **row}
+               for (f, _, _), row in zip(parsed, rows)]
+    invalid = np.array([row["status"] == ERROR for row in rows])
+    merged = batch if keep_invalid else batch[~invalid[groups]]
+    return quality, merged, {f["key"] for (f, _, _), bad in zip(parsed, invalid) if bad}
+
+
+def clean_frames(frames):
+    """Concatenates the monthly frames of a city and translates the phenomena once."""
+    df = pd.concat(frames, ignore_index=True)
+    # Traduci fenomeni multipli + bitmask rain/snow/fog/...
+    df["Phenomena"] = translate_column(df["Phenomena"])
+    df["PhenomenaFlags"] = phenomena_flags(df["Phenomena"])
+    return df
+
+
+# --- 3. RAW TREE DISCOVERY AND MANIFEST ---
+
+def discover_raw_files(raw_dir, cities=None):
+    """Walks <City>/<Year>/<City>-<Year>-<Mese>.csv and returns one dict per file."""
+    found = []
+    for city in sorted(os.listdir(raw_dir)):
+        city_path = os.path.join(raw_dir, city)
+        if not os.path.isdir(city_path) or (cities and city not in cities):
             continue
-        # Gestione fenomeni composti come "pioggia temporale"
-        if i < len(parts) - 1:
-            combo = f"{part} {parts[i+1]}"
-            if combo in phenomena_translation:
-                translated.append(phenomena_translation[combo])
-                skip_next = True
-                continue
-        # Singolo fenomeno
-        translated.append(phenomena_translation.get(part, part))
-    return " ".join(translated)
-
-# Trova le cartelle annuali
-years = sorted([
-    d for d in os.listdir(base_dir)
-    if d.isdigit() and 2000 <= int(d) <= 2025
-])
-
-all_data = []
-
-for year in years:
-    year_path = os.path.join(base_dir, year)
-    for file in os.listdir(year_path):
-        if file.startswith("Tenno-") and file.endswith(".csv"):
-            month_name = file.split("-")[2].replace(".csv", "").capitalize()
-            month_num = months.get(month_name, 0)
-            if month_num == 0:
+        for year in sorted(os.listdir(city_path)):
+            if not (year.isdigit() and FIRST_YEAR <= int(year) <= LAST_YEAR):
                 continue
+            year_path = os.path.join(city_path, year)
+            for file in sorted(os.listdir(year_path)):
+                if not (file.startswith(f"{city}-") and file.endswith(".csv")):
+                    continue
+                month_name = file[:-len(".csv")].rsplit("-", 1)[-1].capitalize()
+                month_num = months.get(month_name, 0)
+                if month_num == 0:
+                    continue
+                found.append({
+                    "key": f"{city}/{year}/{file}",
+                    "city": city,
+                    "year": int(year),
+                    "month": month_num,
+                    "path": os.path.join(year_path, file)
+                })
+    return found
+
+
+def file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(file_path, previous=None):
+    """mtime/size/sha1 of a file; the hash is reused when mtime and size did not change."""
+    stat = os.stat(file_path)
+    if previous and previous["mtime"] == stat.st_mtime and previous["size"] == stat.st_size:
+        return previous
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "sha1": file_hash(file_path)}
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("files", {})
+
+
+def save_manifest(path, files):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# --- 4. PATCHING OF THE CLEAN OUTPUT ---
+
+def month_key(city, dates):
+    """Source file key (City/Year/City-Year-Mese.csv) of every d/m/yyyy date."""
+    parts = dates.str.split("/", expand=True)
+    month = parts[1].astype(int).map(month_names)
+    year = parts[2]
+    return city + "/" + year + "/" + city + "-" + year + "-" + month + ".csv"
 
-            file_path = os.path.join(year_path, file)
-            print(f"📂 Reading {file_path}")
 
-            try:
-                # Read CSV forcing correct separator
-                df = pd.read_csv(file_path, sep=';', engine='python', dtype=str)
+def read_clean_file(path):
+    # Older clean files were written with ',' instead of ';'
+    with open(path, encoding="utf-8") as f:
+        header = f.readline()
+    sep = ";" if ";" in header else ","
+    dtypes = {col: "float32" for col in numeric_cols}
+    dtypes.update({"Location": str, "Date": str, "Phenomena": "category"})
+    df = pd.read_csv(path, sep=sep, dtype=dtypes)
+    if "PhenomenaFlags" not in df.columns:
+        df["PhenomenaFlags"] = phenomena_flags(df["Phenomena"])
+    return df
 
-                # Fix number of columns if misaligned
-                expected_cols = list(columns_map.keys())
-                df = df.loc[:, df.columns.intersection(expected_cols)]
 
-                # Ensure all expected columns exist (add missing as empty)
-                for col in expected_cols:
-                    if col not in df.columns:
-                        df[col] = np.nan
+def sort_by_date(df):
+    parts = df["Date"].str.split("/", expand=True).astype(int)
+    order = np.lexsort((parts[0].to_numpy(), parts[1].to_numpy(), parts[2].to_numpy()))
+    return df.iloc[order].reset_index(drop=True)
 
-                # Keep and rename
-                df = df[expected_cols].rename(columns=columns_map)
 
-                # Replace commas with dots for numeric columns
-                numeric_cols = [
-                    "MeanTemp", "MinTemperature", "MaxTemperature",
-                    "MeanHumidity", "WindSpeed", "WindGusts", "Rainfall"
-                ]
-                for col in numeric_cols:
-                    df[col] = df[col].astype(str).str.replace(",", ".").replace("nan", np.nan)
+def patch_city(city, output_file, new_frames, stale_keys, full):
+    """Replaces the rows of the stale monthly files and appends the new ones."""
+    frames = []
+    if not full and os.path.exists(output_file):
+        old_df = read_clean_file(output_file)
+        keep = ~month_key(city, old_df["Date"]).isin(stale_keys)
+        frames.append(old_df[keep])
+    if new_frames:
+        frames.append(clean_frames(new_frames))
 
-                # Traduci fenomeni multipli
-                df["Phenomena"] = df["Phenomena"].apply(translate_phenomena)
+    final_df = pd.concat(frames, ignore_index=True)
+    final_df = sort_by_date(final_df)
+    final_df.to_csv(output_file, sep=';', index=False, float_format='%g')
+    return len(final_df)
+
+
+# --- 5. MAIN ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental merge of the ilmeteo.it monthly files")
+    parser.add_argument("--city", action="append", help="Only merge this city (repeatable)")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and rebuild everything")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parser processes")
+    parser.add_argument("--keep-invalid", action="store_true",
+                        help="Merge the files that fail validation instead of keeping their old rows")
+    args = parser.parse_args()
+
+    os.makedirs(CLEAN_DIR, exist_ok=True)
+    manifest = load_manifest(MANIFEST_FILE)
+    if args.full:
+        # Forget only the cities being rebuilt: the others keep their signatures
+        manifest = {key: sig for key, sig in manifest.items()
+                    if args.city and key.split("/")[0] not in args.city}
+    with span("discover") as current:
+        raw_files = discover_raw_files(RAW_DIR, args.city)
+        cities = sorted({f["city"] for f in raw_files})
+
+        # Which files changed since the last run?
+        signatures = {}
+        to_parse = []
+        for f in raw_files:
+            signatures[f["key"]] = file_signature(f["path"], manifest.get(f["key"]))
+            output_file = os.path.join(CLEAN_DIR, OUTPUT_PATTERN.format(city=f["city"]))
+            previous = manifest.get(f["key"])
+            if previous is None or previous["sha1"] != signatures[f["key"]]["sha1"] \
+                    or not os.path.exists(output_file):
+                to_parse.append(f)
+        current.rows = len(raw_files)
+
+    # Files merged in the past but no longer on disk
+    removed = {
+        key for key in manifest
+        if key not in signatures and (not args.city or key.split("/")[0] in args.city)
+    }
+
+    print(f"📂 {len(raw_files)} raw files for {len(cities)} cities, "
+          f"{len(to_parse)} to parse, {len(removed)} removed")
+
+    if not to_parse and not removed:
+        save_manifest(MANIFEST_FILE, {**manifest, **signatures})
+        print("✅ Clean datasets already up to date.")
+        return
+
+    # Parse the changed files in parallel
+    parsed = {}
+    failed = set()
+    quality_rows = []
+    with span("parse", files=len(to_parse)) as current, ProcessPoolExecutor(max_workers=args.workers) as executor:
+        paths = [f["path"] for f in to_parse]
+        for f, (file_path, df, error, info) in zip(to_parse, executor.map(read_month_file, paths, chunksize=16)):
+            if error is not None:
+                print(f"⚠️ Error reading {file_path}: {error}")
+                failed.add(f["key"])
+                quality_rows.append({"File": f["key"], "City": f["city"], "Year": f["year"], "Month": f["month"],
+                                     "read_error": error, "status": ERROR})
+                continue
+            parsed.setdefault(f["city"], []).append((f, df, info))
+        current.rows = sum(len(df) for files in parsed.values() for _, df, _ in files)
+
+    # Validate the new files of each city before they reach the clean dataset
+    new_frames = {}
+    for city, files in parsed.items():
+        with span("validate", city=city, files=len(files)) as current:
+            quality, merged_df, invalid = validate_city(files, args.keep_invalid)
+            current.rows = sum(len(df) for _, df, _ in files)
+        quality_rows.extend(quality)
+        if invalid and not args.keep_invalid:
+            for key in sorted(invalid):
+                print(f"⚠️ Invalid file kept out of the merge: {key}")
+            failed |= invalid
+        new_frames[city] = [merged_df] if len(merged_df) else []
+
+    # Report per file: the rows of the files not parsed this time are kept
+    previous = None if args.full and not args.city else read_report("ilmeteo")
+    _, summary = write_report("ilmeteo", quality_rows, previous, drop_keys=removed)
+    print_summary(summary, report_paths("ilmeteo")[0])
+
+    # Patch only the cities touched by this run
+    affected = sorted({f["city"] for f in to_parse} | {key.split("/")[0] for key in removed})
+    for city in affected:
+        output_file = os.path.join(CLEAN_DIR, OUTPUT_PATTERN.format(city=city))
+        # Rows of files that failed to parse are kept as they were
+        stale_keys = {f["key"] for f in to_parse if f["city"] == city and f["key"] not in failed} | \
+                     {key for key in removed if key.split("/")[0] == city}
+        full = args.full or not os.path.exists(output_file)
+        if not new_frames.get(city) and full:
+            print(f"❌ No valid files found for {city}.")
+            continue
+        with span("patch", city=city) as current:
+            rows = patch_city(city, output_file, new_frames.get(city, []), stale_keys, full)
+            current.rows = rows
+        print(f"✅ Clean dataset updated: {output_file} ({rows} rows)")
 
-                all_data.append(df)
+    # Failed files stay out of the manifest so they are retried next time
+    files = {key: sig for key, sig in {**manifest, **signatures}.items()
+             if key not in removed and key not in failed}
+    save_manifest(MANIFEST_FILE, files)
 
-            except Exception as e:
-                print(f"⚠️ Error reading {file_path}: {e}")
 
-# Merge e export
-if all_data:
-    final_df = pd.concat(all_data, ignore_index=True)
-    final_df.to_csv(output_file, sep=';', index=False)
-    print(f"\n✅ Clean dataset created: {output_file}")
-else:
-    print("❌ No valid files found.")
+if __name__ == "__main__":
+    main()
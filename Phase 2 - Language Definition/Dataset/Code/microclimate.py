@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from openmeteo_loader import FILE_PATTERN, source_path, load_city
+from store import open_store, load_stack
+from seasons import SEASON_NAMES, assign_seasons
+from instrument import traced
+
+# =======================================================
+# 🏞️ MICROCLIMATE OF ONE STATION
+# =======================================================
+# One microclima.csv row per station, computed by the workers of
+# CreateMicroclimate.py one chunk of stations at a time.
+
+## 🏷️ Column Names (from CSV dataset)
+TEMP_MEAN_COL = 'temperature_2m_mean (°C)'
+HUM_MEAN_COL = 'relative_humidity_2m_mean (%)'
+WIND_SPEED_COL = 'wind_speed_10m_mean (km/h)'
+WIND_DIR_COL = 'winddirection_10m_dominant (°)'
+PREC_COL = 'precipitation_sum (mm)' # Not used in final calculations, but kept for completeness
+
+## 🌡️ Classes of microclima.csv: upper bound of the temperature → (MicroClimate, TypeMicroCustom)
+TEMP_CLASSES = [
+    (12, "alpine cold microclimate", "cold"),
+    (18, "cool microclimate", "mild"),
+    (24, "temperate microclimate", "temperate"),
+    (30, "warm microclimate", "warm"),
+    (np.inf, "very warm microclimate", "hot"),
+]
+WIND_CLASSES = [(5, "light winds"), (15, "moderate winds"), (30, "strong winds"), (np.inf, "severe winds")]
+
+## 🪟 Rolling windows: WINDOW_YEARS long, one every WINDOW_STEP years
+WINDOW_YEARS = 10
+WINDOW_STEP = 1
+# A year counts in a window when it has this share of the days of its fullest year (e.g. not the running one)
+MIN_YEAR_COVERAGE = 0.9
+# Pseudo-season of the rows computed over the whole year
+ALL_YEAR = 'Year'
+
+
+def microclimate_row(city, series=None):
+    """Classified microclimate of a station, or None if its file is missing or incomplete.
+
+    series is the daily frame of the station when already loaded (e.g. from the daily store).
+    """
+    file_name = FILE_PATTERN.format(city=city)
+    file_path = source_path(city)
+
+    print(f"\n🔍 Processing: **{city}** (File: {file_name})")
+
+    try:
+        # 1. Reading the typed daily series from the shared cache
+        df = (series if series is not None else load_city(city)).reset_index()
+
+        # 2. Checking for Essential Columns
+        required_cols = [TEMP_MEAN_COL, HUM_MEAN_COL, WIND_SPEED_COL, WIND_DIR_COL]
+        if not all(col in df.columns for col in required_cols):
+            print(f"❌ ERROR in {file_name}: Missing columns. Required: {required_cols}")
+            return None
+
+        # -----------------------------------------------
+        # 🛠️ METEOROLOGICAL CALCULATIONS
+        # -----------------------------------------------
+
+        ### Temperature Range
+        min_temp = df[TEMP_MEAN_COL].min()
+        max_temp = df[TEMP_MEAN_COL].max()
+        temp_range_str = f"{min_temp:.1f}°C - {max_temp:.1f}°C"
+
+        ### Humidity Range
+        min_hum = df[HUM_MEAN_COL].min()
+        max_hum = df[HUM_MEAN_COL].max()
+        hum_range_str = f"{min_hum:.0f}% - {max_hum:.0f}%"
+
+        ### Wind Analysis
+        avg_wind_speed = df[WIND_SPEED_COL].mean()
+        # Calculate dominant direction (mode), use 0 if empty
+        dominant_wind_dir = df[WIND_DIR_COL].mode().iloc[0] if not df[WIND_DIR_COL].mode().empty else 0
+
+        # Wind Strength Classification (Custom Scale)
+        if avg_wind_speed < 5:
+            wind_strength = "light winds"
+        elif avg_wind_speed < 15:
+            wind_strength = "moderate winds"
+        elif avg_wind_speed < 30:
+            wind_strength = "strong winds"
+        else:
+            wind_strength = "severe winds"
+
+        wind_pattern_str = (
+            f"{wind_strength}, avg {avg_wind_speed:.1f} km/h, dominant {dominant_wind_dir:.0f}°"
+        )
+        
+        # -----------------------------------------------
+        # 🌡️ MICROCLIMATE CLASSIFICATION (Based on Maximum Temperature)
+        # -----------------------------------------------
+        if max_temp < 12:
+            microclimate = "alpine cold microclimate"
+            type_micro = "cold"
+        elif max_temp < 18:
+            microclimate = "cool microclimate"
+            type_micro = "mild"
+        elif max_temp < 24:
+            microclimate = "temperate microclimate"
+            type_micro = "temperate"
+        elif max_temp < 30:
+            microclimate = "warm microclimate"
+            type_micro = "warm"
+        else:
+            microclimate = "very warm microclimate"
+            type_micro = "hot"
+
+        # Analysis Period
+        start_year = df['time'].dt.year.min()
+        end_year = df['time'].dt.year.max()
+        analysis_period = f"{start_year}-{end_year}"
+
+        # -----------------------------------------------
+        # 🏗️ CONSTRUCTING THE RESULT ROW
+        # -----------------------------------------------
+        microclima_row = {
+            'City': city,
+            'MicroClimate': f"{microclimate} ({analysis_period})",
+            'TypeMicroCustom': type_micro,
+            'TemperatureRange': temp_range_str,
+            'HumidityRange': hum_range_str,
+            'WindPattern': wind_pattern_str
+        }
+
+        print(f"✅ Data extracted and classified: {microclimate} ({type_micro})")
+        return microclima_row
+
+    except FileNotFoundError:
+        print(f"❌ ERROR: File not found for {city} at path {file_path}")
+    except Exception as e:
+        print(f"❌ Generic ERROR reading/processing {file_name}: {e}")
+    return None
+
+
+@traced(rows=len)
+def microclimate_chunk(keys):
+    """Microclimate rows of a chunk of stations (process pool worker)."""
+    store = open_store(keys)
+    rows = []
+    for city in keys:
+        series = store.frame([city]).drop(columns='City') if store is not None else None
+        row = microclimate_row(city, series)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+# =======================================================
+# 🪟 MICROCLIMATE OVER ROLLING WINDOWS AND SEASONS
+# =======================================================
+# The same descriptors as microclima.csv, for every city, season (and the
+# whole year) and window of WINDOW_YEARS consecutive years:
+#   1. one groupby of the stacked daily frame gives mergeable aggregates per
+#      (City, Season, Year): days, sums, min/max and the sin/cos sums of the
+#      wind direction;
+#   2. they are laid out as a dense (group, year) array and every window is
+#      a sliding_window_view along the years, reduced with nansum/nanmin/nanmax.
+# Years with less than MIN_YEAR_COVERAGE of their days make the window incomplete.
+# The class uses the mean of the yearly maxima of the daily mean temperature,
+# so a single hot day no longer decides it; the dominant direction is the
+# circular mean, with its resultant length as the constancy of the wind.
+
+YEARLY_AGGREGATES = {
+    'days': (TEMP_MEAN_COL, 'count'),
+    'temp_min': (TEMP_MEAN_COL, 'min'),
+    'temp_max': (TEMP_MEAN_COL, 'max'),
+    'hum_min': (HUM_MEAN_COL, 'min'),
+    'hum_max': (HUM_MEAN_COL, 'max'),
+    'wind_sum': (WIND_SPEED_COL, 'sum'),
+    'wind_days': (WIND_SPEED_COL, 'count'),
+    'dir_sin_sum': ('dir_sin', 'sum'),
+    'dir_cos_sum': ('dir_cos', 'sum'),
+    'dir_days': ('dir_sin', 'count'),
+}
+
+
+def yearly_aggregates(df, table=None):
+    """Mergeable aggregates per City, Season and Year of a stacked frame (ALL_YEAR rows included)."""
+    direction = np.deg2rad(df[WIND_DIR_COL].to_numpy(dtype=np.float64))
+    daily = df[[TEMP_MEAN_COL, HUM_MEAN_COL, WIND_SPEED_COL]].astype(np.float64).assign(
+        dir_sin=np.sin(direction), dir_cos=np.cos(direction),
+        City=df['City'].astype(str).to_numpy(), Year=df.index.year,
+        Season=np.asarray(assign_seasons(df.index, table)).astype(object))
+    by_season = daily.groupby(['City', 'Season', 'Year']).agg(**YEARLY_AGGREGATES)
+    by_year = daily.assign(Season=ALL_YEAR).groupby(['City', 'Season', 'Year']).agg(**YEARLY_AGGREGATES)
+    return pd.concat([by_year, by_season]).reset_index()
+
+
+def _classify(values, classes):
+    """Label of the first class whose upper bound is above the value (vectorized)."""
+    bounds = np.array([bound for bound, *_ in classes])
+    return np.searchsorted(bounds, values, side='right').clip(0, len(classes) - 1)
+
+
+def window_microclimate(yearly, window_years=WINDOW_YEARS, step=WINDOW_STEP):
+    """One row per City, Season and window of window_years complete years."""
+    groups = yearly[['City', 'Season']].drop_duplicates().reset_index(drop=True)
+    group_of = pd.MultiIndex.from_frame(groups).get_indexer(pd.MultiIndex.from_frame(yearly[['City', 'Season']]))
+    first_year, last_year = yearly['Year'].min(), yearly['Year'].max()
+    n_years = last_year - first_year + 1
+    if n_years < window_years:
+        return pd.DataFrame()
+    column = yearly['Year'].to_numpy() - first_year
+
+    def dense(name):
+        grid = np.full((len(groups), n_years), np.nan)
+        grid[group_of, column] = yearly[name].to_numpy(dtype=np.float64)
+        # (group, window start, year in window)
+        return sliding_window_view(grid, window_years, axis=1)[:, ::step]
+
+    days = dense('days')
+    fullest = yearly.groupby(group_of)['days'].max().reindex(range(len(groups))).to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Only windows where every year is (almost) complete
+        complete = (np.nan_to_num(days) >= MIN_YEAR_COVERAGE * fullest[:, None, None]).all(axis=2)
+        temp_min = np.nanmin(dense('temp_min'), axis=2)
+        yearly_max = dense('temp_max')
+        temp_max = np.nanmax(yearly_max, axis=2)
+        class_temp = np.nanmean(yearly_max, axis=2)
+        hum_min = np.nanmin(dense('hum_min'), axis=2)
+        hum_max = np.nanmax(dense('hum_max'), axis=2)
+        wind = np.nansum(dense('wind_sum'), axis=2) / np.nansum(dense('wind_days'), axis=2)
+        sin_sum = np.nansum(dense('dir_sin_sum'), axis=2)
+        cos_sum = np.nansum(dense('dir_cos_sum'), axis=2)
+        direction = np.rad2deg(np.arctan2(sin_sum, cos_sum)) % 360
+        constancy = np.hypot(sin_sum, cos_sum) / np.nansum(dense('dir_days'), axis=2)
+
+    group, start = np.nonzero(complete)
+    start_year = first_year + start * step
+    pick = lambda values: values[group, start]
+    temp_class = _classify(pick(class_temp), TEMP_CLASSES)
+    wind_class = _classify(pick(wind), WIND_CLASSES)
+    names = np.array([name for _, name, _ in TEMP_CLASSES], dtype=object)
+    types = np.array([kind for _, _, kind in TEMP_CLASSES], dtype=object)
+    strengths = np.array([name for _, name in WIND_CLASSES], dtype=object)
+    period = pd.Series(start_year).astype(str) + '-' + pd.Series(start_year + window_years - 1).astype(str)
+
+    fmt = lambda template, *columns: [template.format(*values) for values in zip(*columns)]
+    result = pd.DataFrame({
+        'City': groups['City'].to_numpy()[group],
+        'Season': groups['Season'].to_numpy()[group],
+        'StartYear': start_year,
+        'EndYear': start_year + window_years - 1,
+        'MicroClimate': names[temp_class] + ' (' + period.to_numpy(dtype=object) + ')',
+        'TypeMicroCustom': types[temp_class],
+        'TemperatureRange': fmt("{:.1f}°C - {:.1f}°C", pick(temp_min), pick(temp_max)),
+        'HumidityRange': fmt("{:.0f}% - {:.0f}%", pick(hum_min), pick(hum_max)),
+        'WindPattern': fmt("{}, avg {:.1f} km/h, dominant {:.0f}°", strengths[wind_class], pick(wind), pick(direction)),
+        'ClassTemperature': pick(class_temp).round(2),
+        'MeanWindSpeed': pick(wind).round(2),
+        'DominantWindDirection': pick(direction).round(1),
+        'WindConstancy': pick(constancy).round(3),
+        'Days': np.nansum(days, axis=2)[group, start].astype(np.int64),
+    })
+    order = [ALL_YEAR] + SEASON_NAMES
+    result['Season'] = pd.Categorical(result['Season'], categories=order)
+    return result.sort_values(['City', 'Season', 'StartYear'], kind='stable').reset_index(drop=True)
+
+
+@traced(rows=len)
+def window_chunk(keys, window_years=WINDOW_YEARS, step=WINDOW_STEP):
+    """Windowed microclimate rows of a chunk of stations (process pool worker)."""
+    return window_microclimate(yearly_aggregates(load_stack(keys)), window_years, step)
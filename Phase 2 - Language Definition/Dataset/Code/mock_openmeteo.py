@@ -0,0 +1,190 @@
+import os
+import glob
+import json
+import math
+import zlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from paths import API_DIR
+
+# =======================================================
+# 🧪 LOCAL STAND-IN FOR THE OPEN-METEO ARCHIVE API
+# =======================================================
+# Answers GET /v1/archive?latitude=..&longitude=..&start_date=..&end_date=..&daily=..
+# with the JSON layout of the real API (HTTP/1.1 keep-alive), so that
+# openmeteo_download.py can be exercised on a machine without network:
+#   - a point matching the coordinates of one of the canned exports
+#     (open-meteo-*.csv of --canned-dir) gets the days of that file;
+#   - any other point gets a deterministic synthetic series.
+# --fail-every / --close-every inject 503 responses and server-side
+# connection closes to exercise the retries and the reconnections.
+
+CANNED_PATTERN = 'open-meteo-*.csv'
+# Coordinates closer than this (degrees) are the same grid point
+COORD_TOLERANCE = 1e-4
+DATE_FORMAT = '%d/%m/%Y'
+UNITS = {
+    'weather_code': 'wmo code', 'precipitation_sum': 'mm', 'precipitation_hours': 'h',
+    'winddirection_10m_dominant': '°', 'wind_gusts_10m_mean': 'km/h', 'wind_speed_10m_mean': 'km/h',
+}
+
+
+def unit_of(name):
+    if name in UNITS:
+        return UNITS[name]
+    return '%' if name.startswith('relative_humidity') else '°C'
+
+
+def _number(text):
+    if text == '':
+        return None
+    return float(text) if '.' in text else int(text)
+
+
+def load_canned(directory):
+    """[(metadata, {variable: values}, dates)] of every export in the directory."""
+    canned = []
+    for path in sorted(glob.glob(os.path.join(directory, CANNED_PATTERN))):
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        metadata = {name: value for name, value in zip(lines[0].split(','), lines[1].split(',')) if name}
+        header = [column.split(' (')[0] for column in lines[3].split(',')]
+        rows = [line.split(',') for line in lines[4:] if line]
+        dates = [datetime.strptime(row[0], DATE_FORMAT).date() for row in rows]
+        columns = {name: [_number(row[i]) for row in rows] for i, name in enumerate(header) if i > 0}
+        canned.append((metadata, columns, dates))
+    return canned
+
+
+def synthetic_value(name, latitude, longitude, day):
+    """Deterministic plausible value of a variable for a point and day."""
+    seed = zlib.crc32(f"{name}{latitude:.4f}{longitude:.4f}{day.isoformat()}".encode()) / 2 ** 32
+    season = math.cos(2 * math.pi * (day.timetuple().tm_yday - 200) / 365.25)
+    if name.startswith('temperature'):
+        offset = {'temperature_2m_max': 5.0, 'temperature_2m_min': -5.0}.get(name, 0.0)
+        return round(10 + 10 * season + offset + 6 * (seed - 0.5), 1)
+    if name.startswith('relative_humidity'):
+        return int(40 + 50 * seed)
+    if name == 'precipitation_sum':
+        return round(max(0.0, 20 * seed - 12), 2)
+    if name == 'precipitation_hours':
+        return round(max(0.0, 24 * seed - 14), 1)
+    if name == 'weather_code':
+        return [0, 1, 2, 3, 51, 61, 63, 71][int(seed * 8)]
+    if name == 'winddirection_10m_dominant':
+        return int(seed * 360)
+    return round(2 + 15 * seed, 1)
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload, close=False):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if close:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            number = server.requests
+        url = urlsplit(self.path)
+        if url.path != '/v1/archive':
+            return self._send(404, {'error': True, 'reason': f"Unknown path {url.path}"})
+        if server.fail_every and number % server.fail_every == 0:
+            return self._send(503, {'error': True, 'reason': 'Injected failure'})
+        try:
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            latitude, longitude = float(query['latitude']), float(query['longitude'])
+            start = date.fromisoformat(query['start_date'])
+            end = date.fromisoformat(query['end_date'])
+            variables = query['daily'].split(',')
+        except (KeyError, ValueError) as e:
+            return self._send(400, {'error': True, 'reason': f"Bad request: {e}"})
+        close = bool(server.close_every and number % server.close_every == 0)
+        self._send(200, server.respond(latitude, longitude, start, end, variables), close=close)
+
+
+class MockArchiveServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, canned_dir=API_DIR, fail_every=0, close_every=0, quiet=True):
+        super().__init__(address, ArchiveHandler)
+        self.canned = load_canned(canned_dir) if canned_dir else []
+        self.fail_every = fail_every
+        self.close_every = close_every
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def get_request(self):
+        with self.lock:
+            self.connections += 1
+        return super().get_request()
+
+    def respond(self, latitude, longitude, start, end, variables):
+        payload = {'latitude': latitude, 'longitude': longitude, 'elevation': 0.0,
+                   'utc_offset_seconds': 3600, 'timezone': 'Europe/Berlin', 'timezone_abbreviation': 'GMT+1'}
+        for metadata, columns, dates in self.canned:
+            if abs(float(metadata['latitude']) - latitude) < COORD_TOLERANCE \
+                    and abs(float(metadata['longitude']) - longitude) < COORD_TOLERANCE:
+                payload.update({key: _number(value) if key not in ('timezone', 'timezone_abbreviation') else value
+                                for key, value in metadata.items()})
+                keep = [i for i, day in enumerate(dates) if start <= day <= end]
+                daily = {'time': [dates[i].isoformat() for i in keep]}
+                daily.update({name: [columns[name][i] for i in keep] if name in columns else [None] * len(keep)
+                              for name in variables})
+                break
+        else:
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+            daily = {'time': [day.isoformat() for day in days]}
+            daily.update({name: [synthetic_value(name, latitude, longitude, day) for day in days]
+                          for name in variables})
+        payload['daily_units'] = {'time': 'iso8601', **{name: unit_of(name) for name in variables}}
+        payload['daily'] = daily
+        return payload
+
+
+# =======================================================
+# ⚙️ MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Open-Meteo archive API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--canned-dir', default=API_DIR, help="Folder of the open-meteo-*.csv served as canned data")
+    parser.add_argument('--fail-every', type=int, default=0, help="Answer 503 to every N-th request")
+    parser.add_argument('--close-every', type=int, default=0, help="Close the connection after every N-th response")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    server = MockArchiveServer((args.host, args.port), args.canned_dir, args.fail_every, args.close_every,
+                               quiet=not args.verbose)
+    print(f"🧪 Mock archive API on http://{args.host}:{args.port}/v1/archive "
+          f"({len(server.canned)} canned series from {args.canned_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"   {server.requests} requests over {server.connections} connections")
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
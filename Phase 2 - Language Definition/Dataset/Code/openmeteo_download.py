@@ -0,0 +1,373 @@
+import os
+import ssl
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit, urlencode
+from stations import load_registry, data_keys, SERIES_PATTERN
+
+# =======================================================
+# 🌐 OPEN-METEO ARCHIVE DOWNLOADER
+# =======================================================
+# Refreshes Dataset_API/open-meteo-{key}.csv for every station of the
+# registry, asking the archive API only for the days after the last one
+# already in the file (the whole history for a new station).
+#
+#   - asyncio with CONCURRENCY workers, each one keeping its own HTTP/1.1
+#     keep-alive connection, so the TLS handshake is paid once per worker
+#     and not once per station (standard library only, no aiohttp);
+#   - 429 / 5xx / network errors are retried RETRIES times with
+#     exponential backoff and jitter, other 4xx fail the station;
+#   - the new rows are written in the layout of the manual exports (3
+#     metadata rows, d/m/Y dates, same column order and decimals) through
+#     a temporary file, so a failed run never leaves a truncated series.
+#
+# Without network, point --base-url to mock_openmeteo.py:
+#   python mock_openmeteo.py --port 8765 &
+#   python openmeteo_download.py --base-url http://127.0.0.1:8765/v1/archive
+
+BASE_URL = 'https://archive-api.open-meteo.com/v1/archive'
+START_DATE = date(1990, 1, 1)
+# The archive (ERA5) is published with a few days of delay
+ARCHIVE_DELAY_DAYS = 5
+# Same time zone as the manual exports
+TIMEZONE = 'Europe/Berlin'
+
+## 🏷️ Daily variables, in the column order of the manual exports
+DAILY_VARIABLES = [
+    'weather_code',
+    'temperature_2m_max',
+    'temperature_2m_min',
+    'precipitation_sum',
+    'precipitation_hours',
+    'winddirection_10m_dominant',
+    'wind_gusts_10m_mean',
+    'wind_speed_10m_mean',
+    'relative_humidity_2m_max',
+    'relative_humidity_2m_min',
+    'relative_humidity_2m_mean',
+    'temperature_2m_mean',
+]
+# Decimals written for each variable (1 for the others)
+DECIMALS = {
+    'weather_code': 0,
+    'winddirection_10m_dominant': 0,
+    'relative_humidity_2m_max': 0,
+    'relative_humidity_2m_min': 0,
+    'relative_humidity_2m_mean': 0,
+    'precipitation_sum': 2,
+}
+METADATA_FIELDS = ['latitude', 'longitude', 'elevation', 'utc_offset_seconds', 'timezone', 'timezone_abbreviation']
+DATE_FORMAT = '%d/%m/%Y'
+
+## ⚙️ Network
+CONCURRENCY = 4
+RETRIES = 5
+BACKOFF_SECONDS = 1.0
+REQUEST_TIMEOUT = 60.0
+USER_AGENT = 'weather-kg-downloader/1.0'
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:200]!r}")
+        self.status = status
+
+
+def retryable(error):
+    return not isinstance(error, HTTPError) or error.status == 429 or error.status >= 500
+
+
+# -----------------------------------------------
+# 🔌 KEEP-ALIVE HTTP/1.1 CONNECTION
+# -----------------------------------------------
+class KeepAliveConnection:
+    """One persistent HTTP/1.1 connection to a host, reopened when the server closes it."""
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.secure = url.scheme == 'https'
+        self.port = url.port or (443 if self.secure else 80)
+        self.timeout = timeout
+        self.reader = self.writer = None
+        self.opened = 0
+        self.requests = 0
+
+    async def _open(self):
+        context = ssl.create_default_context() if self.secure else None
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=context)
+        self.opened += 1
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+        self.reader = self.writer = None
+
+    async def _read_body(self, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    return b''.join(parts)
+                parts.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+        if 'content-length' in headers:
+            return await self.reader.readexactly(int(headers['content-length']))
+        # No length: the body ends with the connection
+        body = await self.reader.read()
+        headers['connection'] = 'close'
+        return body
+
+    async def _get(self, path):
+        if self.writer is None:
+            await self._open()
+        request = (f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nUser-Agent: {USER_AGENT}\r\n"
+                   f"Accept: application/json\r\nAccept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n")
+        self.writer.write(request.encode('ascii'))
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by the server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await self._read_body(headers)
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        self.requests += 1
+        return status, body
+
+    async def get(self, path):
+        """(status, body) of a GET; a broken connection is closed and the error raised."""
+        try:
+            return await asyncio.wait_for(self._get(path), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+
+# -----------------------------------------------
+# 📄 CSV LAYOUT OF THE MANUAL EXPORTS
+# -----------------------------------------------
+def read_series_state(path):
+    """(metadata dict, column headers, last date) of an existing export, None if there is no file."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        names = f.readline().rstrip('\n').split(',')
+        values = f.readline().rstrip('\n').split(',')
+        f.readline()
+        header = f.readline().rstrip('\n').split(',')
+    # Last line: only the tail of the file is read
+    with open(path, 'rb') as f:
+        f.seek(max(os.path.getsize(path) - 4096, 0))
+        last_line = f.read().rstrip(b'\n').rsplit(b'\n', 1)[-1].decode('utf-8')
+    metadata = {name: value for name, value in zip(names, values) if name}
+    try:
+        last_date = datetime.strptime(last_line.split(',')[0], DATE_FORMAT).date()
+    except ValueError:
+        last_date = None   # only the header
+    return metadata, header, last_date
+
+
+def format_value(value, decimals):
+    if value is None:
+        return ''
+    return f"{value:.{decimals}f}"
+
+
+def series_lines(payload, header):
+    """CSV lines (without the header) of an archive API JSON response, in the column order of header."""
+    daily = payload['daily']
+    columns = []
+    for column in header[1:]:
+        name = column.split(' (')[0]
+        columns.append((daily.get(name, [None] * len(daily['time'])), DECIMALS.get(name, 1)))
+    lines = []
+    for i, day in enumerate(daily['time']):
+        text_date = datetime.strptime(day, '%Y-%m-%d').strftime(DATE_FORMAT)
+        lines.append(','.join([text_date] + [format_value(values[i], decimals) for values, decimals in columns]))
+    return lines
+
+
+def new_file_header(payload):
+    """The 4 header rows of a new export (metadata, blank row, column names) and its column list."""
+    units = payload.get('daily_units', {})
+    header = ['time'] + [f"{name} ({units.get(name, '')})" for name in DAILY_VARIABLES]
+    padding = [''] * (len(header) - len(METADATA_FIELDS))
+    rows = [
+        ','.join(METADATA_FIELDS + padding),
+        ','.join([str(payload.get(field, '')) for field in METADATA_FIELDS] + padding),
+        ',' * (len(header) - 1),
+        ','.join(header),
+    ]
+    return rows, header
+
+
+def write_series(path, lines, header_rows=None):
+    """Appends the lines to the export (or creates it), atomically through a temporary file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+        if header_rows is not None:
+            out.write('\n'.join(header_rows) + '\n')
+        else:
+            with open(path, encoding='utf-8', newline='') as f:
+                existing = f.read()
+            out.write(existing if existing.endswith('\n') else existing + '\n')
+        if lines:
+            out.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+# -----------------------------------------------
+# 📥 ONE STATION
+# -----------------------------------------------
+def plan_station(key, latitude, longitude, end_date, full=False):
+    """Request to make for a station: None when its file is already up to date."""
+    path = SERIES_PATTERN.format(key=key)
+    state = None if full else read_series_state(path)
+    if state is not None:
+        metadata, header, last_date = state
+        # The grid cell of the existing export, so the new days come from the same point
+        latitude = float(metadata.get('latitude', latitude))
+        longitude = float(metadata.get('longitude', longitude))
+        start = last_date + timedelta(days=1) if last_date else START_DATE
+    else:
+        header, start = None, START_DATE
+    if start > end_date:
+        return None
+    return {'key': key, 'path': path, 'latitude': latitude, 'longitude': longitude,
+            'start': start, 'end': end_date, 'header': header}
+
+
+def request_path(base_url, job):
+    query = urlencode({
+        'latitude': job['latitude'],
+        'longitude': job['longitude'],
+        'start_date': job['start'].isoformat(),
+        'end_date': job['end'].isoformat(),
+        'daily': ','.join(DAILY_VARIABLES),
+        'timezone': TIMEZONE,
+    })
+    return f"{urlsplit(base_url).path}?{query}"
+
+
+async def fetch_json(connection, path, stats, retries=RETRIES, backoff=BACKOFF_SECONDS):
+    """GET with retries: exponential backoff with jitter on 429, 5xx and network errors."""
+    for attempt in range(retries + 1):
+        try:
+            status, body = await connection.get(path)
+            if status != 200:
+                raise HTTPError(status, body)
+            return json.loads(body)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, HTTPError) as error:
+            if attempt == retries or not retryable(error):
+                raise
+            stats['retries'] += 1
+            await asyncio.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+async def download_station(connection, base_url, job, stats):
+    payload = await fetch_json(connection, request_path(base_url, job), stats)
+    if job['header'] is None:
+        header_rows, header = new_file_header(payload)
+    else:
+        header_rows, header = None, job['header']
+    lines = series_lines(payload, header)
+    write_series(job['path'], lines, header_rows)
+    stats['rows'] += len(lines)
+    return len(lines)
+
+
+async def worker(queue, base_url, results, stats):
+    connection = KeepAliveConnection(base_url)
+    try:
+        while True:
+            job = await queue.get()
+            if job is None:
+                break
+            try:
+                rows = await download_station(connection, base_url, job, stats)
+                results[job['key']] = f"+{rows} days ({job['start']} → {job['end']})"
+            except Exception as e:
+                results[job['key']] = f"❌ {e}"
+                stats['failed'] += 1
+    finally:
+        stats['connections'] += connection.opened
+        stats['requests'] += connection.requests
+        await connection.close()
+
+
+async def download_all(jobs, base_url=BASE_URL, concurrency=CONCURRENCY):
+    """Runs the jobs with `concurrency` workers; returns ({key: outcome}, stats)."""
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    workers = max(1, min(concurrency, len(jobs)))
+    for _ in range(workers):
+        queue.put_nowait(None)
+    results = {}
+    stats = {'rows': 0, 'retries': 0, 'failed': 0, 'connections': 0, 'requests': 0}
+    await asyncio.gather(*(worker(queue, base_url, results, stats) for _ in range(workers)))
+    return results, stats
+
+
+# =======================================================
+# ⚙️ MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Downloads the new days of the Open-Meteo daily series of the stations")
+    parser.add_argument('--station', action='append', help="Only these station keys (repeatable)")
+    parser.add_argument('--existing', action='store_true', help="Only the stations that already have a series")
+    parser.add_argument('--end', default=None, help="Last day to download (default: today - %d days)" % ARCHIVE_DELAY_DAYS)
+    parser.add_argument('--full', action='store_true', help="Download the whole history again")
+    parser.add_argument('--base-url', default=BASE_URL, help="Archive API endpoint (e.g. the mock server)")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Parallel connections")
+    args = parser.parse_args()
+
+    registry = load_registry().dropna(subset=['latitude', 'longitude'])
+    keys = args.station or (data_keys(registry) if args.existing else list(registry['key']))
+    by_key = registry.reset_index().set_index('key')
+    unknown = [key for key in keys if key not in by_key.index]
+    if unknown:
+        raise SystemExit(f"❌ Unknown stations: {unknown}")
+    end_date = date.fromisoformat(args.end) if args.end else date.today() - timedelta(days=ARCHIVE_DELAY_DAYS)
+
+    jobs = []
+    for key in keys:
+        station = by_key.loc[key]
+        job = plan_station(key, station['latitude'], station['longitude'], end_date, args.full)
+        if job is not None:
+            jobs.append(job)
+    print(f"🌐 {len(keys)} stations, {len(jobs)} to update up to {end_date} from {args.base_url}")
+    if not jobs:
+        print("✅ All series already up to date.")
+        return
+
+    start = time.perf_counter()
+    results, stats = asyncio.run(download_all(jobs, args.base_url, args.concurrency))
+    for key, outcome in results.items():
+        print(f"   {key}: {outcome}")
+    print(f"✅ {stats['rows']} new days for {len(jobs) - stats['failed']} stations in {time.perf_counter() - start:.2f}s "
+          f"({stats['requests']} requests over {stats['connections']} connections, {stats['retries']} retries)")
+    if stats['failed']:
+        raise SystemExit(f"❌ {stats['failed']} stations failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import os
+import json
+import tempfile
+import pandas as pd
+import numpy as np
+from paths import API_DIR
+from stations import data_keys
+from instrument import span
+
+# Parquet needs pyarrow: without it the cache falls back to pickle files
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+# =======================================================
+# 📝 1. CONFIGURATION
+# =======================================================
+## 🏙️ Paths (the stations to load come from the registry of stations.py)
+BASE_PATH = API_DIR
+FILE_PATTERN = 'open-meteo-{city}.csv'
+
+## 💾 Typed cache (one file per city, rebuilt when the source CSV changes)
+# Each cached series has a {name}.json sidecar with the signature of its source:
+# no shared index, so stages loading the same cities in parallel never conflict
+CACHE_DIR = os.path.join(BASE_PATH, 'cache')
+
+## 🏷️ Column Names and Types (from the Open-Meteo CSV export)
+TIME_COL = 'time'
+WEATHER_CODE_COL = 'weather_code (wmo code)'
+MEASURE_COLS = [
+    'temperature_2m_max (°C)',
+    'temperature_2m_min (°C)',
+    'precipitation_sum (mm)',
+    'precipitation_hours (h)',
+    'winddirection_10m_dominant (°)',
+    'wind_gusts_10m_mean (km/h)',
+    'wind_speed_10m_mean (km/h)',
+    'relative_humidity_2m_max (%)',
+    'relative_humidity_2m_min (%)',
+    'relative_humidity_2m_mean (%)',
+    'temperature_2m_mean (°C)',
+]
+DTYPES = {col: np.float32 for col in MEASURE_COLS}
+DTYPES[WEATHER_CODE_COL] = np.int16
+
+
+# -----------------------------------------------
+# 📥 PARSING OF THE ORIGINAL CSV
+# -----------------------------------------------
+def read_openmeteo_csv(file_path):
+    """Parses one open-meteo-{city}.csv file into a typed DataFrame indexed by date."""
+    name = os.path.basename(file_path)
+    with span('parse_csv', city=name) as current:
+        # The first 3 rows hold the location metadata
+        df = pd.read_csv(file_path, skiprows=3, dtype=DTYPES)
+        current.rows = len(df)
+    with span('parse_dates', rows=len(df), city=name):
+        # Explicit day-first format: much faster than letting pandas infer it
+        df[TIME_COL] = pd.to_datetime(df[TIME_COL], format='%d/%m/%Y')
+    return df.set_index(TIME_COL)
+
+
+# -----------------------------------------------
+# 💾 CACHE HANDLING
+# -----------------------------------------------
+def _cache_path(city):
+    extension = 'parquet' if CACHE_FORMAT == 'parquet' else 'pkl'
+    return os.path.join(CACHE_DIR, f"open-meteo-{city}.{extension}")
+
+
+def _signature_path(city):
+    return os.path.join(CACHE_DIR, f"open-meteo-{city}.json")
+
+
+def _read_signature(city):
+    try:
+        with open(_signature_path(city), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _replace_atomically(path, write):
+    """Writes through a unique temporary file of the cache folder, then renames it onto path."""
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix='.tmp-')
+    os.close(fd)
+    # mkstemp creates the file for the owner only: the cache is as readable as the CSV files
+    os.chmod(tmp_path, 0o644)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_signature(city, signature):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(signature, f)
+    _replace_atomically(_signature_path(city), write)
+
+
+def source_path(city):
+    return os.path.join(BASE_PATH, FILE_PATTERN.format(city=city))
+
+
+def load_city(city, use_cache=True):
+    """Daily Open-Meteo series of a city, read from the typed cache when it is up to date."""
+    file_path = source_path(city)
+    stat = os.stat(file_path)
+    signature = [stat.st_mtime_ns, stat.st_size, CACHE_FORMAT]
+    cache_path = _cache_path(city)
+
+    if use_cache and _read_signature(city) == signature and os.path.exists(cache_path):
+        if CACHE_FORMAT == 'parquet':
+            return pd.read_parquet(cache_path)
+        return pd.read_pickle(cache_path)
+
+    df = read_openmeteo_csv(file_path)
+
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Data first, then its signature: a reader never trusts a half-written file
+        _replace_atomically(cache_path, df.to_parquet if CACHE_FORMAT == 'parquet' else df.to_pickle)
+        _write_signature(city, signature)
+
+    return df
+
+
+def load_all(cities=None, use_cache=True):
+    """All stations (or the given keys) stacked in one frame, with City as a categorical column."""
+    cities = list(cities or data_keys())
+    frames = []
+    for city in cities:
+        df = load_city(city, use_cache=use_cache)
+        df.insert(0, 'City', pd.Categorical([city] * len(df), categories=cities))
+        frames.append(df)
+    return pd.concat(frames)
+
+
+def load_available(cities):
+    """Like load_all, but skips the unreadable files: (frame or None, one info dict per city)."""
+    frames = []
+    files_info = []   # file name + full path of every city
+    for city in cities:
+        try:
+            df = load_city(city)
+            df.insert(0, 'City', city)
+            frames.append(df)
+            loaded = True
+        except Exception as e:
+            print(f"⚠️ ERROR reading '{FILE_PATTERN.format(city=city)}': {e}")
+            loaded = False
+        files_info.append({
+            "City": city,
+            "FileName": FILE_PATTERN.format(city=city),
+            "FilePath": source_path(city),
+            "Loaded": loaded
+        })
+    if not frames:
+        return None, files_info
+    df = pd.concat(frames)
+    df['City'] = pd.Categorical(df['City'], categories=[f["City"] for f in files_info if f["Loaded"]])
+    return df, files_info
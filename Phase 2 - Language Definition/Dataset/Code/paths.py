@@ -0,0 +1,36 @@
+import os
+
+# =======================================================
+# 📁 SHARED PATHS OF THE PIPELINE
+# =======================================================
+# Every script resolves its folders from here instead of hard-coding
+# /home/... paths. The defaults point to the Dataset folder next to this
+# Code folder; WEATHER_DATASET_DIR / WEATHER_OUTPUT_DIR override them
+# (used by the pipeline runner and the benchmarks).
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Root of the repository (Phase 4 KG, Evaluation queries): always next to this
+# code, whatever dataset copy WEATHER_DATASET_DIR points to
+PROJECT_DIR = os.path.abspath(os.path.join(CODE_DIR, '..', '..', '..'))
+
+DATASET_DIR = os.path.abspath(
+    os.environ.get('WEATHER_DATASET_DIR', os.path.join(CODE_DIR, '..'))
+)
+
+## 📥 Sources
+API_DIR = os.path.join(DATASET_DIR, 'Dataset_API')
+RAW_DIR = os.path.join(DATASET_DIR, 'Dataset_Raw_ilmeteo.it')
+CLEAN_DIR = os.path.join(DATASET_DIR, 'Dataset_Clean_ilmeteo.it')
+
+## 📤 Generated files (season.csv, microclima.csv, WeatherReport.csv, ...)
+OUTPUT_DIR = os.path.abspath(
+    os.environ.get('WEATHER_OUTPUT_DIR', os.path.join(DATASET_DIR, 'Output'))
+)
+
+
+def output_path(file_name):
+    """Path of a generated file, creating its folder if needed."""
+    path = os.path.join(OUTPUT_DIR, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,370 @@
+import os
+import sys
+import ast
+import glob
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Spans of the pipeline and of every stage it starts (WEATHER_TRACE=0 turns them off);
+# set before instrument is imported, the stages inherit it from the environment
+os.environ.setdefault('WEATHER_TRACE', '1')
+
+from paths import CODE_DIR, DATASET_DIR, API_DIR, RAW_DIR, CLEAN_DIR, OUTPUT_DIR, output_path
+from ttl_export import TABLES as TTL_TABLES
+import instrument
+from instrument import span, read_trace, summarise, print_summary
+
+# The scripts print their own timing; the pipeline prints the whole run at the end
+instrument.SUMMARY_AT_EXIT = False
+
+# =======================================================
+# 📝 1. PIPELINE DEFINITION
+# =======================================================
+# Each stage is one of the scripts of this folder. A stage depends on the
+# stages that produce its inputs, so independent branches (the ilmeteo.it
+# merge, the WeatherReport chain and the four KG tables) run in parallel.
+#
+#   validation.py (quality report of the Open-Meteo series; the merge checks the ilmeteo.it files)
+#   merge-file-ilmeteo.it → store (memory-mapped daily arrays) → reconcile | pyramid (day → decade aggregates)
+#   Create-WeatherReport (one streaming pass: WeatherReport, _ISO, _Station, Minimum)
+#   Create-Season | CreateMicroclimate | CreateClimateTrend | Create-Anomaly
+#   ttl_export.py <table> after each of the tables above
+#
+# A stage is skipped when the hash of its scripts and input files is the
+# same as in the last successful run and all of its outputs still exist.
+# The scripts of a stage are its own file plus the modules of this folder it
+# imports, directly or through other modules (see local_imports).
+
+# The station registry decides which series every stage processes
+STATION_FILE = os.path.join(DATASET_DIR, 'WeatherStation.csv')
+CITY_FILE = os.path.join(DATASET_DIR, 'City.csv')
+
+OPEN_METEO_FILES = os.path.join(API_DIR, 'open-meteo-*.csv')
+CLEAN_FILES = os.path.join(CLEAN_DIR, '*_2000_2025_clean.csv')
+
+# Memory-mapped daily store read by the analysis stages (store.py)
+STORE_HEADER = output_path(os.path.join('store', 'store.json'))
+
+STAGES = {
+    'ilmeteo_merge': {
+        'script': 'merge-file-ilmeteo.it.py',
+        'inputs': [os.path.join(RAW_DIR, '*', '*', '*.csv')],
+        # The quality report of the parsed files (Output/quality) is written along the way
+        'outputs': [CLEAN_FILES],
+    },
+    'openmeteo_quality': {
+        'script': 'validation.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE],
+        'outputs': [output_path(os.path.join('quality', 'openmeteo_summary.json'))],
+    },
+    'daily_store': {
+        'script': 'store.py',
+        'inputs': [OPEN_METEO_FILES, CLEAN_FILES, STATION_FILE],
+        'outputs': [STORE_HEADER],
+    },
+    'weather_report': {
+        'script': 'Create-WeatherReport.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE, CITY_FILE],
+        'outputs': [output_path('WeatherReport.csv'), output_path('WeatherReport_ISO.csv'),
+                    output_path('WeatherReport_Station.csv'), output_path('WeatherReportMinimum.csv')],
+    },
+    'season': {
+        'script': 'Create-Season.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE, STORE_HEADER],
+        'outputs': [output_path('season.csv')],
+    },
+    'microclimate': {
+        'script': 'CreateMicroclimate.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE, STORE_HEADER],
+        'outputs': [output_path('microclima.csv'), output_path('microclima_windows.csv')],
+    },
+    'climate_trend': {
+        'script': 'CreateClimateTrend.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE, STORE_HEADER],
+        'outputs': [output_path('climate_trend_analysis.csv')],
+    },
+    'anomaly': {
+        'script': 'Create-Anomaly.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE, STORE_HEADER],
+        'outputs': [output_path('anomaly.csv')],
+    },
+    'rollups': {
+        'script': 'rollups.py',
+        'inputs': [OPEN_METEO_FILES, STATION_FILE, STORE_HEADER],
+        'outputs': [output_path(os.path.join('rollups', 'rollup_year.csv'))],
+    },
+    'pyramid': {
+        'script': 'pyramid.py',
+        'inputs': [STORE_HEADER],
+        'outputs': [output_path(os.path.join('pyramid', 'pyramid.json'))],
+    },
+    'reconcile': {
+        'script': 'reconcile.py',
+        'inputs': [OPEN_METEO_FILES, CLEAN_FILES, STATION_FILE, STORE_HEADER],
+        'outputs': [output_path('reconciled.csv'), output_path('reconciled_bias.csv')],
+    },
+}
+
+# RDF export of every KG table (WeatherReport is gzip-compressed, it is by far the largest)
+TTL_EXPORTS = {
+    'season': [],
+    'microclimate': [],
+    'climatetrend': [],
+    'anomaly': [],
+    'weatherreport': ['--gzip'],
+    'city': [],
+    'weatherstation': [],
+}
+for _table, _options in TTL_EXPORTS.items():
+    _extension = '.ttl.gz' if '--gzip' in _options else '.ttl'
+    STAGES[f"ttl_{_table}"] = {
+        'script': 'ttl_export.py',
+        'args': [_table] + _options,
+        'inputs': [TTL_TABLES[_table]['input']],
+        'outputs': [output_path(os.path.join('ttl', _table + _extension))],
+    }
+
+
+
+def local_imports(script, code_dir=CODE_DIR):
+    """Modules of code_dir imported by script, directly or through the modules it imports."""
+    found, pending = set(), [script]
+    while pending:
+        with open(os.path.join(code_dir, pending.pop()), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                file_name = name.split('.')[0] + '.py'
+                if file_name not in found and file_name != script \
+                        and os.path.exists(os.path.join(code_dir, file_name)):
+                    found.add(file_name)
+                    pending.append(file_name)
+    return sorted(found)
+
+
+for _stage in STAGES.values():
+    _stage['code'] = local_imports(_stage['script'])
+
+STATE_FILE = output_path('pipeline_state.json')
+LOG_DIR = os.path.join(OUTPUT_DIR, 'logs')
+
+
+# =======================================================
+# 🔗 2. DEPENDENCY GRAPH
+# =======================================================
+def stage_dependencies(stages):
+    """A stage depends on every stage that writes one of its input files."""
+    producers = {}
+    for name, stage in stages.items():
+        for pattern in stage['outputs']:
+            producers[pattern] = name
+    deps = {}
+    for name, stage in stages.items():
+        deps[name] = {producers[p] for p in stage['inputs'] if p in producers and producers[p] != name}
+    return deps
+
+
+def topological_order(deps):
+    order, done = [], set()
+    while len(order) < len(deps):
+        ready = sorted(n for n in deps if n not in done and deps[n] <= done)
+        if not ready:
+            raise ValueError(f"Cycle in the pipeline stages: {sorted(set(deps) - done)}")
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+def with_dependents(deps, selected):
+    """The selected stages plus everything downstream of them."""
+    result = set(selected)
+    changed = True
+    while changed:
+        changed = False
+        for name, parents in deps.items():
+            if name not in result and parents & result:
+                result.add(name)
+                changed = True
+    return result
+
+
+# =======================================================
+# #️⃣ 3. CONTENT HASHES
+# =======================================================
+def file_hash(file_path, cache):
+    """sha1 of a file, reusing the cached value when mtime and size did not change."""
+    stat = os.stat(file_path)
+    cached = cache.get(file_path)
+    if cached and cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size:
+        return cached['sha1']
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    cache[file_path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': digest.hexdigest()}
+    return cache[file_path]['sha1']
+
+
+def stage_hash(stage, cache):
+    """Hash of the stage scripts and of all its input files (None if an input is missing)."""
+    digest = hashlib.sha1()
+    code_files = [stage['script']] + stage['code']
+    for name in code_files:
+        digest.update(name.encode())
+        digest.update(file_hash(os.path.join(CODE_DIR, name), cache).encode())
+    digest.update(' '.join(stage.get('args', [])).encode())
+    for pattern in stage['inputs']:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            return None
+        for file_path in matches:
+            digest.update(file_path.encode())
+            digest.update(file_hash(file_path, cache).encode())
+    return digest.hexdigest()
+
+
+def outputs_exist(stage):
+    return all(glob.glob(pattern) for pattern in stage['outputs'])
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {'stages': {}, 'files': {}}
+    with open(STATE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, STATE_FILE)
+
+
+# =======================================================
+# ⚙️ 4. EXECUTION
+# =======================================================
+def run_stage(name, stage, env=None):
+    """Runs one script in its own process; stdout/stderr go to logs/<stage>.log."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f"{name}.log")
+    start = time.perf_counter()
+    with span(f"stage {name}") as current, open(log_path, 'w', encoding='utf-8') as log:
+        result = subprocess.run(
+            [sys.executable, os.path.join(CODE_DIR, stage['script'])] + stage.get('args', []),
+            cwd=OUTPUT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        current.extra['returncode'] = result.returncode
+    return result.returncode, time.perf_counter() - start, log_path
+
+
+def run_pipeline(stages=STAGES, only=None, force=False, workers=None, dry_run=False):
+    deps = stage_dependencies(stages)
+    order = topological_order(deps)
+    selected = with_dependents(deps, only) if only else set(order)
+
+    state = load_state()
+    hash_cache = state.get('files', {})
+    status = {}          # name -> 'ran' | 'skipped' | 'failed' | 'blocked'
+    running = {}
+
+    # Stages run side by side: each one shares the CPUs among its station workers
+    workers = workers or os.cpu_count()
+    env = dict(os.environ)
+    env.setdefault('WEATHER_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+
+    def ready(name):
+        return name not in status and name not in running.values() and all(d in status for d in deps[name])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(status) < len(order):
+            for name in order:
+                if not ready(name):
+                    continue
+                stage = stages[name]
+                if any(status[d] in ('failed', 'blocked') for d in deps[name]):
+                    status[name] = 'blocked'
+                    print(f"⛔ {name}: skipped, an upstream stage failed")
+                    continue
+
+                # Inputs are hashed only now, after the upstream stages wrote them
+                current = stage_hash(stage, hash_cache)
+                previous = state['stages'].get(name, {}).get('hash')
+                up_to_date = current is not None and current == previous and outputs_exist(stage)
+                if name not in selected or (up_to_date and not force):
+                    status[name] = 'skipped'
+                    print(f"⏭️  {name}: up to date")
+                    continue
+                if current is None:
+                    status[name] = 'failed'
+                    print(f"❌ {name}: missing input files {stage['inputs']}")
+                    continue
+                command = ' '.join([stage['script']] + stage.get('args', []))
+                if dry_run:
+                    status[name] = 'ran'
+                    print(f"📝 {name}: would run {command}")
+                    continue
+
+                print(f"🚀 {name}: running {command}")
+                running[executor.submit(run_stage, name, stage, env)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                returncode, elapsed, log_path = future.result()
+                if returncode == 0:
+                    status[name] = 'ran'
+                    # Hash again: the stage may have rewritten files it also reads
+                    state['stages'][name] = {'hash': stage_hash(stages[name], hash_cache),
+                                             'seconds': round(elapsed, 2)}
+                    print(f"✅ {name}: done in {elapsed:.1f}s")
+                else:
+                    status[name] = 'failed'
+                    state['stages'].pop(name, None)
+                    print(f"❌ {name}: failed (exit {returncode}), see {log_path}")
+
+    if not dry_run:
+        state['files'] = hash_cache
+        save_state(state)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the KG build scripts as a dependency-aware pipeline")
+    parser.add_argument('--only', action='append', choices=sorted(STAGES),
+                        help="Run this stage (and what depends on it) only; repeatable")
+    parser.add_argument('--force', action='store_true', help="Rerun the stages even if up to date")
+    parser.add_argument('--workers', type=int, default=None, help="Stages run at the same time")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what would run")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    status = run_pipeline(only=args.only, force=args.force, workers=args.workers, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 55)
+    for outcome in ('ran', 'skipped', 'failed', 'blocked'):
+        names = [n for n, s in status.items() if s == outcome]
+        if names:
+            print(f"   {outcome:<8} {', '.join(names)}")
+    print(f"   Total time: {elapsed:.1f}s")
+    print("=" * 55)
+    # Spans of this run, from every stage script and its workers
+    print_summary(summarise(read_trace(run=instrument.RUN_ID)), f"Timing of run {instrument.RUN_ID}")
+    sys.exit(1 if any(s in ('failed', 'blocked') for s in status.values()) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from store import STORE_DIR, HEADER_FILE as STORE_HEADER_FILE, DailyStore, open_store, _signature
+from paths import output_path
+from instrument import span
+
+# =======================================================
+# 🔺 MULTI-RESOLUTION TEMPORAL PYRAMID
+# =======================================================
+# Every daily series of the store (Open-Meteo and ilmeteo.it, every station)
+# is summarised at five resolutions:
+#
+#   day → month → season → year → decade
+#
+# Each node keeps mergeable aggregates (count, sum, sum of squares, min,
+# max), and each level is derived from the one below: months from days,
+# meteorological seasons (DJF, MAM, JJA, SON) and years from months,
+# decades from years. Every node is a contiguous interval of days, so a
+# time range is answered by covering it greedily with the coarsest nodes
+# that fit (a 30-year range is a few decades, years and months plus the
+# odd days at the edges) instead of scanning its ~11000 days.
+#
+#   pyramid/pyramid.json          stations, variables, levels, horizon
+#   pyramid/day/value.f32         [variable][station][day]
+#   pyramid/month/count.i32       [variable][station][month]
+#   pyramid/month/sum.f64 ...     (sumsq.f64, min.f32, max.f32; same for season, year, decade)
+#
+# The levels reach the end of the decade of the last observation, so a new
+# day is merged in place (add_days: O(levels) per value); a corrected day
+# recomputes only its own path up the pyramid (add_day).
+#
+#   python pyramid.py                                     # build from the daily store
+#   python pyramid.py --update                            # merge the days the store gained or changed since
+#   python pyramid.py --variable openmeteo/precipitation_sum --start 1995-03-10 --end 2024-11-20
+
+PYRAMID_DIR = output_path('pyramid')
+HEADER_FILE = 'pyramid.json'
+FORMAT_VERSION = 1
+
+LEVELS = ['day', 'month', 'season', 'year', 'decade']
+# Level each one is derived from
+PARENT = {'month': 'day', 'season': 'month', 'year': 'month', 'decade': 'year'}
+# Meteorological season starting in each month of a season (December belongs to the next winter)
+SEASON_OF_MONTH = {12: 'Winter', 3: 'Spring', 6: 'Summer', 9: 'Autumn'}
+
+## 🧮 Mergeable aggregates: file extension and how two nodes combine
+AGGREGATES = {
+    'count': (np.int32, 'i32'),
+    'sum': (np.float64, 'f64'),
+    'sumsq': (np.float64, 'f64'),
+    'min': (np.float32, 'f32'),
+    'max': (np.float32, 'f32'),
+}
+MERGE = {'count': np.add, 'sum': np.add, 'sumsq': np.add, 'min': np.fmin, 'max': np.fmax}
+
+
+# -----------------------------------------------
+# 📅 NODE BOUNDARIES
+# -----------------------------------------------
+def horizon_years(epoch, last_day):
+    """Number of years from the epoch to the end of the decade of the last day."""
+    years = last_day.year - epoch.year + 1
+    return int(np.ceil(years / 10) * 10)
+
+
+def level_bounds(epoch, n_years):
+    """{level: (first day, last day)} of every node, as day offsets from the epoch (inclusive)."""
+    n_months = n_years * 12
+    # Month starts from the December before the epoch to the March after the horizon:
+    # starts[i + 1] is the first day of month i
+    starts = (pd.date_range(epoch - pd.DateOffset(months=1), periods=n_months + 4, freq='MS') - epoch).days.to_numpy()
+    n_days = int(starts[n_months + 1])
+    return {
+        'day': (np.arange(n_days), np.arange(n_days)),
+        'month': (starts[1:n_months + 1], starts[2:n_months + 2] - 1),
+        # Season k runs over months 3k-1 .. 3k+1: the first one starts in the December before the epoch
+        'season': (starts[0:n_months + 1:3], starts[3:n_months + 4:3] - 1),
+        'year': (starts[1:n_months + 1:12], starts[13:n_months + 2:12] - 1),
+        'decade': (starts[1:n_months + 1:120], starts[121:n_months + 2:120] - 1),
+    }
+
+
+def node_index(level, dates, epoch):
+    """Node of each date at a level (pure arithmetic on year and month)."""
+    dates = pd.DatetimeIndex(np.atleast_1d(dates))
+    if level == 'day':
+        return (dates - epoch).days.to_numpy()
+    month = (dates.year.to_numpy() - epoch.year) * 12 + dates.month.to_numpy() - 1
+    if level == 'month':
+        return month
+    if level == 'season':
+        return (month + 1) // 3
+    year = dates.year.to_numpy() - epoch.year
+    return year if level == 'year' else year // 10
+
+
+def _reduce(child, starts):
+    """Aggregates of the nodes of a level from those of the level below (reduceat over node starts)."""
+    return {name: MERGE[name].reduceat(values, starts, axis=-1).astype(AGGREGATES[name][0])
+            for name, values in child.items()}
+
+
+def _day_aggregates(values):
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0).astype(np.float64)
+    return {'count': valid.astype(np.int32), 'sum': filled, 'sumsq': filled * filled,
+            'min': values, 'max': values}
+
+
+def _child_starts(level, bounds):
+    """Index of the first child of every node (the first season starts before the first month)."""
+    return np.searchsorted(bounds[PARENT[level]][0], np.maximum(bounds[level][0], 0))
+
+
+# -----------------------------------------------
+# ✍️ WRITER
+# -----------------------------------------------
+def build_pyramid(store=None, pyramid_dir=PYRAMID_DIR):
+    """Writes every level of every variable of the store; returns the header."""
+    store = store or DailyStore()
+    epoch = store.epoch
+    observed_last = store.dates[-1]
+    n_years = horizon_years(epoch, observed_last)
+    bounds = level_bounds(epoch, n_years)
+    names = list(store.variables)
+    n_vars, n_stations = len(names), len(store.stations)
+    shapes = {level: (n_vars, n_stations, len(bounds[level][0])) for level in LEVELS}
+
+    files, paths = {}, []
+    for level in LEVELS:
+        os.makedirs(os.path.join(pyramid_dir, level), exist_ok=True)
+        for name in (['value'] if level == 'day' else AGGREGATES):
+            dtype, extension = (np.float32, 'f32') if name == 'value' else AGGREGATES[name]
+            path = os.path.join(pyramid_dir, level, f"{name}.{extension}")
+            files[level, name] = np.memmap(path + '.tmp', dtype=dtype, mode='w+', shape=shapes[level])
+            paths.append(path)
+
+    # One variable at a time: the memory holds the day level of one variable only
+    for v, name in enumerate(names):
+        with span('pyramid_variable', variable=name) as current:
+            day = np.full((n_stations, shapes['day'][2]), np.nan, dtype=np.float32)
+            day[:, :store.n_days] = store.array(name)
+            files['day', 'value'][v] = day
+            levels = {'day': _day_aggregates(day)}
+            for level in LEVELS[1:]:
+                levels[level] = _reduce(levels[PARENT[level]], _child_starts(level, bounds))
+                for aggregate, values in levels[level].items():
+                    files[level, aggregate][v] = values
+            current.rows = int(levels['day']['count'].sum())
+
+    for array in files.values():
+        array.flush()
+    files.clear()
+    for path in paths:
+        os.replace(path + '.tmp', path)
+
+    header = {
+        'version': FORMAT_VERSION,
+        'epoch': epoch.strftime('%Y-%m-%d'),
+        'years': n_years,
+        'last_day': int((observed_last - epoch).days),
+        'layout': '[variable][station][node]',
+        'stations': store.stations,
+        'variables': {name: store.variables[name] for name in names},
+        'levels': {level: shapes[level][2] for level in LEVELS},
+        'store': _signature(os.path.join(store.store_dir, STORE_HEADER_FILE)),
+    }
+    _write_header(header, pyramid_dir)
+    return header
+
+
+def _write_header(header, pyramid_dir):
+    tmp_path = os.path.join(pyramid_dir, HEADER_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(pyramid_dir, HEADER_FILE))
+
+
+# -----------------------------------------------
+# 📖 READER AND INCREMENTAL UPDATES
+# -----------------------------------------------
+class Pyramid:
+    """Memmapped levels of the pyramid; mode='r+' for the incremental updates."""
+
+    def __init__(self, pyramid_dir=PYRAMID_DIR, mode='r'):
+        self.pyramid_dir = pyramid_dir
+        self.mode = mode
+        with open(os.path.join(pyramid_dir, HEADER_FILE), encoding='utf-8') as f:
+            self.header = json.load(f)
+        self.epoch = pd.Timestamp(self.header['epoch'])
+        self.stations = self.header['stations']
+        self.row = {key: i for i, key in enumerate(self.stations)}
+        self.variables = list(self.header['variables'])
+        self.bounds = level_bounds(self.epoch, self.header['years'])
+        self.n_days = len(self.bounds['day'][0])
+        self._arrays = {}
+
+    def array(self, level, name):
+        """(n_variables, n_stations, n_nodes) memmap of one aggregate of a level."""
+        if (level, name) not in self._arrays:
+            dtype, extension = (np.float32, 'f32') if name == 'value' else AGGREGATES[name]
+            shape = (len(self.variables), len(self.stations), self.header['levels'][level])
+            path = os.path.join(self.pyramid_dir, level, f"{name}.{extension}")
+            self._arrays[level, name] = np.memmap(path, dtype=dtype, mode=self.mode, shape=shape)
+        return self._arrays[level, name]
+
+    def day(self, date):
+        return (pd.Timestamp(date) - self.epoch).days
+
+    def dates(self, level, nodes):
+        first, last = self.bounds[level]
+        return self.epoch + pd.to_timedelta(first[nodes], unit='D'), self.epoch + pd.to_timedelta(last[nodes], unit='D')
+
+    # --- Reading -----------------------------------------------------
+    def cover(self, start, end):
+        """[(level, node)] covering the days start..end with the coarsest whole nodes, left to right.
+
+        Days, months, years and decades nest, so the greedy cover on them is
+        the smallest; seasons straddle the years (December), so three whole
+        months of a season are folded into it afterwards.
+        """
+        first = max(self.day(start), 0)
+        last = min(self.day(end), self.n_days - 1)
+        nodes = []
+        while first <= last:
+            for level in ['decade', 'year', 'month', 'day']:
+                node_first, node_last = self.bounds[level]
+                node = int(np.searchsorted(node_first, first))
+                if node < len(node_first) and node_first[node] == first and node_last[node] <= last:
+                    nodes.append((level, node))
+                    first = int(node_last[node]) + 1
+                    break
+        folded = []
+        for level, node in nodes:
+            folded.append((level, node))
+            # Season k is made of the months 3k-1, 3k, 3k+1
+            if level == 'month' and node % 3 == 1 and folded[-3:] == [('month', node - 2), ('month', node - 1), (level, node)]:
+                folded[-3:] = [('season', (node + 1) // 3)]
+        return folded
+
+    def _node_aggregates(self, level, v, rows, nodes):
+        """Aggregates of some nodes of some stations: only those cells are read from the memmaps."""
+        cells = np.ix_(rows, nodes)
+        if level == 'day':
+            return _day_aggregates(self.array('day', 'value')[v][cells])
+        return {name: self.array(level, name)[v][cells] for name in AGGREGATES}
+
+    def aggregate(self, variable, start, end, stations=None):
+        """count, sum, min, max, mean, std per station over a date range, from the coarsest cover."""
+        v = self.variables.index(variable)
+        stations = list(stations or self.stations)
+        rows = [self.row[key] for key in stations]
+        cover = self.cover(start, end)
+        total = None
+        for level in LEVELS:
+            nodes = [node for node_level, node in cover if node_level == level]
+            if not nodes:
+                continue
+            part = {name: MERGE[name].reduce(values, axis=1)
+                    for name, values in self._node_aggregates(level, v, rows, nodes).items()}
+            total = part if total is None else {name: MERGE[name](total[name], part[name]) for name in part}
+        if total is None:
+            return pd.DataFrame(columns=['Station', 'count', 'sum', 'min', 'max', 'mean', 'std', 'nodes'])
+        return _summary(pd.DataFrame({'Station': stations, **total}), nodes=len(cover))
+
+    def series(self, variable, level, start=None, end=None, stations=None):
+        """One row per station and node of a level lying inside start..end (e.g. monthly rainfall)."""
+        v = self.variables.index(variable)
+        stations = list(stations or self.stations)
+        rows = [self.row[key] for key in stations]
+        first, last = self.bounds[level]
+        inside = (first >= (0 if start is None else self.day(start))) & \
+                 (last <= (self.n_days - 1 if end is None else self.day(end)))
+        nodes = np.flatnonzero(inside)
+        values = self._node_aggregates(level, v, rows, nodes)
+        node_first, node_last = self.dates(level, nodes)
+        df = pd.DataFrame({
+            'Station': np.repeat(stations, len(nodes)),
+            'Level': level,
+            'Start': np.tile(node_first.strftime('%Y-%m-%d'), len(stations)),
+            'End': np.tile(node_last.strftime('%Y-%m-%d'), len(stations)),
+            **{name: np.asarray(values[name]).ravel() for name in AGGREGATES},
+        })
+        if level == 'season':
+            df.insert(2, 'Season', np.tile([SEASON_OF_MONTH[month] for month in node_first.month], len(stations)))
+        df = _summary(df)
+        # Nodes after the last observation are still empty
+        return df[df['count'] > 0].reset_index(drop=True)
+
+    # --- Incremental updates -----------------------------------------
+    def _check_day(self, day):
+        if not 0 <= day < self.n_days:
+            raise ValueError(f"Day {self.epoch + pd.Timedelta(days=day):%Y-%m-%d} is outside the pyramid "
+                             f"horizon: rebuild it with pyramid.py")
+
+    def add_days(self, first_day, values):
+        """Merges new days into every level: values is {variable: (n_stations, k)} from first_day on.
+
+        The days must still be empty (NaN): their aggregates are added to the
+        nodes above them without reading anything else.
+        """
+        first = self.day(first_day)
+        k = next(iter(values.values())).shape[1]
+        self._check_day(first)
+        self._check_day(first + k - 1)
+        days = np.arange(first, first + k)
+        dates = self.epoch + pd.to_timedelta(days, unit='D')
+        for variable, block in values.items():
+            v = self.variables.index(variable)
+            block = np.asarray(block, dtype=np.float32)
+            day_values = self.array('day', 'value')[v]
+            if (~np.isnan(day_values[:, days]) & ~np.isnan(block)).any():
+                raise ValueError(f"{variable}: some days already have a value (use add_day to correct them)")
+            day_values[:, days] = np.where(np.isnan(block), day_values[:, days], block)
+            new = _day_aggregates(block)
+            for level in LEVELS[1:]:
+                nodes = node_index(level, dates, self.epoch)
+                for name, merge in MERGE.items():
+                    target = self.array(level, name)[v]
+                    # ufunc.at: several new days can fall in the same node
+                    merge.at(target, (slice(None), nodes), new[name].astype(target.dtype))
+        self.header['last_day'] = max(self.header['last_day'], int(days[-1]))
+        _write_header(self.header, self.pyramid_dir)
+
+    def add_day(self, station, date, values):
+        """Sets (or corrects) one day of a station and recomputes the nodes above it from their children."""
+        day = self.day(date)
+        self._check_day(day)
+        r = self.row[station]
+        for variable, value in values.items():
+            v = self.variables.index(variable)
+            self.array('day', 'value')[v, r, day] = np.nan if value is None else value
+            self._refresh(v, r, [day])
+        self.header['last_day'] = max(self.header['last_day'], day)
+        _write_header(self.header, self.pyramid_dir)
+
+    def _refresh(self, v, r, days):
+        """Recomputes, level by level, the nodes above some days of one station."""
+        dates = self.epoch + pd.to_timedelta(np.asarray(days), unit='D')
+        for level in LEVELS[1:]:
+            child_first, child_last = self.bounds[PARENT[level]]
+            for node in np.unique(node_index(level, dates, self.epoch)):
+                first, last = self.bounds[level][0][node], self.bounds[level][1][node]
+                children = np.arange(np.searchsorted(child_first, first),
+                                     np.searchsorted(child_last, last, side='right'))
+                merged = self._node_aggregates(PARENT[level], v, [r], children)
+                for name, merge in MERGE.items():
+                    self.array(level, name)[v, r, node] = merge.reduce(merged[name], axis=1)[0]
+
+    def flush(self):
+        for array in self._arrays.values():
+            if self.mode != 'r':
+                array.flush()
+
+
+def _summary(df, nodes=None):
+    """Mean and standard deviation from count, sum and sum of squares."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['mean'] = df['sum'] / df['count']
+        df['std'] = np.sqrt(np.maximum(df['sumsq'] / df['count'] - df['mean'] ** 2, 0.0))
+    df = df.drop(columns='sumsq')
+    if nodes is not None:
+        # Rows read per station to answer the range
+        df['nodes'] = nodes
+    return df
+
+
+def open_pyramid(pyramid_dir=PYRAMID_DIR, store_dir=STORE_DIR):
+    """The pyramid if it was built from the current store; otherwise None."""
+    if not os.path.exists(os.path.join(pyramid_dir, HEADER_FILE)):
+        return None
+    pyramid = Pyramid(pyramid_dir)
+    if pyramid.header['store'] != _signature(os.path.join(store_dir, STORE_HEADER_FILE)):
+        return None
+    return pyramid
+
+
+def update_from_store(pyramid_dir=PYRAMID_DIR):
+    """Brings the pyramid up to date with the store: (new days merged, past days corrected).
+
+    The days already merged are compared with the store too: a rebuilt store
+    can change past months (e.g. a patched ilmeteo.it file), and the pyramid
+    is stamped with the store signature only once they match again.
+    """
+    store = open_store()
+    if store is None:
+        raise SystemExit("❌ The daily store is missing or stale: run store.py first")
+    pyramid = Pyramid(pyramid_dir, mode='r+')
+    if store.stations != pyramid.stations or list(store.variables) != pyramid.variables:
+        raise SystemExit("❌ Stations or variables changed: rebuild the pyramid")
+    first = pyramid.header['last_day'] + 1
+    if store.n_days > pyramid.n_days:
+        raise SystemExit("❌ The store goes past the pyramid horizon: rebuild the pyramid")
+    if store.n_days < first:
+        raise SystemExit("❌ The store is shorter than the pyramid: rebuild the pyramid")
+
+    corrected = 0
+    for v, name in enumerate(pyramid.variables):
+        merged = pyramid.array('day', 'value')[v]
+        old, new = merged[:, :first], store.array(name)[:, :first]
+        changed = (old != new) & ~(np.isnan(old) & np.isnan(new))
+        for r in np.flatnonzero(changed.any(axis=1)):
+            days = np.flatnonzero(changed[r])
+            merged[r, days] = new[r, days]
+            pyramid._refresh(v, r, days)
+            corrected += len(days)
+
+    if first < store.n_days:
+        pyramid.add_days(pyramid.epoch + pd.Timedelta(days=first),
+                         {name: store.array(name)[:, first:] for name in pyramid.variables})
+    pyramid.flush()
+    pyramid.header['store'] = _signature(os.path.join(store.store_dir, STORE_HEADER_FILE))
+    _write_header(pyramid.header, pyramid_dir)
+    return store.n_days - first, corrected
+
+
+# =======================================================
+# ⚙️ COMMAND LINE
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Builds or queries the day → decade pyramid of the daily store")
+    parser.add_argument('--update', action='store_true', help="Merge the days added to the store since the build")
+    parser.add_argument('--variable', help="Query: store variable (e.g. openmeteo/temperature_2m_mean)")
+    parser.add_argument('--start', help="... first day (YYYY-MM-DD)")
+    parser.add_argument('--end', help="... last day (YYYY-MM-DD)")
+    parser.add_argument('--level', choices=LEVELS[1:], help="... one row per node of this level instead")
+    parser.add_argument('--station', action='append', help="... only these stations (repeatable)")
+    args = parser.parse_args()
+
+    if args.variable:
+        pyramid = Pyramid()
+        start = time.perf_counter()
+        if args.level:
+            result = pyramid.series(args.variable, args.level, args.start, args.end, args.station)
+        else:
+            result = pyramid.aggregate(args.variable, args.start or pyramid.epoch,
+                                       args.end or pyramid.epoch + pd.Timedelta(days=pyramid.header['last_day']),
+                                       args.station)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(result.round(3).to_string(index=False))
+        if not args.level:
+            cover = pyramid.cover(args.start or pyramid.epoch, args.end or pyramid.epoch + pd.Timedelta(
+                days=pyramid.header['last_day']))
+            levels = pd.Series([level for level, _ in cover]).value_counts().reindex(LEVELS).dropna().astype(int)
+            print(f"🔺 {len(cover)} nodes per station ({', '.join(f'{n} {l}' for l, n in levels.items())}) "
+                  f"in {elapsed:.1f} ms")
+        return
+
+    if args.update:
+        with span('update_pyramid') as current:
+            added, corrected = update_from_store()
+            current.rows = added
+        print(f"✅ {added} new days merged into the pyramid, {corrected} past values corrected → {PYRAMID_DIR}")
+        return
+
+    if open_store() is None:
+        raise SystemExit("❌ The daily store is missing or stale: run store.py first")
+    start = time.perf_counter()
+    with span('build_pyramid') as current:
+        header = build_pyramid()
+        current.rows = len(header['stations']) * len(header['variables'])
+    print(f"✅ Pyramid written in {time.perf_counter() - start:.2f}s → {PYRAMID_DIR}")
+    print(f"   {len(header['stations'])} stations × {len(header['variables'])} variables, "
+          + ', '.join(f"{n} {level}s" for level, n in header['levels'].items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+import pandas as pd
+from paths import PROJECT_DIR, output_path
+from ttl_export import TABLES, ETYPE, normalize_chunk
+from benchmark_queries import BACKENDS, QUERY_FILE, parse_query_file
+from instrument import span
+
+# =======================================================
+# 🛰️ LOCAL QUERY SERVICE
+# =======================================================
+# A long-running HTTP server (stdlib, JSON in and out) that loads the
+# pipeline outputs once and keeps them warm:
+#   - the WeatherReport, Season, ClimateTrend, Microclimate and Anomaly
+#     CSVs as DataFrames, for ad-hoc filters;
+#   - their RDF export (Output/ttl, or the Phase 4 files) in an rdflib or
+#     Oxigraph store, for the competency questions and ad-hoc SPARQL.
+#
+#   GET /health                        status, data versions, cache counters
+#   GET /tables/season?City=Trento&min.Year=2015&columns=Year,Season,AverageTemperature&order=-Year
+#   GET /cqs                           competency questions and the tables they read
+#   GET /cqs/5.1                       result of one competency question
+#   GET /sparql?query=...              ad-hoc SPARQL (POST: the query as body)
+#
+# Every source file is versioned by the SHA-256 of its content. Results go
+# to an LRU keyed on the request plus the versions of the tables it reads,
+# so a pipeline refresh only invalidates the answers that depend on a file
+# whose content actually changed. A watcher thread checks mtime/size every
+# REFRESH_SECONDS and swaps in the reloaded data; requests never wait on I/O.
+#
+#   python query_service.py --port 8766
+#   python query_service.py --kg-table season --kg-table climatetrend   # rdflib on WeatherReport is slow
+
+## 📦 Tables served as DataFrames (inputs of ttl_export.py)
+FRAME_TABLES = ['weatherreport', 'season', 'climatetrend', 'microclimate', 'anomaly']
+
+## 🕸️ RDF files of every table: the ttl_export.py outputs, else the Phase 4 KG
+TTL_DIR = output_path('ttl')
+PHASE4_DIR = os.path.join(PROJECT_DIR, 'Phase 4 - Entity Definition')
+RDF_EXTENSIONS = ['.ttl', '.ttl.gz', '.nt', '.nt.gz']
+
+# Entity class → table whose export contains it (a query depends on the tables of the classes it names)
+CLASS_TABLES = {
+    'City': 'city', 'WeatherStation': 'weatherstation', 'Point': 'weatherstation',
+    'YearSeason': 'season', 'Microclimate': 'microclimate', 'ClimateTrend': 'climatetrend',
+    'WeatherReport': 'weatherreport', 'Temperature': 'weatherreport', 'Precipitation': 'weatherreport',
+    'Wind': 'weatherreport', 'Humidity': 'weatherreport', 'Anomaly': 'anomaly',
+}
+# City nodes are shared by every table
+ALWAYS_READ = ['city']
+ETYPE_NAME = re.compile(r'(?:\betype:|<' + re.escape(ETYPE) + r')(\w+)')
+
+CACHE_SIZE = 512
+REFRESH_SECONDS = 2.0
+DEFAULT_LIMIT = 1000
+HASH_BLOCK = 1 << 20
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _signature(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def rdf_file(table):
+    """RDF file of a table: the pipeline export if any, else the Phase 4 file (None if neither)."""
+    for extension in RDF_EXTENSIONS:
+        path = os.path.join(TTL_DIR, table + extension)
+        if os.path.exists(path):
+            return path
+    path = os.path.join(PHASE4_DIR, table + '.ttl')
+    return path if os.path.exists(path) else None
+
+
+def query_tables(text, loaded):
+    """Tables a SPARQL query reads, from the entity classes it names (all the loaded ones if none)."""
+    tables = {CLASS_TABLES[name] for name in ETYPE_NAME.findall(text) if name in CLASS_TABLES}
+    if not tables - set(ALWAYS_READ):
+        return sorted(loaded)
+    return sorted((tables | set(ALWAYS_READ)) & set(loaded))
+
+
+# -----------------------------------------------
+# 🧠 LRU RESULT CACHE
+# -----------------------------------------------
+class ResultCache:
+    """Encoded responses keyed on (request, data versions), least recently used evicted first."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'size': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+# -----------------------------------------------
+# 📚 WARM DATA
+# -----------------------------------------------
+class FrameSource:
+    """One pipeline CSV kept as a DataFrame, with the hash of the content it was read from."""
+
+    def __init__(self, table):
+        self.table = table
+        self.path = TABLES[table]['input']
+        self.signature = None
+        # (DataFrame, version) swapped in one assignment: a request never mixes two versions
+        self.current = (None, None)
+
+    @property
+    def frame(self):
+        return self.current[0]
+
+    @property
+    def version(self):
+        return self.current[1]
+
+    def refresh(self):
+        """Reloads the CSV if its content changed; True if a new version is served."""
+        signature = _signature(self.path)
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        if signature is None:
+            changed = self.frame is not None
+            self.current = (None, None)
+            return changed
+        version = content_hash(self.path)
+        if version == self.version:
+            # Rewritten with the same content (e.g. a pipeline re-run): cached answers stay valid
+            return False
+        with span('load_table', table=self.table) as current:
+            frame = normalize_chunk(self.table, pd.read_csv(self.path, low_memory=False))
+            current.rows = len(frame)
+        self.current = (frame, version)
+        return True
+
+
+class KnowledgeGraph:
+    """An in-memory RDF store of the loaded tables plus the content hash of every file it was built from."""
+
+    def __init__(self, backend, files):
+        self.store = BACKENDS[backend]()
+        self.files = files
+        self.versions = {table: content_hash(path) for table, path in files.items()}
+        # rdflib is not safe under concurrent queries: one at a time per store
+        self.lock = threading.Lock()
+        for table, path in files.items():
+            with span('load_kg', table=table):
+                self.store.load(path)
+
+    def query(self, text):
+        with self.lock:
+            return self.store.query(text)
+
+
+class QueryService(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, backend='rdflib', kg_tables=None, cache_size=CACHE_SIZE,
+                 refresh_seconds=REFRESH_SECONDS, quiet=True):
+        super().__init__(address, QueryHandler)
+        self.backend = backend
+        self.kg_tables = kg_tables
+        self.refresh_seconds = refresh_seconds
+        self.quiet = quiet
+        self.cache = ResultCache(cache_size)
+        self.frames = {table: FrameSource(table) for table in FRAME_TABLES}
+        self.questions, self.questions_error = {}, None
+        if os.path.exists(QUERY_FILE):
+            self.questions = parse_query_file(QUERY_FILE)
+        else:
+            self.questions_error = f"{QUERY_FILE} not found: the competency questions are not served"
+            print(f"⚠️ {self.questions_error}")
+        self.kg = None
+        self.kg_signatures = None
+        self.kg_error = None
+        self.started = time.time()
+        for source in self.frames.values():
+            source.refresh()
+        self._stop = threading.Event()
+        self.watcher = threading.Thread(target=self._watch, daemon=True)
+
+    def start_watcher(self):
+        self.watcher.start()
+
+    # --- Refresh -----------------------------------------------------
+    def _kg_files(self):
+        tables = self.kg_tables if self.kg_tables is not None else list(TABLES)
+        files = {table: rdf_file(table) for table in tables}
+        return {table: path for table, path in files.items() if path is not None}
+
+    def refresh_kg(self):
+        """Rebuilds the store when a file changed; the old one answers until the new one is ready."""
+        files = self._kg_files()
+        signatures = {table: _signature(path) for table, path in files.items()}
+        if signatures == self.kg_signatures:
+            return
+        current = self.kg
+        if current is not None and files == current.files and \
+                all(content_hash(path) == current.versions[table] for table, path in files.items()):
+            self.kg_signatures = signatures
+            return
+        try:
+            kg = KnowledgeGraph(self.backend, files)
+        except Exception as e:
+            # Optional dependency missing or unreadable file: the tables keep working
+            self.kg_error = f"{type(e).__name__}: {e}"
+            self.kg_signatures = signatures
+            print(f"⚠️ Knowledge graph not loaded: {self.kg_error}")
+            return
+        self.kg, self.kg_signatures, self.kg_error = kg, signatures, None
+        print(f"🕸️ Knowledge graph ({self.backend}): {len(kg.store)} triples from {len(files)} files")
+
+    def refresh(self):
+        for source in self.frames.values():
+            if source.refresh():
+                print(f"🔄 {source.table} reloaded (version {source.version})")
+        if self.kg_tables != []:
+            self.refresh_kg()
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Refresh failed: {type(e).__name__}: {e}")
+            self._stop.wait(self.refresh_seconds)
+
+    def server_close(self):
+        self._stop.set()
+        super().server_close()
+
+    # --- Answers -----------------------------------------------------
+    def versions(self):
+        kg = self.kg
+        return {
+            'tables': {table: source.version for table, source in self.frames.items()},
+            'kg': dict(kg.versions) if kg is not None else None,
+        }
+
+    def cached(self, key, compute):
+        """(status, encoded body, cache hit) of a request, computing it on a miss."""
+        body = self.cache.get(key)
+        if body is not None:
+            return 200, body, True
+        start = time.perf_counter()
+        payload = compute()
+        payload['computed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.cache.put(key, body)
+        return 200, body, False
+
+    def table_answer(self, table, params):
+        source = self.frames[table]
+        frame, version = source.current
+        if frame is None:
+            raise LookupError(f"{table}: {source.path} not found (run the pipeline first)")
+        key = ('table', table, version, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        return self.cached(key, lambda: filter_frame(table, frame, version, params))
+
+    def sparql_answer(self, text, label):
+        kg = self.kg
+        if kg is None:
+            raise RuntimeError(self.kg_error or "Knowledge graph still loading")
+        tables = query_tables(text, kg.versions)
+        key = ('sparql', text, tuple((table, kg.versions[table]) for table in tables))
+
+        def compute():
+            columns, rows = kg.query(text)
+            return {'query': label, 'tables': {table: kg.versions[table] for table in tables},
+                    'columns': columns, 'count': len(rows), 'rows': rows}
+        return self.cached(key, compute)
+
+
+# -----------------------------------------------
+# 🔎 AD-HOC FILTERS
+# -----------------------------------------------
+def _typed(series, values):
+    if pd.api.types.is_numeric_dtype(series):
+        return [float(value) for value in values]
+    return [str(value) for value in values]
+
+
+def filter_frame(table, frame, version, params):
+    """Rows of a table matching the query string: col=v1,v2 (any of), min.col / max.col (bounds),
+    columns=a,b, order=col or -col, limit, offset."""
+    params = dict(params)
+    limit = int(params.pop('limit', [DEFAULT_LIMIT])[0])
+    offset = int(params.pop('offset', [0])[0])
+    if limit < 0 or offset < 0:
+        raise ValueError(f"limit and offset must not be negative (limit={limit}, offset={offset})")
+    columns = params.pop('columns', [None])[0]
+    order = params.pop('order', [None])[0]
+
+    mask = pd.Series(True, index=frame.index)
+    for name, values in params.items():
+        bound, _, column = name.rpartition('.') if name.startswith(('min.', 'max.')) else ('', '', name)
+        if column not in frame:
+            raise KeyError(f"Unknown column '{column}' of {table}")
+        series = frame[column]
+        if bound:
+            limit_value = _typed(series, values[:1])[0]
+            mask &= (series >= limit_value) if bound == 'min' else (series <= limit_value)
+        else:
+            wanted = _typed(series, ','.join(values).split(','))
+            mask &= series.isin(wanted) if pd.api.types.is_numeric_dtype(series) \
+                else series.astype(str).isin(wanted)
+
+    result = frame[mask.to_numpy()]
+    if order:
+        column = order.lstrip('-')
+        if column not in result:
+            raise KeyError(f"Unknown column '{column}' of {table}")
+        result = result.sort_values(column, ascending=not order.startswith('-'), kind='stable')
+    if columns:
+        selected = columns.split(',')
+        missing = [column for column in selected if column not in result]
+        if missing:
+            raise KeyError(f"Unknown columns {missing} of {table}")
+        result = result[selected]
+    page = result.iloc[offset:offset + limit]
+    split = json.loads(page.to_json(orient='split', index=False, force_ascii=False))
+    return {'table': table, 'version': version, 'count': len(result), 'offset': offset,
+            'columns': split['columns'], 'rows': split['data']}
+
+
+# -----------------------------------------------
+# 🌐 HTTP
+# -----------------------------------------------
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_body(self, status, body, cache=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if cache is not None:
+            self.send_header('X-Cache', 'HIT' if cache else 'MISS')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send(self, status, payload):
+        self._send_body(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._dispatch(url.path.rstrip('/') or '/', parse_qs(url.query, keep_blank_values=True))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        params = parse_qs(url.query, keep_blank_values=True)
+        if url.path.rstrip('/') == '/sparql' and length:
+            params['query'] = [self.rfile.read(length).decode('utf-8')]
+        self._dispatch(url.path.rstrip('/'), params)
+
+    def _dispatch(self, path, params):
+        server = self.server
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        try:
+            if path == '/health' or path == '/':
+                return self._send(200, {'status': 'ok', 'uptime_s': round(time.time() - server.started, 1),
+                                        'backend': server.backend, 'kg_error': server.kg_error,
+                                        'cqs_error': server.questions_error,
+                                        'versions': server.versions(), 'cache': server.cache.stats()})
+            if parts[0] == 'tables' and len(parts) == 2:
+                if parts[1] not in server.frames:
+                    return self._send(404, {'error': f"Unknown table '{parts[1]}'", 'tables': FRAME_TABLES})
+                status, body, hit = server.table_answer(parts[1], params)
+                return self._send_body(status, body, hit)
+            if parts[0] == 'cqs' and server.questions_error:
+                return self._send(503, {'error': server.questions_error})
+            if path == '/cqs':
+                loaded = server.kg.versions if server.kg is not None else list(TABLES)
+                return self._send(200, {cq: {'title': info['title'], 'tables': query_tables(info['query'], loaded)}
+                                        for cq, info in server.questions.items()})
+            if parts[0] == 'cqs' and len(parts) == 2:
+                if parts[1] not in server.questions:
+                    return self._send(404, {'error': f"Unknown competency question '{parts[1]}'",
+                                            'cqs': list(server.questions)})
+                status, body, hit = server.sparql_answer(server.questions[parts[1]]['query'], parts[1])
+                return self._send_body(status, body, hit)
+            if path == '/sparql':
+                if not params.get('query'):
+                    return self._send(400, {'error': "Missing 'query'"})
+                status, body, hit = server.sparql_answer(params['query'][0], 'sparql')
+                return self._send_body(status, body, hit)
+            return self._send(404, {'error': f"Unknown path {path}"})
+        except (KeyError, ValueError) as e:
+            return self._send(400, {'error': str(e.args[0] if e.args else e)})
+        except LookupError as e:
+            return self._send(404, {'error': str(e)})
+        except RuntimeError as e:
+            return self._send(503, {'error': str(e)})
+        except Exception as e:
+            return self._send(500, {'error': f"{type(e).__name__}: {e}"})
+
+
+# =======================================================
+# ⚙️ MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Local JSON query service over the pipeline outputs and the KG")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='rdflib')
+    parser.add_argument('--kg-table', action='append', choices=sorted(TABLES),
+                        help="Only load the RDF of these tables (repeatable; default: all that exist)")
+    parser.add_argument('--no-kg', action='store_true', help="Serve the tables only (no SPARQL)")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="Cached answers (LRU)")
+    parser.add_argument('--refresh', type=float, default=REFRESH_SECONDS, help="Seconds between file checks")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    kg_tables = [] if args.no_kg else args.kg_table
+    server = QueryService((args.host, args.port), args.backend, kg_tables, args.cache_size,
+                          args.refresh, quiet=not args.verbose)
+    loaded = {table: len(source.frame) for table, source in server.frames.items() if source.frame is not None}
+    print(f"🛰️ Query service on http://{args.host}:{args.port} "
+          f"({', '.join(f'{t} {n} rows' for t, n in loaded.items()) or 'no tables yet'}; "
+          f"{len(server.questions)} competency questions)")
+    # The KG loads in the watcher thread: the tables are served meanwhile
+    server.start_watcher()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"   cache: {server.cache.stats()}")
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
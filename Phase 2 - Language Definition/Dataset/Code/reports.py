@@ -0,0 +1,190 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from openmeteo_loader import load_city
+from spatial import StationIndex, city_points, assign_station_codes
+from instrument import traced
+
+# =======================================================
+# 🗒️ WEATHER REPORT ROWS
+# =======================================================
+# Open-Meteo columns → WeatherReport.csv columns, built one chunk of
+# stations at a time by the workers of Create-WeatherReport.py.
+#
+# In the same pass every station also gets the ISO / xsd:dateTime dates
+# (as Anomaly-merge.py), its StationCode (as city-fixed.py) and the year
+# filter of the reduced Karma file (as Minimum-weatherreport.py), so the
+# four CSVs are appended chunk by chunk without re-reading each other.
+
+REPORT_COLUMNS = {
+    "weather_code (wmo code)": "WeatherCode",
+    "relative_humidity_2m_max (%)": "MaxHumidity (Percentage)",
+    "relative_humidity_2m_min (%)": "MinHumidity (Percentage)",
+    "relative_humidity_2m_mean (%)": "MeanHumidity (Percentage)",
+    "winddirection_10m_dominant (°)": "WindDirection (Degree)",
+    "temperature_2m_max (°C)": "MaxTemperature (Celsius)",
+    "temperature_2m_min (°C)": "MinTemperature (Celsius)",
+    "precipitation_sum (mm)": "Precipitation (mm)",
+    "precipitation_hours (h)": "PrecipitationHours (h)",
+    "wind_gusts_10m_mean (km/h)": "WindGusts (km/h)",
+    "wind_speed_10m_mean (km/h)": "WindSpeed (km/h)",
+    "temperature_2m_mean (°C)": "MeanTemperature (Celsius)",
+}
+
+# Columns the Open-Meteo export writes without decimals: pandas read them as
+# integers, every other measure as float ("0.0", "0.00")
+INTEGER_COLUMNS = [
+    "WeatherCode",
+    "MaxHumidity (Percentage)",
+    "MinHumidity (Percentage)",
+    "MeanHumidity (Percentage)",
+    "WindDirection (Degree)",
+]
+
+## 📄 The four generated files and their columns
+STATION_COLUMN = "CityCode"
+
+# Colonne della versione ridotta usata per la mappatura Karma
+MINIMUM_COLUMNS = {
+    "City": "City",
+    "WeatherCode": "WeatherCode",
+    "MeanHumidity (Percentage)": "MeanHumidity (Percentage)",
+    "WindDirection (Degree)": "WindDirection (Degree)",
+    "Precipitation (mm)": "Precipitation (mm)",
+    "WindGusts (km/h)": "WindGusts (km/h)",
+    "WindSpeed (km/h)": "WindSpeed (km/h)",
+    "MeanTemperature (Celsius)": "MeanTemperature (Celsius)",
+    "DateTime_xsd": "Date",
+    "CityCode": "StationCode"
+}
+MINIMUM_YEARS = (2010, 2025)
+
+# Stations per chunk: the four CSV texts of a station take ~3.5 MB
+REPORT_CHUNK_SIZE = 5
+
+OUTPUT_FILES = {
+    'report': "WeatherReport.csv",
+    'iso': "WeatherReport_ISO.csv",
+    'station': "WeatherReport_Station.csv",
+    'minimum': "WeatherReportMinimum.csv",
+}
+
+
+# -----------------------------------------------
+# 🔢 NUMBERS AS THE CHAINED SCRIPTS WROTE THEM
+# -----------------------------------------------
+def as_printed(values, digits=6):
+    """float64 of the '%g' text of the float32 values (what reading WeatherReport.csv back gives)."""
+    x = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = np.floor(np.log10(np.abs(x)))
+    exponent = np.where(np.isfinite(exponent), exponent, 0).astype(np.int64)
+    decimals = digits - 1 - exponent
+    # Integer powers of ten are exact: round(x · 10^d) / 10^d is the nearest double of the text
+    up = 10.0 ** np.maximum(decimals, 0)
+    down = 10.0 ** np.maximum(-decimals, 0)
+    return np.where(decimals >= 0, np.round(x * up) / up, np.round(x / down) * down)
+
+
+def source_types(df):
+    """Numeric columns typed as pandas infers them from the Open-Meteo CSV text.
+
+    Integer columns stay integers (float if the station has gaps, as read_csv
+    does), the others become the float64 of their text: all four outputs
+    print the numbers as the chained scripts did.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype.kind not in 'if':
+            continue
+        values = df[col].to_numpy(dtype=np.float64)
+        if col in INTEGER_COLUMNS and not np.isnan(values).any():
+            df[col] = values.astype(np.int64)
+        else:
+            df[col] = as_printed(values)
+    return df
+
+
+# -----------------------------------------------
+# 🧩 ONE PASS OVER A CHUNK OF STATIONS
+# -----------------------------------------------
+@lru_cache(maxsize=1)
+def _station_lookup():
+    """Spatial index and city points, built once per worker process."""
+    index = StationIndex()
+    return index, city_points(index=index)
+
+
+@traced(rows=lambda outputs: len(outputs['report']))
+def report_outputs(city, first_year=MINIMUM_YEARS[0], last_year=MINIMUM_YEARS[1]):
+    """{output: DataFrame} of one station for the four WeatherReport files."""
+    df = load_city(city)
+    iso = pd.Series(np.datetime_as_string(df.index.to_numpy('datetime64[D]')))
+    report = df[list(REPORT_COLUMNS)].rename(columns=REPORT_COLUMNS).reset_index(drop=True)
+    report.insert(0, "Date", iso.str[8:10] + "/" + iso.str[5:7] + "/" + iso.str[:4])
+    report.insert(0, "City", city)
+    # One typing step for the four outputs
+    report = source_types(report)
+
+    # Converte il campo Date in ISO AAAA-MM-GG e aggiunge mezzanotte T00:00:00 (xsd:dateTime)
+    full = report.copy()
+    full["Date_ISO"] = iso
+    full["DateTime_xsd"] = iso + "T00:00:00"
+
+    # Stazione attiva più vicina alla città, giorno per giorno
+    index, points = _station_lookup()
+    full[STATION_COLUMN] = assign_station_codes(full["City"], df.index, index=index, points=points)
+
+    # Versione ridotta: anni first_year-last_year, colonne rinominate per Karma
+    years = df.index.year
+    minimum = full.loc[(years >= first_year) & (years <= last_year), list(MINIMUM_COLUMNS)]
+    minimum = minimum.rename(columns=MINIMUM_COLUMNS)
+
+    return {
+        'report': report,
+        'iso': full.drop(columns=[STATION_COLUMN]),
+        'station': full,
+        'minimum': minimum,
+    }
+
+
+def report_outputs_chunk(keys, first_year=MINIMUM_YEARS[0], last_year=MINIMUM_YEARS[1]):
+    """{output: CSV text with header} of a chunk of stations (process pool worker).
+
+    The CSV text is formatted in the worker, so the main process only appends it.
+    """
+    texts = {name: [] for name in OUTPUT_FILES}
+    # One station at a time: only its frames and the text of the chunk are in memory
+    for i, city in enumerate(keys):
+        for name, frame in report_outputs(city, first_year, last_year).items():
+            texts[name].append(frame.to_csv(index=False, header=(i == 0)))
+    return {name: ''.join(parts) for name, parts in texts.items()}
+
+
+class ChunkedCSVWriter:
+    """Appends CSV chunks (each with its header) to a temporary file, renamed when complete."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = None
+        self.rows = 0
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, "w", encoding="utf-8", newline="")
+        return self
+
+    def write(self, text):
+        header, _, body = text.partition("\n")
+        if self.file.tell() == 0:
+            self.file.write(header + "\n")
+        self.file.write(body)
+        self.rows += body.count("\n")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
@@ -0,0 +1,328 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from openmeteo_loader import CACHE_FORMAT
+from stations import data_keys, map_chunks
+from store import load_stack
+from seasons import assign_seasons
+from instrument import span, traced
+from paths import output_path
+from ttl_export import TripleWriter, IRI, Literal, entity, prop, etype_class, RDF_TYPE, XSD
+
+# =======================================================
+# 📝 1. CONFIGURATION
+# =======================================================
+# Pre-aggregated city tables (month, season, year, decade) so that the
+# competency questions of Evaluation/CQs and Queries.txt are answered from
+# O(cities x years) rows instead of scanning every daily report.
+
+ROLLUP_DIR = 'rollups'
+LEVELS = ['month', 'season', 'year', 'decade']
+KEYS = {
+    'month': ['City', 'Year', 'Month'],
+    'season': ['City', 'Year', 'Season'],
+    'year': ['City', 'Year'],
+    'decade': ['City', 'Decade'],
+}
+
+## 🏷️ Daily columns (Open-Meteo)
+TEMP_MEAN_COL = 'temperature_2m_mean (°C)'
+TEMP_MAX_COL = 'temperature_2m_max (°C)'
+TEMP_MIN_COL = 'temperature_2m_min (°C)'
+PREC_COL = 'precipitation_sum (mm)'
+WIND_SPEED_COL = 'wind_speed_10m_mean (km/h)'
+WIND_GUST_COL = 'wind_gusts_10m_mean (km/h)'
+WIND_DIR_COL = 'winddirection_10m_dominant (°)'
+
+## 🌡️ Thresholds of the "extreme day" counters (CQ 3.5)
+HOT_DAY = 30.0
+COLD_DAY = -5.0
+
+# Aggregates that can be combined again to build a coarser level
+SUM_COLS = ['days', 'temp_sum', 'precip_sum', 'wind_sum', 'dir_sin_sum', 'dir_cos_sum', 'hot_days', 'cold_days']
+MIN_COLS = ['temp_min', 'tmean_min', 'precip_min']
+MAX_COLS = ['temp_max', 'tmean_max', 'precip_max', 'gust_max']
+
+
+# =======================================================
+# 🧮 2. BUILDING THE ROLLUPS
+# =======================================================
+def daily_aggregates(df):
+    """Per-day columns of the rollups (one row per city and day)."""
+    direction = np.deg2rad(df[WIND_DIR_COL].to_numpy(dtype=np.float64))
+    temp = df[TEMP_MEAN_COL].to_numpy(dtype=np.float64)
+    return pd.DataFrame({
+        'City': df['City'].to_numpy(),
+        'Year': df.index.year,
+        'Month': df.index.month,
+        'Season': assign_seasons(df.index),
+        'days': 1,
+        'temp_sum': temp,
+        'precip_sum': df[PREC_COL].to_numpy(dtype=np.float64),
+        'wind_sum': df[WIND_SPEED_COL].to_numpy(dtype=np.float64),
+        'dir_sin_sum': np.sin(direction),
+        'dir_cos_sum': np.cos(direction),
+        'hot_days': (temp > HOT_DAY).astype(np.int32),
+        'cold_days': (temp < COLD_DAY).astype(np.int32),
+        'temp_min': df[TEMP_MIN_COL].to_numpy(dtype=np.float64),
+        'temp_max': df[TEMP_MAX_COL].to_numpy(dtype=np.float64),
+        'tmean_min': temp,
+        'tmean_max': temp,
+        'precip_min': df[PREC_COL].to_numpy(dtype=np.float64),
+        'precip_max': df[PREC_COL].to_numpy(dtype=np.float64),
+        'gust_max': df[WIND_GUST_COL].to_numpy(dtype=np.float64),
+    })
+
+
+def combine(df, keys):
+    """Groups finer rows into a coarser level, combining the mergeable aggregates."""
+    spec = {col: 'sum' for col in SUM_COLS}
+    spec.update({col: 'min' for col in MIN_COLS})
+    spec.update({col: 'max' for col in MAX_COLS})
+    return df.groupby(keys, observed=True, sort=True).agg(spec).reset_index()
+
+
+def add_readable_columns(df):
+    """Means and prevailing direction derived from the sums."""
+    df = df.copy()
+    df['temp_mean'] = (df['temp_sum'] / df['days']).round(2)
+    df['precip_daily_mean'] = (df['precip_sum'] / df['days']).round(2)
+    df['wind_mean'] = (df['wind_sum'] / df['days']).round(2)
+    df['wind_direction'] = (np.rad2deg(np.arctan2(df['dir_sin_sum'], df['dir_cos_sum'])) % 360).round(0)
+    return df
+
+
+@traced(rows=lambda result: len(result[0]) + len(result[1]))
+def rollup_chunk(keys):
+    """Month and season levels of a chunk of stations (process pool worker)."""
+    daily = daily_aggregates(load_stack(keys))
+    return combine(daily, KEYS['month']), combine(daily, KEYS['season'])
+
+
+def build_rollups(daily=None, cities=None):
+    """All levels, each derived from the one below (day → month → year → decade).
+
+    Without daily, the month and season levels are built one chunk of stations
+    at a time, so the daily rows of the whole network are never in memory.
+    """
+    if daily is None:
+        cities = list(cities or data_keys())
+        parts = list(map_chunks(rollup_chunk, cities))
+        # City is a plain string column here: re-sort as a single groupby would
+        month = pd.concat([part[0] for part in parts]).sort_values(KEYS['month'], kind='stable')
+        season = pd.concat([part[1] for part in parts]).sort_values(KEYS['season'], kind='stable')
+        month, season = month.reset_index(drop=True), season.reset_index(drop=True)
+    else:
+        month = combine(daily, KEYS['month'])
+        season = combine(daily, KEYS['season'])
+    year = combine(month, KEYS['year'])
+    decade = year.assign(Decade=(year['Year'] // 10) * 10)
+    decade = combine(decade, KEYS['decade'])
+    return {'month': month, 'season': season, 'year': year, 'decade': decade}
+
+
+def rollup_path(level, extension='csv'):
+    return output_path(os.path.join(ROLLUP_DIR, f"rollup_{level}.{extension}"))
+
+
+def write_rollups(rollups):
+    for level, df in rollups.items():
+        df = add_readable_columns(df)
+        df.to_csv(rollup_path(level), index=False)
+        if CACHE_FORMAT == 'parquet':
+            df.to_parquet(rollup_path(level, 'parquet'), index=False)
+
+
+def read_rollups():
+    rollups = {}
+    for level in LEVELS:
+        if CACHE_FORMAT == 'parquet' and os.path.exists(rollup_path(level, 'parquet')):
+            rollups[level] = pd.read_parquet(rollup_path(level, 'parquet'))
+        else:
+            rollups[level] = pd.read_csv(rollup_path(level))
+    return rollups
+
+
+# =======================================================
+# 🐢 3. ROLLUPS AS TYPED TRIPLES
+# =======================================================
+def period_id(level, row):
+    if level == 'month':
+        return f"{row['Year']}-{row['Month']:02d}"
+    if level == 'season':
+        return f"{row['Year']}_{row['Season']}"
+    if level == 'year':
+        return str(row['Year'])
+    return f"{row['Decade']}s"
+
+
+def write_rollup_triples(rollups, path=None):
+    """One etype:Rollup node per city and period, with xsd-typed values."""
+    path = path or rollup_path('all', 'ttl')
+    floats = {
+        'temp_mean': 'has_average_temperature',
+        'temp_min': 'has_min_temperature',
+        'temp_max': 'has_max_temperature',
+        'precip_sum': 'has_total_precipitation',
+        'wind_mean': 'has_average_wind_speed',
+        'wind_direction': 'has_direction',
+    }
+    seen = set()
+    with TripleWriter(path) as writer:
+        for level, df in rollups.items():
+            df = add_readable_columns(df)
+            for row in df.to_dict('records'):
+                city = entity('City', row['City'])
+                if city not in seen:
+                    seen.add(city)
+                    writer.write(city, [(IRI(RDF_TYPE), etype_class('City')), (prop('has_name'), row['City'])])
+                pairs = [
+                    (IRI(RDF_TYPE), etype_class('Rollup')),
+                    (prop('has_rollup_level'), level),
+                    (prop('has_period'), period_id(level, row)),
+                    (prop('has_day_count'), Literal(int(row['days']), XSD + 'integer')),
+                    (prop('has_been_observed_in'), city),
+                ]
+                pairs += [(prop(p), Literal(f"{row[col]:.2f}", XSD + 'float')) for col, p in floats.items()]
+                writer.write(entity('Rollup', f"{row['City']}_{level}_{period_id(level, row)}"), pairs)
+    return path
+
+
+# =======================================================
+# ❓ 4. COMPETENCY QUESTIONS FROM THE ROLLUPS
+# =======================================================
+class RollupQueries:
+    """Answers the CQs of Evaluation/CQs and Queries.txt from the rollup tables."""
+
+    def __init__(self, rollups=None):
+        rollups = rollups if rollups is not None else read_rollups()
+        self.levels = {level: add_readable_columns(df) for level, df in rollups.items()}
+
+    def _window_mean(self, level, col, first_year, last_year, keys=('City',)):
+        df = self.levels[level]
+        df = df[(df['Year'] >= first_year) & (df['Year'] <= last_year)]
+        return df.groupby(list(keys), observed=True)[col].mean()
+
+    def cq_1_1(self, reference_year=2025, years=10):
+        """Maria Bianchi 1.1: cities whose annual rainfall grew in the last decade."""
+        recent = self._window_mean('year', 'precip_sum', reference_year - years, reference_year)
+        past = self._window_mean('year', 'precip_sum', reference_year - 2 * years, reference_year - years - 1)
+        df = pd.DataFrame({'recentRain': recent, 'pastRain': past}).dropna()
+        df['increase'] = df['recentRain'] - df['pastRain']
+        return df[df['increase'] > 0].sort_values('increase', ascending=False).round(2).reset_index()
+
+    def cq_1_2(self, since=2015):
+        """Maria Bianchi 1.2: average daily rainfall per city, year and month."""
+        df = self.levels['month']
+        df = df[df['Year'] >= since]
+        return df[['City', 'Year', 'Month', 'precip_daily_mean']].rename(
+            columns={'precip_daily_mean': 'avgMonthlyRainfall'}).reset_index(drop=True)
+
+    def cq_2_3(self):
+        """Giulia Ferrari 2.3: average wind speed and prevailing direction per city."""
+        df = combine(self.levels['decade'], ['City'])
+        df = add_readable_columns(df)
+        return df[['City', 'wind_mean', 'wind_direction']].rename(
+            columns={'wind_mean': 'avgWindSpeed', 'wind_direction': 'prevailingDirection'}
+        ).sort_values('avgWindSpeed', ascending=False).reset_index(drop=True)
+
+    def cq_3_4(self, current_year=2024):
+        """Alessandro Rossi 3.4: current temperature/precipitation against past extremes."""
+        year = self.levels['year']
+        current = add_readable_columns(combine(year[year['Year'] >= current_year], ['City']))
+        past = combine(year[year['Year'] < current_year], ['City'])
+        df = pd.DataFrame({
+            'City': current['City'],
+            'currentTemp': current['temp_mean'],
+            'currentPrecip': current['precip_daily_mean'],
+        }).merge(past[['City', 'tmean_max', 'tmean_min', 'precip_max', 'precip_min']], on='City')
+        df = df.rename(columns={'tmean_max': 'maxPastTemp', 'tmean_min': 'minPastTemp',
+                                'precip_max': 'maxPastPrecip', 'precip_min': 'minPastPrecip'})
+        return df.sort_values('currentTemp', ascending=False).reset_index(drop=True)
+
+    def cq_3_5(self, since=2005):
+        """Alessandro Rossi 3.5: days with mean temperature > 30 °C or < -5 °C per city."""
+        year = self.levels['year']
+        year = year[year['Year'] >= since]
+        counts = (year['hot_days'] + year['cold_days']).groupby(year['City'], observed=True).sum()
+        counts = counts[counts > 1].sort_values(ascending=False)
+        return counts.rename('numAnomalies').reset_index()
+
+    def cq_4_1(self, city='Trento', split_year=2010, past_start=1995):
+        """Francesca Romano 4.1: season temperature/precipitation, recent vs previous 15 years."""
+        season = self.levels['season']
+        season = season[season['City'] == city]
+        recent = season[season['Year'] >= split_year].groupby('Season', observed=True)[['temp_mean', 'precip_daily_mean']].mean()
+        past = season[(season['Year'] >= past_start) & (season['Year'] < split_year)] \
+            .groupby('Season', observed=True)[['temp_mean', 'precip_daily_mean']].mean()
+        df = pd.DataFrame({
+            'avgTempRecent': recent['temp_mean'], 'avgTempPast': past['temp_mean'],
+            'avgPrecRecent': recent['precip_daily_mean'], 'avgPrecPast': past['precip_daily_mean'],
+        })
+        df['tempChange'] = df['avgTempRecent'] - df['avgTempPast']
+        df['precChange'] = df['avgPrecRecent'] - df['avgPrecPast']
+        return df.round(2).reset_index()
+
+    def cq_4_4(self, first_year=2015, last_year=2025):
+        """Francesca Romano 4.4: latest spring temperature against the 2015-2025 springs."""
+        spring = self.levels['season']
+        spring = spring[spring['Season'] == 'Spring']
+        current_year = spring['Year'].max()
+        current = spring[spring['Year'] == current_year].set_index('City')['temp_mean']
+        history = spring[(spring['Year'] >= first_year) & (spring['Year'] <= last_year)
+                         & (spring['Year'] != current_year)]
+        historic = history.groupby('City', observed=True)['temp_mean'].mean()
+        df = pd.DataFrame({'currentYear': current_year, 'currentTemp': current, 'historicAvg': historic})
+        return df.round(2).reset_index()
+
+    def cq_5_1(self, reference_year=2025, years=15):
+        """Marco Ricci 5.1: mean temperature of the last 15 years against the 15 before."""
+        recent = self._window_mean('year', 'temp_mean', reference_year - years, reference_year)
+        past = self._window_mean('year', 'temp_mean', reference_year - 2 * years, reference_year - years - 1)
+        df = pd.DataFrame({'recentAvg': recent, 'pastAvg': past}).dropna()
+        df['increase'] = df['recentAvg'] - df['pastAvg']
+        return df.sort_values('increase', ascending=False).round(2).reset_index()
+
+    def cq_5_6(self, reference_year=2025, years=15):
+        """Marco Ricci 5.6: same comparison, ranked as the long-term warming per station."""
+        return self.cq_5_1(reference_year, years).rename(columns={'increase': 'warmingTrend'})
+
+
+CQ_METHODS = {
+    '1.1': 'cq_1_1', '1.2': 'cq_1_2', '2.3': 'cq_2_3', '3.4': 'cq_3_4', '3.5': 'cq_3_5',
+    '4.1': 'cq_4_1', '4.4': 'cq_4_4', '5.1': 'cq_5_1', '5.6': 'cq_5_6',
+}
+
+
+# =======================================================
+# ⚙️ 5. MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Builds the city rollups and answers the CQs from them")
+    parser.add_argument('--cq', action='append', choices=sorted(CQ_METHODS),
+                        help="Answer this competency question from the existing rollups (repeatable)")
+    parser.add_argument('--no-ttl', action='store_true', help="Do not write the rollup triples")
+    args = parser.parse_args()
+
+    if args.cq:
+        queries = RollupQueries()
+        for cq in args.cq:
+            print(f"\n### CQ {cq}")
+            print(getattr(queries, CQ_METHODS[cq])().to_markdown(index=False))
+        return
+
+    with span('build') as current:
+        rollups = build_rollups()
+        current.rows = sum(len(df) for df in rollups.values())
+    with span('export_csv', rows=current.rows):
+        write_rollups(rollups)
+    for level, df in rollups.items():
+        print(f"✅ rollup_{level}: {len(df)} rows → {rollup_path(level)}")
+    if not args.no_ttl:
+        with span('export_ttl', rows=current.rows):
+            print(f"✅ Rollup triples → {write_rollup_triples(rollups)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+from store import load_stack
+from anomalies import DAYS_IN_YEAR, day_of_year_slots, runs, to_matrix
+from instrument import traced
+
+# =======================================================
+# 🍂 SEASON CLASSIFICATION BY LOOKUP TABLE
+# =======================================================
+# Every (month, day) is encoded as (month - 1) * 31 + (day - 1), so one
+# 372-slot table maps any date to its season with a single array lookup
+# instead of one Python call per row.
+
+# Alphabetical, as in the season.csv produced so far
+SEASON_NAMES = ['Autumn', 'Spring', 'Summer', 'Winter']
+
+## 📅 First day (month, day) of each season in the northern hemisphere
+SEASON_BOUNDARIES = {
+    # Italian astronomical dates (equinoxes and solstices)
+    'astronomical': {
+        'Spring': (3, 20),
+        'Summer': (6, 21),
+        'Autumn': (9, 23),
+        'Winter': (12, 21),
+    },
+    # Meteorological seasons: whole months (MAM, JJA, SON, DJF)
+    'meteorological': {
+        'Spring': (3, 1),
+        'Summer': (6, 1),
+        'Autumn': (9, 1),
+        'Winter': (12, 1),
+    },
+}
+
+# Same dates, opposite season south of the equator
+SOUTHERN_SEASON = {'Spring': 'Autumn', 'Summer': 'Winter', 'Autumn': 'Spring', 'Winter': 'Summer'}
+
+
+def day_slot(month, day):
+    return (np.asarray(month) - 1) * 31 + (np.asarray(day) - 1)
+
+
+def build_season_table(mode='astronomical', hemisphere='north', boundaries=None):
+    """Season code (index in SEASON_NAMES) of every (month, day) slot.
+
+    boundaries overrides the named mode with a {season: (month, day)} dict
+    giving the first day of each season.
+    """
+    if boundaries is None:
+        if mode not in SEASON_BOUNDARIES:
+            raise ValueError(f"Unknown season mode '{mode}', expected one of {sorted(SEASON_BOUNDARIES)}")
+        boundaries = SEASON_BOUNDARIES[mode]
+    if hemisphere not in ('north', 'south'):
+        raise ValueError(f"Unknown hemisphere '{hemisphere}', expected 'north' or 'south'")
+
+    starts = sorted((day_slot(m, d), season) for season, (m, d) in boundaries.items())
+    table = np.empty(12 * 31, dtype=np.int8)
+    # Before the first boundary of the year we are still in the last season
+    previous = starts[-1][1]
+    position = 0
+    for slot, season in starts:
+        table[position:slot] = SEASON_NAMES.index(previous)
+        position, previous = slot, season
+    table[position:] = SEASON_NAMES.index(previous)
+
+    if hemisphere == 'south':
+        swap = np.array([SEASON_NAMES.index(SOUTHERN_SEASON[name]) for name in SEASON_NAMES], dtype=np.int8)
+        table = swap[table]
+    return table
+
+
+def assign_seasons(dates, table=None):
+    """Vectorized season of a datetime Series/Index, as a categorical."""
+    if table is None:
+        table = build_season_table()
+    dates = pd.DatetimeIndex(dates)
+    codes = table[day_slot(dates.month, dates.day)]
+    return pd.Categorical.from_codes(codes, categories=SEASON_NAMES)
+
+
+# -----------------------------------------------
+# 🧩 SEASON AVERAGES OF ONE CHUNK OF STATIONS
+# -----------------------------------------------
+TEMP_COL = 'temperature_2m_mean (°C)'
+PREC_COL = 'precipitation_sum (mm)'
+
+
+def season_averages(df, table=None, first_year=1990, last_year=2025):
+    """Mean temperature and precipitation per City, Year and Season of a stacked frame."""
+    df = df[[TEMP_COL, PREC_COL]].assign(City=df['City'], Season=assign_seasons(df.index, table),
+                                         Year=df.index.year)
+    df = df[(df['Year'] >= first_year) & (df['Year'] <= last_year)]
+    return df.groupby(['City', 'Year', 'Season'], observed=True).agg(
+        AverageTemperature=(TEMP_COL, 'mean'),
+        AveragePrecipitation=(PREC_COL, 'mean')
+    ).reset_index()
+
+
+# -----------------------------------------------
+# 🌡️ THERMAL SEASONS: ONSET AND OFFSET DATES
+# -----------------------------------------------
+# The calendar does not say when summer actually began in a city. The
+# daily mean temperature is smoothed with a centered THERMAL_SMOOTHING-day
+# mean; summer is any run of at least THERMAL_MIN_RUN days above the summer
+# threshold, winter any run below the winter one. Onset is the first day of
+# the first run of the season year, offset the last day of its last run;
+# spring and autumn are the days in between. The thresholds are relative to
+# the mean annual cycle of each city (SUMMER_LEVEL / WINTER_LEVEL of the way
+# from its coldest to its warmest day), so a mountain station gets a summer
+# too. All cities and years in one pass on the (city, day) matrix.
+
+THERMAL_SMOOTHING = 7
+THERMAL_MIN_RUN = 5
+SUMMER_LEVEL = 0.75
+WINTER_LEVEL = 0.25
+# Share of valid smoothed days a season year needs before its dates are trusted
+THERMAL_MIN_COVERAGE = 0.9
+# The season year that crosses 1 January runs from July to June
+SPLIT_MONTH = 7
+
+THERMAL_COLUMNS = ['ThermalStartDate', 'ThermalEndDate', 'ThermalDays']
+
+
+def rolling_mean(matrix, window=THERMAL_SMOOTHING):
+    """Centered mean over window days along the days, NaN unless the whole window is valid."""
+    valid = ~np.isnan(matrix)
+    sums = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+    counts = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.where(valid, matrix, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+    window_sums = sums[:, window:] - sums[:, :-window]
+    full = counts[:, window:] - counts[:, :-window] == window
+    smoothed = np.full(matrix.shape, np.nan)
+    half = window // 2
+    smoothed[:, half:half + window_sums.shape[1]] = np.where(full, window_sums / window, np.nan)
+    return smoothed
+
+
+def thermal_thresholds(smoothed, dates, summer_above=None, winter_below=None):
+    """(summer, winter) threshold per city, from its mean annual cycle unless given in °C."""
+    n_cities = smoothed.shape[0]
+    slots = day_of_year_slots(dates)
+    groups = np.arange(n_cities)[:, None] * DAYS_IN_YEAR + slots[None, :]
+    valid = ~np.isnan(smoothed)
+    sums = np.bincount(groups[valid], weights=smoothed[valid], minlength=n_cities * DAYS_IN_YEAR)
+    counts = np.bincount(groups[valid], minlength=n_cities * DAYS_IN_YEAR)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cycle = (sums / counts).reshape(n_cities, DAYS_IN_YEAR)
+    # 29 February has a quarter of the samples: left out of the extremes
+    cycle[:, 59] = np.nan
+    low, high = np.fmin.reduce(cycle, axis=1), np.fmax.reduce(cycle, axis=1)
+    summer = low + SUMMER_LEVEL * (high - low) if summer_above is None else np.full(n_cities, summer_above)
+    winter = low + WINTER_LEVEL * (high - low) if winter_below is None else np.full(n_cities, winter_below)
+    return summer, winter
+
+
+def _onset_offset(mask, years, first_year, n_years):
+    """First day of the first run and last day of the last run per (city, season year), -1 if none."""
+    city, start, length = runs(mask)
+    keep = length >= THERMAL_MIN_RUN
+    city, start, end = city[keep], start[keep], start[keep] + length[keep] - 1
+    onset = np.full((mask.shape[0], n_years), -1, dtype=np.int64)
+    offset = np.full((mask.shape[0], n_years), -1, dtype=np.int64)
+    if len(city):
+        year = years[start] - first_year
+        # Runs come sorted by (city, day), so each (city, year) group is contiguous
+        key = city * n_years + year
+        _, first = np.unique(key, return_index=True)
+        last = np.r_[first[1:], len(key)] - 1
+        onset[city[first], year[first]] = start[first]
+        offset[city[last], year[last]] = end[last]
+    return onset, offset
+
+
+def _covered(valid, years, first_year, n_years, split):
+    """(city, season year) with at least THERMAL_MIN_COVERAGE of the days of the whole season year valid."""
+    index = years - first_year
+    groups = np.arange(valid.shape[0])[:, None] * n_years + index[None, :]
+    counts = np.bincount(groups[valid], minlength=valid.shape[0] * n_years).reshape(-1, n_years)
+    # A July-June year holds the 29 February of the following calendar year
+    leap_year = np.arange(first_year, first_year + n_years) + split
+    days = 365 + ((leap_year % 4 == 0) & ((leap_year % 100 != 0) | (leap_year % 400 == 0)))
+    return counts >= THERMAL_MIN_COVERAGE * days[None, :]
+
+
+def _previous_year(values):
+    shifted = np.full_like(values, -1)
+    shifted[:, 1:] = values[:, :-1]
+    return shifted
+
+
+def thermal_seasons(df, hemisphere='north', summer_above=None, winter_below=None):
+    """Thermal start and end date of every City, Year and Season of a stacked frame.
+
+    Summer and winter are the runs above/below the thresholds; spring goes
+    from the end of the cold season to the start of the warm one, autumn the
+    other way round. The season that crosses 1 January (winter in the north)
+    is counted in the year it starts.
+    """
+    if hemisphere not in ('north', 'south'):
+        raise ValueError(f"Unknown hemisphere '{hemisphere}', expected 'north' or 'south'")
+    matrices, cities, dates = to_matrix(df, [TEMP_COL])
+    smoothed = rolling_mean(matrices[TEMP_COL])
+    summer, winter = thermal_thresholds(smoothed, dates, summer_above, winter_below)
+
+    calendar = dates.year.to_numpy()
+    split = calendar - (dates.month.to_numpy() < SPLIT_MONTH)
+    first_year = int(split.min())
+    n_years = int(calendar.max()) - first_year + 1
+    warm_years, cold_years = (calendar, split) if hemisphere == 'north' else (split, calendar)
+
+    valid = ~np.isnan(smoothed)
+    with np.errstate(invalid='ignore'):
+        warm_on, warm_off = _onset_offset(smoothed >= summer[:, None], warm_years, first_year, n_years)
+        cold_on, cold_off = _onset_offset(smoothed <= winter[:, None], cold_years, first_year, n_years)
+    # A season year cut by the start or the end of the series would get a wrong onset
+    warm_ok = _covered(valid, warm_years, first_year, n_years, split=hemisphere == 'south')
+    cold_ok = _covered(valid, cold_years, first_year, n_years, split=hemisphere == 'north')
+    warm_on, warm_off = np.where(warm_ok, warm_on, -1), np.where(warm_ok, warm_off, -1)
+    cold_on, cold_off = np.where(cold_ok, cold_on, -1), np.where(cold_ok, cold_off, -1)
+
+    # Transitions: the day after one season ends to the day before the next starts
+    if hemisphere == 'north':
+        spring = (_previous_year(cold_off), warm_on)
+        autumn = (warm_off, cold_on)
+    else:
+        spring = (cold_off, warm_on)
+        autumn = (_previous_year(warm_off), cold_on)
+    bounds = {
+        'Summer': (warm_on, warm_off),
+        'Winter': (cold_on, cold_off),
+        'Spring': (np.where(spring[0] >= 0, spring[0] + 1, -1), np.where(spring[1] >= 0, spring[1] - 1, -1)),
+        'Autumn': (np.where(autumn[0] >= 0, autumn[0] + 1, -1), np.where(autumn[1] >= 0, autumn[1] - 1, -1)),
+    }
+
+    frames = []
+    for season, (start, end) in bounds.items():
+        city, year = np.nonzero((start >= 0) & (end >= start))
+        first, last = start[city, year], end[city, year]
+        frames.append(pd.DataFrame({
+            'City': pd.Categorical.from_codes(city, categories=cities),
+            'Year': first_year + year,
+            'Season': pd.Categorical.from_codes(np.full(len(city), SEASON_NAMES.index(season)),
+                                                categories=SEASON_NAMES),
+            'ThermalStartDate': dates[first].strftime('%Y-%m-%d'),
+            'ThermalEndDate': dates[last].strftime('%Y-%m-%d'),
+            'ThermalDays': pd.array(last - first + 1, dtype='Int64'),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@traced(rows=len)
+def season_chunk(keys, table=None, first_year=1990, last_year=2025, hemisphere='north',
+                 summer_above=None, winter_below=None):
+    """Season averages of a chunk of stations, with their thermal start and end dates (process pool worker)."""
+    df = load_stack(keys)
+    averages = season_averages(df, table, first_year, last_year)
+    thermal = thermal_seasons(df, hemisphere, summer_above, winter_below)
+    return averages.merge(thermal, on=['City', 'Year', 'Season'], how='left')
@@ -0,0 +1,209 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+# This module assumes 'scipy' is installed: pip install scipy
+from stations import load_registry, station_codes
+from paths import DATASET_DIR
+
+# =======================================================
+# 🗺️ SPATIAL INDEX OF THE WEATHER STATIONS
+# =======================================================
+# Stations are points on the sphere: a KD-tree over their 3D unit vectors
+# (scaled by the Earth radius) ranks them by chord length, which grows
+# monotonically with the haversine distance, so a lookup is O(log n).
+# When the query has an elevation, a second tree with the elevation as a
+# fourth coordinate makes 1 km of height difference count as
+# ELEVATION_WEIGHT km of distance. Reported distances are haversine km.
+#
+# Only stations active on the requested date (startdate <= date <= enddate,
+# empty enddate = still active) are returned: the tree is asked for more
+# candidates until enough of them are active.
+
+CITY_FILE = os.path.join(DATASET_DIR, 'City.csv')
+
+EARTH_RADIUS_KM = 6371.0088
+ELEVATION_WEIGHT = 10.0
+
+# First tree query, doubled until enough candidates are active
+CANDIDATES = 8
+
+# A city standing on a station point takes the station elevation
+COLOCATED_KM = 0.5
+
+
+def to_xyz(latitude, longitude):
+    """Points on the sphere of radius EARTH_RADIUS_KM (n × 3)."""
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    return EARTH_RADIUS_KM * np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+
+
+class StationIndex:
+    """Nearest active stations of WeatherStation.csv for any coordinate and date."""
+
+    def __init__(self, registry=None, elevation_weight=ELEVATION_WEIGHT):
+        if registry is None:
+            registry = load_registry()
+        self.stations = registry.dropna(subset=['latitude', 'longitude'])
+        self.codes = self.stations.index.to_numpy()
+        self.latitude = self.stations['latitude'].to_numpy(dtype=np.float64)
+        self.longitude = self.stations['longitude'].to_numpy(dtype=np.float64)
+        self.elevation = self.stations['elevation'].to_numpy(dtype=np.float64)
+        self.elevation_weight = elevation_weight
+
+        xyz = to_xyz(self.latitude, self.longitude)
+        self.tree = cKDTree(xyz)
+        height = np.nan_to_num(self.elevation) / 1000.0 * elevation_weight
+        self.tree_3d = cKDTree(np.column_stack([xyz, height]))
+
+        # Missing start = always been there, missing end = still active
+        self.start = self.stations['startdate'].to_numpy('datetime64[D]')
+        self.end = self.stations['enddate'].to_numpy('datetime64[D]')
+        self.start = np.where(np.isnat(self.start), np.datetime64('0001-01-01'), self.start)
+        self.end = np.where(np.isnat(self.end), np.datetime64('9999-12-31'), self.end)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _candidates(self, latitude, longitude, elevation, k):
+        """Indices of the k nearest stations, nearest first."""
+        k = min(k, len(self))
+        point = to_xyz([latitude], [longitude])
+        if elevation is None:
+            _, index = self.tree.query(point, k=k)
+        else:
+            height = elevation / 1000.0 * self.elevation_weight
+            _, index = self.tree_3d.query(np.column_stack([point, [[height]]]), k=k)
+        return np.atleast_1d(index.ravel())
+
+    def active(self, index, dates):
+        """(len(index), len(dates)) boolean matrix: station active on the date."""
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        return (self.start[index, None] <= dates[None, :]) & (dates[None, :] <= self.end[index, None])
+
+    def nearest(self, latitude, longitude, date=None, k=1, elevation=None):
+        """The k nearest stations active on date (any date if None), as a DataFrame."""
+        want = CANDIDATES * k
+        while True:
+            index = self._candidates(latitude, longitude, elevation, want)
+            if date is not None:
+                index = index[self.active(index, [pd.Timestamp(date)])[:, 0]]
+            if len(index) >= k or want >= len(self):
+                break
+            want *= 2
+        index = index[:k]
+        return pd.DataFrame({
+            'code': self.codes[index],
+            'shortname': self.stations['shortname'].to_numpy()[index],
+            'distance_km': haversine_km(latitude, longitude, self.latitude[index], self.longitude[index]).round(3),
+            'elevation': self.elevation[index],
+            'startdate': self.stations['startdate'].to_numpy()[index],
+            'enddate': self.stations['enddate'].to_numpy()[index],
+        })
+
+    def assign(self, latitude, longitude, dates, elevation=None):
+        """Code of the nearest active station for every date of one point (None if none is active).
+
+        The candidate list is grown until every distinct date has an active station,
+        then each date takes the first active candidate.
+        """
+        dates = pd.DatetimeIndex(dates)
+        days, inverse = np.unique(dates.to_numpy('datetime64[D]'), return_inverse=True)
+        want = CANDIDATES
+        while True:
+            index = self._candidates(latitude, longitude, elevation, want)
+            active = self.active(index, days)
+            covered = active.any(axis=0)
+            if covered.all() or want >= len(self):
+                break
+            want *= 2
+        first = active.argmax(axis=0)
+        codes = np.where(covered, self.codes[index][first], None)
+        return codes[inverse.ravel()]
+
+
+# -----------------------------------------------
+# 🏙️ CITY POINTS
+# -----------------------------------------------
+def city_points(path=CITY_FILE, index=None):
+    """{series key: (latitude, longitude, elevation)} of City.csv (same points as city.ttl) and of every station.
+
+    City.csv has no elevation: a city takes the one of a station standing on the
+    same point (within COLOCATED_KM), otherwise None and the lookup is horizontal only.
+    """
+    if index is None:
+        index = StationIndex()
+    points = {key: (lat, lon, elevation) for key, lat, lon, elevation in
+              zip(index.stations['key'], index.latitude, index.longitude, index.elevation)}
+    if os.path.exists(path):
+        cities = pd.read_csv(path)
+        distance, nearest = index.tree.query(to_xyz(cities['latitude'], cities['longitude']), k=1)
+        for name, lat, lon, d, i in zip(cities['Name'], cities['latitude'], cities['longitude'], distance, nearest):
+            elevation = index.elevation[i] if d <= COLOCATED_KM and not np.isnan(index.elevation[i]) else None
+            points[name] = (lat, lon, elevation)
+    return points
+
+
+def assign_station_codes(cities, dates, index=None, points=None):
+    """Station code of every (city, date) row, from the nearest station active on that day.
+
+    Cities without coordinates fall back to the registry mapping of stations.py.
+    """
+    if index is None:
+        index = StationIndex()
+    points = points if points is not None else city_points(index=index)
+    fallback = station_codes(index.stations)
+    cities = pd.Series(np.asarray(cities, dtype=object))
+    dates = pd.DatetimeIndex(dates)
+    codes = np.full(len(cities), None, dtype=object)
+    for city, rows in cities.groupby(cities).indices.items():
+        if city in points:
+            latitude, longitude, elevation = points[city]
+            codes[rows] = index.assign(latitude, longitude, dates[rows], elevation)
+        else:
+            codes[rows] = fallback.get(city)
+    return codes
+
+
+# =======================================================
+# ⚙️ COMMAND LINE
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Nearest active weather stations of a city or coordinate")
+    parser.add_argument('--city', help="City of City.csv (or station key)")
+    parser.add_argument('--lat', type=float)
+    parser.add_argument('--lon', type=float)
+    parser.add_argument('--elevation', type=float, default=None, help="Metres; makes the lookup elevation-aware")
+    parser.add_argument('--date', default=None, help="Only stations active on this day (YYYY-MM-DD)")
+    parser.add_argument('-k', type=int, default=3, help="Number of stations (default: %(default)s)")
+    args = parser.parse_args()
+
+    index = StationIndex()
+    if args.city:
+        points = city_points(index=index)
+        if args.city not in points:
+            raise SystemExit(f"❌ Unknown city '{args.city}'")
+        latitude, longitude, elevation = points[args.city]
+        if args.elevation is None:
+            args.elevation = elevation
+    elif args.lat is not None and args.lon is not None:
+        latitude, longitude = args.lat, args.lon
+    else:
+        raise SystemExit("❌ Give --city or --lat and --lon")
+
+    result = index.nearest(latitude, longitude, date=args.date, k=args.k, elevation=args.elevation)
+    print(f"📍 {latitude:.5f}, {longitude:.5f}" + (f" on {args.date}" if args.date else '')
+          + f" — {len(index)} stations indexed")
+    print(result.to_markdown(index=False))
+
+
+if __name__ == '__main__':
+    main()
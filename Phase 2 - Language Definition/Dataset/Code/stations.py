@@ -0,0 +1,102 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from paths import DATASET_DIR, API_DIR
+
+# =======================================================
+# 📡 STATION REGISTRY
+# =======================================================
+# Every stage works on the stations of Dataset/WeatherStation.csv that have
+# an Open-Meteo daily series in Dataset_API. The per-station work is split in
+# chunks of CHUNK_SIZE stations, processed by a pool of worker processes, so
+# memory is bounded by the chunk size and not by the size of the network.
+
+STATION_FILE = os.path.join(DATASET_DIR, 'WeatherStation.csv')
+SERIES_PATTERN = os.path.join(API_DIR, 'open-meteo-{key}.csv')
+
+# The first ten series are stored under the name of the city, not the station code
+CITY_STATIONS = {
+    'Trento': 'T0356',
+    'Povo': 'T0142',
+    'Rovereto': 'T0147',
+    'Tenno': 'T0200',
+    'Mezzana': 'T0071',
+    'Predazzo': 'T0389',
+    'Lavarone': 'T0032',
+    'Telve': 'T0392',
+    'Cavalese': 'T0367',
+    'Arco': 'T0322',
+}
+
+## ⚙️ Sharding (overridable from the environment, e.g. by the pipeline runner)
+CHUNK_SIZE = int(os.environ.get('WEATHER_CHUNK_SIZE', 25))
+WORKERS = int(os.environ['WEATHER_WORKERS']) if os.environ.get('WEATHER_WORKERS') else None
+
+
+def load_registry(path=STATION_FILE):
+    """WeatherStation.csv indexed by code, with the series key and whether the series exists."""
+    registry = pd.read_csv(path, dtype={'code': str}, parse_dates=['startdate', 'enddate'])
+    registry = registry.drop_duplicates('code').set_index('code')
+    city_of = {code: city for city, code in CITY_STATIONS.items()}
+    registry['key'] = [city_of.get(code, code) for code in registry.index]
+    registry['has_data'] = [os.path.exists(SERIES_PATTERN.format(key=key)) for key in registry['key']]
+    return registry
+
+
+def data_keys(registry=None):
+    """Series keys of the stations with data: the ten city series first (historic order), then by code."""
+    if registry is None:
+        registry = load_registry()
+    with_data = registry[registry['has_data']]
+    cities = [city for city in CITY_STATIONS if city in set(with_data['key'])]
+    others = sorted(key for key in with_data['key'] if key not in CITY_STATIONS)
+    return cities + others
+
+
+def station_codes(registry=None):
+    """{series key: station code} of every station in the registry."""
+    if registry is None:
+        registry = load_registry()
+    return dict(zip(registry['key'], registry.index))
+
+
+# -----------------------------------------------
+# 🧩 CHUNKED PROCESSING
+# -----------------------------------------------
+def chunks(keys, size=None):
+    size = size or CHUNK_SIZE
+    return [keys[i:i + size] for i in range(0, len(keys), size)]
+
+
+def map_chunks(function, keys, chunk_size=None, workers=None):
+    """Yields function(chunk of keys) for every chunk, in chunk order, from a process pool.
+
+    function must be importable (module level) so that it can be sent to the workers.
+    At most 2 × workers chunks are in flight, so the memory held by the results
+    waiting to be consumed stays bounded. A single chunk, or workers=1, runs here.
+    """
+    parts = chunks(list(keys), chunk_size)
+    workers = workers or WORKERS or os.cpu_count() or 1
+    if len(parts) <= 1 or workers == 1:
+        for part in parts:
+            yield function(part)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for part in parts:
+            pending.append(executor.submit(function, part))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def concat_chunks(frames, keys, column='City'):
+    """Concatenates the per-chunk frames, restoring one categorical over all the keys."""
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df[column] = pd.Categorical(df[column].astype(str), categories=list(keys))
+    return df
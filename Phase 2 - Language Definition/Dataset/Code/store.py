@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from stations import data_keys
+from openmeteo_loader import MEASURE_COLS, WEATHER_CODE_COL, DTYPES, load_city, load_all, source_path
+from paths import CLEAN_DIR, output_path
+from instrument import span
+
+# =======================================================
+# 🗄️ MEMORY-MAPPED DAILY OBSERVATION STORE
+# =======================================================
+# One fixed-width float32 file per variable, laid out [station][day since
+# EPOCH] (C order, NaN where there is no observation), plus store.json with
+# the station keys, the number of days and the variable metadata.
+#
+#   store/store.json
+#   store/openmeteo/temperature_2m_mean.f32
+#   store/ilmeteo/MeanTemp.f32
+#   ...
+#
+# The files are opened with np.memmap: a station series is a row view and
+# a (station, day) value is one offset computation, so a query starts in
+# milliseconds without parsing any CSV. The writer fills one station row at
+# a time, so its memory does not grow with the network.
+
+STORE_DIR = output_path('store')
+HEADER_FILE = 'store.json'
+EPOCH = pd.Timestamp('1990-01-01')
+FORMAT_VERSION = 1
+
+## 📥 Sources
+OPENMETEO = 'openmeteo'
+ILMETEO = 'ilmeteo'
+ILMETEO_PATTERN = '{city}_2000_2025_clean.csv'
+ILMETEO_COLUMNS = {
+    'MeanTemp': '°C',
+    'MinTemperature': '°C',
+    'MaxTemperature': '°C',
+    'MeanHumidity': '%',
+    'WindSpeed': 'km/h',
+    'WindGusts': 'km/h',
+    'Rainfall': 'mm',
+}
+
+
+def variable_name(source, column):
+    """'openmeteo/temperature_2m_mean' from an Open-Meteo header, 'ilmeteo/MeanTemp' from an ilmeteo one."""
+    return f"{source}/{column.split(' (')[0]}"
+
+
+def ilmeteo_path(city):
+    return os.path.join(CLEAN_DIR, ILMETEO_PATTERN.format(city=city))
+
+
+def _ilmeteo_sep(path):
+    # Older clean files were written with ',' instead of ';'
+    with open(path, encoding='utf-8') as f:
+        return ';' if ';' in f.readline() else ','
+
+
+def read_ilmeteo(city):
+    """Clean ilmeteo.it series of a city indexed by date (numeric columns only), None if missing."""
+    path = ilmeteo_path(city)
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path, sep=_ilmeteo_sep(path), usecols=['Date'] + list(ILMETEO_COLUMNS),
+                     dtype={col: np.float32 for col in ILMETEO_COLUMNS})
+    df.index = pd.to_datetime(df.pop('Date'), format='%d/%m/%Y')
+    return df[~df.index.duplicated(keep='last')]
+
+
+def _signature(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# -----------------------------------------------
+# ✍️ WRITER
+# -----------------------------------------------
+def build_store(keys=None, store_dir=STORE_DIR, sources=(OPENMETEO, ILMETEO)):
+    """Writes the store of the given stations (default: every station with data)."""
+    keys = list(keys or data_keys())
+    # First pass: date range and source files (the Open-Meteo series come from the typed cache)
+    last_day = EPOCH
+    signatures = {}
+    for key in keys:
+        if OPENMETEO in sources:
+            last_day = max(last_day, load_city(key).index.max())
+            signatures[source_path(key)] = _signature(source_path(key))
+        if ILMETEO in sources and os.path.exists(ilmeteo_path(key)):
+            dates = pd.read_csv(ilmeteo_path(key), sep=_ilmeteo_sep(ilmeteo_path(key)), usecols=['Date'])['Date']
+            last_day = max(last_day, pd.to_datetime(dates, format='%d/%m/%Y').max())
+            signatures[ilmeteo_path(key)] = _signature(ilmeteo_path(key))
+    n_days = (last_day - EPOCH).days + 1
+
+    variables = {}
+    if OPENMETEO in sources:
+        for column in [WEATHER_CODE_COL] + MEASURE_COLS:
+            unit = column.split(' (')[1].rstrip(')') if ' (' in column else ''
+            variables[variable_name(OPENMETEO, column)] = {'source': OPENMETEO, 'column': column, 'unit': unit}
+    if ILMETEO in sources:
+        for column, unit in ILMETEO_COLUMNS.items():
+            variables[variable_name(ILMETEO, column)] = {'source': ILMETEO, 'column': column, 'unit': unit}
+
+    arrays = {}
+    for name, meta in variables.items():
+        meta['file'] = name + '.f32'
+        path = os.path.join(store_dir, meta['file'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays[name] = np.memmap(path + '.tmp', dtype=np.float32, mode='w+', shape=(len(keys), n_days))
+        arrays[name][:] = np.nan
+
+    # Second pass: one station row at a time
+    for row, key in enumerate(keys):
+        with span('store_station', city=key) as current:
+            frames = {}
+            if OPENMETEO in sources:
+                frames[OPENMETEO] = load_city(key)
+            if ILMETEO in sources:
+                frames[ILMETEO] = read_ilmeteo(key)
+            for name, meta in variables.items():
+                df = frames.get(meta['source'])
+                if df is None or meta['column'] not in df:
+                    continue
+                days = (df.index - EPOCH).days.to_numpy()
+                keep = (days >= 0) & (days < n_days)
+                arrays[name][row, days[keep]] = df[meta['column']].to_numpy(dtype=np.float32)[keep]
+            current.rows = sum(len(df) for df in frames.values() if df is not None)
+
+    for name, meta in variables.items():
+        arrays[name].flush()
+        del arrays[name]
+        path = os.path.join(store_dir, meta['file'])
+        os.replace(path + '.tmp', path)
+
+    header = {
+        'version': FORMAT_VERSION,
+        'epoch': EPOCH.strftime('%Y-%m-%d'),
+        'n_days': n_days,
+        'dtype': 'float32',
+        'layout': 'station-major [station][day]',
+        'stations': keys,
+        'variables': variables,
+        'sources': signatures,
+    }
+    tmp_path = os.path.join(store_dir, HEADER_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(store_dir, HEADER_FILE))
+    return header
+
+
+# -----------------------------------------------
+# 📖 READER
+# -----------------------------------------------
+class DailyStore:
+    """Read-only view of a store: memmapped [station][day] float32 arrays."""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, HEADER_FILE), encoding='utf-8') as f:
+            self.header = json.load(f)
+        self.stations = self.header['stations']
+        self.row = {key: i for i, key in enumerate(self.stations)}
+        self.epoch = pd.Timestamp(self.header['epoch'])
+        self.n_days = self.header['n_days']
+        self.variables = self.header['variables']
+        self._arrays = {}
+
+    @property
+    def dates(self):
+        return pd.date_range(self.epoch, periods=self.n_days, freq='D')
+
+    def is_fresh(self):
+        """True if no source file changed since the store was written."""
+        return all(_signature(path) == signature for path, signature in self.header['sources'].items())
+
+    def array(self, name):
+        """(n_stations, n_days) memmap of a variable (opened on first use)."""
+        if name not in self._arrays:
+            path = os.path.join(self.store_dir, self.variables[name]['file'])
+            self._arrays[name] = np.memmap(path, dtype=np.float32, mode='r', shape=(len(self.stations), self.n_days))
+        return self._arrays[name]
+
+    def day(self, date):
+        return (pd.Timestamp(date) - self.epoch).days
+
+    def value(self, station, date, name):
+        """O(1) observation of a station on a day (NaN if missing)."""
+        day = self.day(date)
+        if not 0 <= day < self.n_days:
+            return np.nan
+        return float(self.array(name)[self.row[station], day])
+
+    def series(self, station, name, first_day=None, last_day=None):
+        """Zero-copy row view of a station, optionally between two dates."""
+        start = 0 if first_day is None else max(self.day(first_day), 0)
+        stop = self.n_days if last_day is None else min(self.day(last_day) + 1, self.n_days)
+        return self.array(name)[self.row[station], start:stop]
+
+    def rows(self, keys):
+        """Row selection of the keys: a slice (zero-copy views) when they are consecutive in the store."""
+        rows = [self.row[key] for key in keys]
+        if rows and rows == list(range(rows[0], rows[0] + len(rows))):
+            return slice(rows[0], rows[0] + len(rows))
+        return rows
+
+    def matrices(self, keys, columns, source=OPENMETEO, first_day=None, last_day=None):
+        """({column: (len(keys), n_days) array}, keys, dates) as anomalies.to_matrix returns them.
+
+        The days are trimmed to the observed range of the selection (and to first/last day).
+        """
+        rows = self.rows(keys)
+        arrays = {column: self.array(variable_name(source, column))[rows] for column in columns}
+        observed = np.zeros(self.n_days, dtype=bool)
+        for values in arrays.values():
+            observed |= ~np.isnan(values).all(axis=0)
+        if first_day is not None:
+            observed[:max(self.day(first_day), 0)] = False
+        if last_day is not None:
+            observed[max(self.day(last_day) + 1, 0):] = False
+        days = np.flatnonzero(observed)
+        if not len(days):
+            return {column: values[:, :0] for column, values in arrays.items()}, list(keys), self.dates[:0]
+        span = slice(days[0], days[-1] + 1)
+        return {column: values[:, span] for column, values in arrays.items()}, list(keys), self.dates[span]
+
+    def frame(self, keys, source=OPENMETEO):
+        """Stacked frame of one source as openmeteo_loader.load_all builds it (City categorical, date index)."""
+        names = [name for name, meta in self.variables.items() if meta['source'] == source]
+        rows = self.rows(keys)
+        data = {}
+        for name in names:
+            column = self.variables[name]['column']
+            values = self.array(name)[rows].ravel()
+            data[column] = values.astype(DTYPES[column]) if column in DTYPES and source == OPENMETEO \
+                and not np.isnan(values).any() else values
+        df = pd.DataFrame(data, index=pd.DatetimeIndex(np.tile(self.dates.to_numpy(), len(keys)), name='time'))
+        df.insert(0, 'City', pd.Categorical.from_codes(np.repeat(np.arange(len(keys)), self.n_days),
+                                                       categories=list(keys)))
+        # Only the days with at least one observation, as in the CSV series
+        return df[df.drop(columns='City').notna().any(axis=1)]
+
+
+def open_store(keys=None, store_dir=STORE_DIR):
+    """The store if it exists, is up to date and holds all the keys; otherwise None."""
+    if not os.path.exists(os.path.join(store_dir, HEADER_FILE)):
+        return None
+    store = DailyStore(store_dir)
+    if not store.is_fresh() or any(key not in store.row for key in (keys or [])):
+        return None
+    return store
+
+
+def load_stack(keys):
+    """Stacked Open-Meteo frame of the keys: from the store when it is up to date, else from the CSV cache."""
+    store = open_store(keys)
+    return store.frame(keys) if store is not None else load_all(keys)
+
+
+# =======================================================
+# ⚙️ COMMAND LINE
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Builds or queries the memory-mapped daily observation store")
+    parser.add_argument('--station', help="Print one value: station key")
+    parser.add_argument('--date', help="... date (YYYY-MM-DD)")
+    parser.add_argument('--variable', default='openmeteo/temperature_2m_mean', help="... variable")
+    args = parser.parse_args()
+
+    if args.station:
+        start = time.perf_counter()
+        store = DailyStore()
+        value = store.value(args.station, args.date, args.variable)
+        print(f"{args.station} {args.date} {args.variable} = {value} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return
+
+    start = time.perf_counter()
+    with span('build_store') as current:
+        header = build_store()
+        current.rows = len(header['stations']) * header['n_days']
+    size = sum(os.path.getsize(os.path.join(STORE_DIR, meta['file'])) for meta in header['variables'].values())
+    print(f"✅ Store written in {time.perf_counter() - start:.2f}s → {STORE_DIR}")
+    print(f"   {len(header['stations'])} stations × {header['n_days']} days × "
+          f"{len(header['variables'])} variables ({size / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
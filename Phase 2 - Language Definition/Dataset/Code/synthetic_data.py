@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import shutil
+import argparse
+from functools import partial
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from stations import map_chunks
+from openmeteo_download import DAILY_VARIABLES, DECIMALS, TIMEZONE, new_file_header, write_series
+from mock_openmeteo import unit_of
+
+# =======================================================
+# 🧪 SYNTHETIC DATASET FOR THE SCALING BENCHMARKS
+# =======================================================
+# Writes a Dataset folder with N stations × Y years laid out like the real one,
+# so every pipeline script runs on it unchanged (WEATHER_DATASET_DIR=...):
+#
+#   WeatherStation.csv, City.csv          one row per synthetic station
+#   Dataset_API/open-meteo-<code>.csv     reanalysis export (complete series)
+#   Dataset_Raw_ilmeteo.it/<code>/<year>/<code>-<year>-<Mese>.csv
+#                                         station observations, from 2000 on
+#
+# Every station draws one "true" weather from its own seeded generator
+# (elevation lapse rate, seasonal cycle, warming trend, red-noise anomalies,
+# persistent wet spells); Open-Meteo gets it in the export layout, ilmeteo.it
+# gets a biased and noisier copy with the defects of the real files: missing
+# months and days, empty values, comma decimals in some files, phenomena
+# strings, a few unparseable values and CRLF line ends.
+
+MANIFEST_FILE = 'synthetic.json'
+# Bump when the generated values change, so cached datasets are rebuilt
+GENERATOR_VERSION = 1
+
+## 📍 Stations scattered over Trentino
+LATITUDE_RANGE = (45.70, 46.50)
+LONGITUDE_RANGE = (10.50, 11.90)
+ELEVATION_RANGE = (65, 2200)
+
+## 🌡️ Climate of the synthetic stations
+SEA_LEVEL_MEAN_TEMP = 13.0      # °C at sea level, yearly mean
+LAPSE_RATE = 6.0                # °C per 1000 m
+SEASONAL_AMPLITUDE = 10.0       # °C, half the summer-winter difference
+WARMING_PER_YEAR = 0.04         # °C per year
+ANOMALY_PERSISTENCE = 0.8       # AR(1) coefficient of the daily anomalies
+ANOMALY_STD = 2.5               # °C
+WET_DAY_FRACTION = 0.30
+WET_PERSISTENCE = 0.6           # AR(1) coefficient of the latent wet/dry process
+
+## 🗂️ ilmeteo.it defects
+ILMETEO_FIRST_YEAR = 2000       # the raw archive starts here (merge-file-ilmeteo.it.py)
+MISSING_MONTH_RATE = 0.015
+MISSING_DAY_RATE = 0.01
+EMPTY_VALUE_RATE = 0.005
+COMMA_DECIMAL_RATE = 0.15       # files with one-decimal values instead of integers
+DIRTY_FILE_RATE = 0.002         # files with one unparseable value
+DIRTY_VALUE = 'n.d.'
+
+MONTH_NAMES = ['Gennaio', 'Febbraio', 'Marzo', 'Aprile', 'Maggio', 'Giugno', 'Luglio',
+               'Agosto', 'Settembre', 'Ottobre', 'Novembre', 'Dicembre']
+ILMETEO_HEADER = ("LOCALITA;DATA;TMEDIA °C;TMIN °C;TMAX °C;PUNTORUGIADA °C;UMIDITA %;VISIBILITA km;"
+                  "VENTOMEDIA km/h;VENTOMAX km/h;RAFFICA km/h;PRESSIONESLM mb;PRESSIONEMEDIA mb;PIOGGIA mm;FENOMENI")
+# Columns written with one decimal in the comma-decimal files (the others stay integers)
+DECIMAL_COLUMNS = {'TMEDIA', 'TMIN', 'TMAX', 'PUNTORUGIADA', 'PIOGGIA'}
+
+
+# -----------------------------------------------
+# 📡 STATIONS
+# -----------------------------------------------
+def station_code(index, n_stations):
+    return f"S{index:0{max(4, len(str(n_stations - 1)))}d}"
+
+
+def station_table(n_stations, first_year, seed=0):
+    """WeatherStation.csv rows of the synthetic stations (all active over the whole period)."""
+    rng = np.random.default_rng([seed, n_stations])
+    codes = [station_code(i, n_stations) for i in range(n_stations)]
+    return pd.DataFrame({
+        'code': codes,
+        'shortname': [f"Synthetic {code}" for code in codes],
+        'elevation': rng.integers(*ELEVATION_RANGE, size=n_stations),
+        'latitude': np.round(rng.uniform(*LATITUDE_RANGE, size=n_stations), 6),
+        'longitude': np.round(rng.uniform(*LONGITUDE_RANGE, size=n_stations), 6),
+        'startdate': f"{first_year - 1}-01-01",
+        'enddate': '',
+    })
+
+
+# -----------------------------------------------
+# 🌦️ TRUE WEATHER OF ONE STATION
+# -----------------------------------------------
+def _red_noise(rng, n, persistence, std):
+    """AR(1) series with the given lag-1 correlation and standard deviation."""
+    shocks = rng.normal(0.0, std * np.sqrt(1 - persistence ** 2), size=n)
+    return lfilter([1.0], [1.0, -persistence], shocks)
+
+
+def true_weather(station, dates, rng):
+    """{variable: daily values} of the Open-Meteo variables, plus the wet/snow/fog/storm masks."""
+    n = len(dates)
+    season = np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 200) / 365.25)   # +1 mid July, -1 mid January
+    years = (dates.year.to_numpy() - dates.year[0]) + dates.dayofyear.to_numpy() / 365.25
+    elevation = float(station['elevation'])
+
+    # Persistent wet spells: a latent red-noise process above a threshold
+    latent = _red_noise(rng, n, WET_PERSISTENCE, 1.0)
+    wet = latent > np.quantile(latent, 1 - WET_DAY_FRACTION)
+    storm_scale = 6.0 + 5.0 * np.maximum(season, 0)
+    rain = np.where(wet, rng.gamma(0.8, storm_scale), 0.0)
+
+    mean_temp = (SEA_LEVEL_MEAN_TEMP - LAPSE_RATE * elevation / 1000 + SEASONAL_AMPLITUDE * season
+                 + WARMING_PER_YEAR * years + _red_noise(rng, n, ANOMALY_PERSISTENCE, ANOMALY_STD) - 1.5 * wet)
+    daily_range = np.clip(9.0 + 3.0 * season - 4.0 * wet + rng.normal(0, 1.5, n), 2.0, None)
+    max_temp = mean_temp + daily_range * rng.uniform(0.45, 0.6, n)
+    min_temp = max_temp - daily_range
+
+    humidity = np.clip(68 - 8 * season + 18 * wet + rng.normal(0, 8, n), 20, 100)
+    humidity_max = np.clip(humidity + rng.uniform(8, 25, n), None, 100)
+    humidity_min = np.clip(humidity - rng.uniform(12, 30, n), 5, None)
+
+    wind = rng.gamma(2.0, 2.5 + elevation / 1000, n) + 2.0 * wet
+    gusts = wind * rng.uniform(1.8, 2.6, n) + rng.gamma(1.5, 2.0, n)
+    prevailing = rng.uniform(0, 360)
+    direction = np.mod(prevailing + np.degrees(rng.vonmises(0.0, 1.5, n)), 360)
+
+    snow = wet & (mean_temp < 1.0)
+    storm = wet & (season > 0.3) & (rain > 12)
+    fog = ~wet & (humidity > 85) & (season < 0)
+    code = np.select(
+        [snow & (rain < 2), snow & (rain < 8), snow, wet & (rain < 1), wet & (rain < 3), wet & (rain < 10), wet],
+        [71, 73, 75, 51, 53, 61, 63],
+        default=np.select([humidity < 55, humidity < 65, humidity < 80], [0, 1, 2], default=3),
+    )
+
+    values = {
+        'weather_code': code,
+        'temperature_2m_max': max_temp,
+        'temperature_2m_min': min_temp,
+        'precipitation_sum': rain,
+        'precipitation_hours': np.where(wet, np.clip(1 + rain * 0.8 + rng.gamma(1.0, 2.0, n), 0, 24), 0.0),
+        'winddirection_10m_dominant': direction,
+        'wind_gusts_10m_mean': gusts,
+        'wind_speed_10m_mean': wind,
+        'relative_humidity_2m_max': humidity_max,
+        'relative_humidity_2m_min': humidity_min,
+        'relative_humidity_2m_mean': humidity,
+        'temperature_2m_mean': mean_temp,
+    }
+    return values, {'wet': wet, 'snow': snow, 'storm': storm, 'fog': fog}
+
+
+# -----------------------------------------------
+# 📄 OPEN-METEO EXPORT
+# -----------------------------------------------
+def openmeteo_lines(dates, values):
+    """Data lines of the export, with the decimals of the manual exports."""
+    columns = [np.round(values[name], DECIMALS.get(name, 1)) + 0.0 for name in DAILY_VARIABLES]   # + 0.0: no "-0.0"
+    row_format = ','.join(f"%.{DECIMALS.get(name, 1)}f" for name in DAILY_VARIABLES)
+    text_dates = dates.strftime('%d/%m/%Y')
+    return [f"{day},{row_format % tuple(row)}" for day, row in zip(text_dates, np.column_stack(columns).tolist())]
+
+
+def write_openmeteo(path, station, dates, values):
+    payload = {
+        'latitude': station['latitude'], 'longitude': station['longitude'],
+        'elevation': float(station['elevation']), 'utc_offset_seconds': 3600,
+        'timezone': TIMEZONE, 'timezone_abbreviation': 'GMT+1',
+        'daily_units': {name: unit_of(name) for name in DAILY_VARIABLES},
+    }
+    header_rows, _ = new_file_header(payload)
+    write_series(path, openmeteo_lines(dates, values), header_rows)
+
+
+# -----------------------------------------------
+# 📄 ILMETEO.IT MONTHLY FILES
+# -----------------------------------------------
+def _integers(values):
+    return [str(v) for v in np.rint(values).astype(np.int64).tolist()]
+
+
+def _decimals(values):
+    return [f"{v:.1f}".replace('.', ',') for v in (np.round(values, 1) + 0.0).tolist()]
+
+
+def phenomena_strings(masks, rng):
+    """FENOMENI text of every day, as the site writes it ('pioggia neve ', '')."""
+    n = len(masks['wet'])
+    rain = masks['wet'] & ~(masks['snow'] & (rng.random(n) < 0.6))
+    parts = [
+        np.where(rain, 'pioggia ', ''),
+        np.where(masks['storm'], 'temporale ', ''),
+        np.where(masks['snow'], 'neve ', ''),
+        np.where(masks['fog'] | (masks['wet'] & (rng.random(n) < 0.05)), 'nebbia ', ''),
+    ]
+    text = parts[0]
+    for part in parts[1:]:
+        text = np.char.add(text, part)
+    return text.tolist()
+
+
+def ilmeteo_columns(values, masks, rng):
+    """{raw column: (integer texts, one-decimal comma texts or None)} of the observations."""
+    n = len(values['temperature_2m_mean'])
+    bias = rng.normal(-0.5, 0.8)
+    mean_temp = values['temperature_2m_mean'] + bias + rng.normal(0, 0.8, n)
+    min_temp = np.minimum(values['temperature_2m_min'] + bias + rng.normal(0, 1.0, n), mean_temp)
+    max_temp = np.maximum(values['temperature_2m_max'] + bias + rng.normal(0, 1.0, n), mean_temp)
+    humidity = np.clip(values['relative_humidity_2m_mean'] + rng.normal(0, 5, n), 5, 100)
+    # Magnus formula
+    gamma = np.log(humidity / 100) + 17.62 * mean_temp / (243.12 + mean_temp)
+    dew_point = 243.12 * gamma / (17.62 - gamma)
+    wind = values['wind_speed_10m_mean'] * 0.8 + rng.normal(0, 1, n).clip(0)
+    rain = values['precipitation_sum'] * rng.uniform(0.7, 1.3, n)
+    visibility = np.where(masks['fog'], rng.integers(0, 2, n), np.where(masks['wet'], 10, 20))
+    gusts = np.where(rng.random(n) < 0.3, values['wind_gusts_10m_mean'], 0)
+    pressure = 1015 - 8 * masks['wet'] + rng.normal(0, 6, n)
+
+    columns = {
+        'TMEDIA': mean_temp, 'TMIN': min_temp, 'TMAX': max_temp, 'PUNTORUGIADA': dew_point,
+        'UMIDITA': humidity, 'VISIBILITA': visibility, 'VENTOMEDIA': wind, 'VENTOMAX': wind * 1.9,
+        'RAFFICA': gusts, 'PRESSIONESLM': pressure, 'PRESSIONEMEDIA': np.zeros(n), 'PIOGGIA': rain,
+    }
+    return {name: (_integers(column), _decimals(column) if name in DECIMAL_COLUMNS else None)
+            for name, column in columns.items()}
+
+
+def write_ilmeteo(raw_dir, key, dates, values, masks, rng):
+    """Monthly files of the station from ILMETEO_FIRST_YEAR on; returns the number of files written."""
+    columns = ilmeteo_columns(values, masks, rng)
+    phenomena = phenomena_strings(masks, rng)
+    names = list(columns)
+    # d/m/Y without leading zeros, as the site writes the dates
+    day_texts = [f"{d}/{m}/{y}" for d, m, y in zip(dates.day.tolist(), dates.month.tolist(), dates.year.tolist())]
+    months = pd.Series(np.arange(len(dates))).groupby([dates.year, dates.month]).indices
+    written = 0
+    for (year, month), rows in months.items():
+        if year < ILMETEO_FIRST_YEAR or rng.random() < MISSING_MONTH_RATE:
+            continue
+        comma = rng.random() < COMMA_DECIMAL_RATE
+        dirty = rng.random() < DIRTY_FILE_RATE
+        keep = rows[rng.random(len(rows)) >= MISSING_DAY_RATE]
+        empty = rng.random((len(keep), len(names))) < EMPTY_VALUE_RATE
+        texts = [columns[name][1] if comma and columns[name][1] else columns[name][0] for name in names]
+        lines = [ILMETEO_HEADER]
+        for i, row in enumerate(keep.tolist()):
+            cells = ['' if empty[i, j] else text[row] for j, text in enumerate(texts)]
+            lines.append(f"{key};{day_texts[row]};" + ';'.join(f'"{c}"' for c in cells) + f';"{phenomena[row]}"')
+        if dirty and len(keep):
+            # One value the site left as text: the merge falls back to its tolerant parser
+            line = rng.integers(1, len(lines))
+            cells = lines[line].split(';')
+            cells[2 + rng.integers(len(names))] = f'"{DIRTY_VALUE}"'
+            lines[line] = ';'.join(cells)
+        folder = os.path.join(raw_dir, key, str(year))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{key}-{year}-{MONTH_NAMES[month - 1]}.csv"), 'w',
+                  encoding='utf-8', newline='') as f:
+            f.write('\r\n'.join(lines) + '\r\n')
+        written += 1
+    return written
+
+
+# -----------------------------------------------
+# 🏭 GENERATION
+# -----------------------------------------------
+def generate_chunk(keys, table, dataset_dir, first_year, last_year, seed):
+    """Writes the two sources of a chunk of stations (process pool worker); returns the files written."""
+    dates = pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq='D')
+    api_dir = os.path.join(dataset_dir, 'Dataset_API')
+    raw_dir = os.path.join(dataset_dir, 'Dataset_Raw_ilmeteo.it')
+    written = []
+    for key in keys:
+        station = table.loc[key]
+        rng = np.random.default_rng([seed, int(key[1:])])
+        values, masks = true_weather(station, dates, rng)
+        write_openmeteo(os.path.join(api_dir, f"open-meteo-{key}.csv"), station, dates, values)
+        written.append(1 + write_ilmeteo(raw_dir, key, dates, values, masks, rng))
+    return written
+
+
+def read_manifest(dataset_dir):
+    path = os.path.join(dataset_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def generate(dataset_dir, n_stations, years, last_year=2024, seed=0, force=False):
+    """Writes the synthetic dataset unless the folder already holds the same one; returns its manifest."""
+    first_year = last_year - years + 1
+    manifest = {'version': GENERATOR_VERSION, 'stations': n_stations, 'first_year': first_year,
+                'last_year': last_year, 'seed': seed}
+    previous = read_manifest(dataset_dir)
+    if not force and previous is not None and all(previous.get(k) == v for k, v in manifest.items()):
+        return previous
+    if previous is not None or (os.path.isdir(dataset_dir) and os.listdir(dataset_dir)):
+        if previous is None:
+            raise SystemExit(f"❌ {dataset_dir} is not empty and was not written by {os.path.basename(__file__)}")
+        shutil.rmtree(dataset_dir)
+
+    for folder in ('Dataset_API', 'Dataset_Raw_ilmeteo.it', 'Dataset_Clean_ilmeteo.it'):
+        os.makedirs(os.path.join(dataset_dir, folder), exist_ok=True)
+    table = station_table(n_stations, first_year, seed)
+    table.to_csv(os.path.join(dataset_dir, 'WeatherStation.csv'), index=False)
+    # One city per station, on the station itself (City.csv feeds the WeatherReport points and city.ttl)
+    table[['code', 'latitude', 'longitude']].rename(columns={'code': 'Name'}).to_csv(
+        os.path.join(dataset_dir, 'City.csv'), index=False)
+
+    keys = table['code'].tolist()
+    worker = partial(generate_chunk, table=table.set_index('code'), dataset_dir=dataset_dir,
+                     first_year=first_year, last_year=last_year, seed=seed)
+    manifest['files'] = int(sum(sum(counts) for counts in map_chunks(worker, keys)))
+    manifest['station_days'] = n_stations * len(pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31"))
+    with open(os.path.join(dataset_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+# =======================================================
+# ⚙️ MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Open-Meteo and ilmeteo.it dataset of N stations × Y years")
+    parser.add_argument('output', help="Dataset folder to write (use it as WEATHER_DATASET_DIR)")
+    parser.add_argument('--stations', type=int, default=10)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--last-year', type=int, default=2024)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help="Rewrite even if the folder holds the same dataset")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = generate(os.path.abspath(args.output), args.stations, args.years, args.last_year, args.seed, args.force)
+    print(f"✅ {manifest['stations']} stations × {manifest['first_year']}-{manifest['last_year']} "
+          f"({manifest['station_days']} station-days, {manifest['files']} files) in "
+          f"{time.perf_counter() - start:.1f}s → {args.output}")
+
+
+if __name__ == '__main__':
+    main()
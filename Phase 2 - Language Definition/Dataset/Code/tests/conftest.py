@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The scripts import each other by name from the Code folder; whatever the
+# modules generate on import (output folders, traces) goes to a temporary folder
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE_DIR)
+os.environ.setdefault('WEATHER_OUTPUT_DIR', tempfile.mkdtemp(prefix='weather_tests_'))
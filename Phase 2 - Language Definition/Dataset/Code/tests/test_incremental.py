@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from incremental import HIST_BINS, TREND_COLS, build_state, update_state
+
+# The state built on the whole history must equal the state of a prefix
+# updated day by day with the rest (split inside the reference years, so the
+# update also feeds the histograms)
+REFERENCE = (1991, 1994)
+CITIES = ['Alpha', 'Bravo', 'Charlie']
+SPLIT = pd.Timestamp('1993-06-15')
+
+
+def history(seed=0, first='1990-01-01', last='1996-12-31'):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(first, last, freq='D')
+    frames = []
+    for offset, city in enumerate(CITIES):
+        season = np.sin(2 * np.pi * (dates.dayofyear.to_numpy() - 110) / 365.25)
+        mean = 10 + offset + 10 * season + rng.normal(0, 3, len(dates))
+        rain = np.where(rng.random(len(dates)) < 0.6, 0.0, rng.gamma(0.8, 8.0, len(dates)))
+        frame = pd.DataFrame({
+            'temperature_2m_mean (°C)': mean,
+            'temperature_2m_max (°C)': mean + rng.uniform(2, 8, len(dates)),
+            'temperature_2m_min (°C)': mean - rng.uniform(2, 8, len(dates)),
+            'precipitation_sum (mm)': rain,
+            'relative_humidity_2m_mean (%)': rng.uniform(40, 95, len(dates)),
+            'wind_speed_10m_mean (km/h)': rng.gamma(2.0, 4.0, len(dates)),
+            'wind_gusts_10m_mean (km/h)': rng.gamma(3.0, 8.0, len(dates)),
+        }, index=pd.DatetimeIndex(dates, name='time'))
+        frame = frame.round(1).astype(np.float32)
+        frame.iloc[rng.random(len(dates)) < 0.02] = np.nan
+        frame.insert(0, 'City', city)
+        frames.append(frame)
+    df = pd.concat(frames)
+    df['City'] = pd.Categorical(df['City'], categories=CITIES)
+    return df
+
+
+@pytest.fixture(scope='module')
+def states():
+    df = history()
+    # Charlie's series stops ten days before the others (a late download)
+    prefix = df[(df.index < SPLIT) & ~((df['City'] == 'Charlie') & (df.index >= SPLIT - pd.Timedelta(days=10)))]
+    full = build_state(df, reference=REFERENCE)
+    updated = build_state(prefix, reference=REFERENCE)
+    update_state(updated, df)
+    return full, updated
+
+
+def test_last_day_of_every_city(states):
+    full, updated = states
+    assert updated['meta']['last_day'] == full['meta']['last_day']
+
+
+def test_regression_sums(states):
+    full, updated = states
+    for variable in TREND_COLS:
+        np.testing.assert_allclose(updated[f"sums/{variable}"], full[f"sums/{variable}"], rtol=1e-9)
+
+
+def test_histograms_and_moments(states):
+    full, updated = states
+    for variable in HIST_BINS:
+        np.testing.assert_array_equal(updated[f"hist/{variable}"], full[f"hist/{variable}"])
+        np.testing.assert_array_equal(updated[f"count/{variable}"], full[f"count/{variable}"])
+        np.testing.assert_allclose(updated[f"mean/{variable}"], full[f"mean/{variable}"], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(updated[f"m2/{variable}"], full[f"m2/{variable}"], rtol=1e-7, atol=1e-6)
+
+
+def test_dry_spells(states):
+    full, updated = states
+    np.testing.assert_array_equal(updated['spells'], full['spells'])
+    np.testing.assert_array_equal(updated['dry/length'], full['dry/length'])
+    # The start only means something while a spell is open
+    open_spell = full['dry/length'] > 0
+    np.testing.assert_array_equal(updated['dry/start'][open_spell], full['dry/start'][open_spell])
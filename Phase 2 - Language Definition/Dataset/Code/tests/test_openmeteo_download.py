@@ -0,0 +1,94 @@
+import os
+import shutil
+import asyncio
+import threading
+from datetime import date
+import pytest
+import openmeteo_download
+from paths import API_DIR
+from mock_openmeteo import MockArchiveServer
+from openmeteo_download import read_series_state, plan_station, download_all
+
+# The downloader against the local mock server: a truncated export is rebuilt
+# byte for byte, and injected 503s / connection closes change nothing but the stats
+TRENTO = os.path.join(API_DIR, 'open-meteo-Trento.csv')
+# Points away from the canned exports get the synthetic series of the mock
+SYNTHETIC_STATIONS = {f"S{i}": (45.5 + 0.1 * i, 10.5 + 0.1 * i) for i in range(6)}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Starts a mock server on a free port; yields a function (fail_every, close_every) → base URL."""
+    servers = []
+
+    def start(fail_every=0, close_every=0):
+        canned = tmp_path / 'canned'
+        canned.mkdir(exist_ok=True)
+        shutil.copy(TRENTO, canned)
+        server = MockArchiveServer(('127.0.0.1', 0), str(canned), fail_every, close_every)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        host, port = server.server_address
+        return f"http://{host}:{port}/v1/archive", server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def series_folder(tmp_path, monkeypatch, name):
+    folder = tmp_path / name
+    folder.mkdir()
+    monkeypatch.setattr(openmeteo_download, 'SERIES_PATTERN', str(folder / 'open-meteo-{key}.csv'))
+    return folder
+
+
+def truncated_trento(folder, keep_days=400):
+    with open(TRENTO, encoding='utf-8', newline='') as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(folder / 'open-meteo-Trento.csv', 'w', encoding='utf-8', newline='') as f:
+        f.writelines(lines[:4 + keep_days])
+
+
+def run_jobs(stations, end_date, base_url, concurrency=2):
+    jobs = [plan_station(key, latitude, longitude, end_date) for key, (latitude, longitude) in stations.items()]
+    return asyncio.run(download_all([job for job in jobs if job], base_url, concurrency))
+
+
+def test_truncated_series_is_rebuilt_byte_identical(archive, tmp_path, monkeypatch):
+    base_url, _ = archive()
+    folder = series_folder(tmp_path, monkeypatch, 'series')
+    truncated_trento(folder)
+    _, _, last_date = read_series_state(TRENTO)
+
+    results, stats = run_jobs({'Trento': (46.0, 11.1)}, last_date, base_url)
+    assert stats['failed'] == 0, results
+    with open(TRENTO, 'rb') as original, open(folder / 'open-meteo-Trento.csv', 'rb') as rebuilt:
+        assert rebuilt.read() == original.read()
+    # Up to date: nothing left to ask
+    assert plan_station('Trento', 46.0, 11.1, last_date) is None
+
+
+def test_retries_and_reconnections_give_the_same_files(archive, tmp_path, monkeypatch):
+    end_date = date(1995, 12, 31)
+    stations = {'Trento': (46.0, 11.1), **SYNTHETIC_STATIONS}
+
+    base_url, _ = archive()
+    clean = series_folder(tmp_path, monkeypatch, 'clean')
+    truncated_trento(clean)
+    _, clean_stats = run_jobs(stations, end_date, base_url)
+
+    base_url, server = archive(fail_every=3, close_every=2)
+    faulty = series_folder(tmp_path, monkeypatch, 'faulty')
+    truncated_trento(faulty)
+    results, stats = run_jobs(stations, end_date, base_url)
+
+    assert stats['failed'] == 0, results
+    assert stats['rows'] == clean_stats['rows']
+    # Every 503 was retried, every server-side close reopened the connection
+    assert stats['retries'] == server.requests - len(stations) > 0
+    assert stats['connections'] > clean_stats['connections']
+    assert server.connections == stats['connections']
+    for name in sorted(os.listdir(clean)):
+        assert (faulty / name).read_bytes() == (clean / name).read_bytes(), name
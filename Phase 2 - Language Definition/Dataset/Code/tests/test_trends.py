@@ -0,0 +1,40 @@
+import numpy as np
+from trends import mann_kendall, sen_slopes
+
+# Annual series with ties and missing years, checked against the O(n²) definitions
+
+
+def random_series(seed=0, n_series=40, n_years=35):
+    rng = np.random.default_rng(seed)
+    # Rounded values so that ties are frequent, as in the annual means of the CSVs
+    series = np.round(rng.normal(0, 1, (n_series, n_years)) + np.linspace(0, 1, n_years), 1)
+    series[rng.random(series.shape) < 0.1] = np.nan
+    series[0] = np.nan                 # no data at all
+    series[1, 1:] = np.nan             # a single value
+    series[2] = 3.0                    # all ties
+    return series
+
+
+def brute_force_s(row):
+    values = row[~np.isnan(row)]
+    return sum(np.sign(values[j] - values[i]) for i in range(len(values)) for j in range(i + 1, len(values)))
+
+
+def brute_force_sen(row, x):
+    slopes = [(row[j] - row[i]) / (x[j] - x[i])
+              for i in range(len(row)) for j in range(i + 1, len(row))
+              if not np.isnan(row[i]) and not np.isnan(row[j])]
+    return np.median(slopes) if slopes else np.nan
+
+
+def test_mann_kendall_s_matches_pairwise_count():
+    series = random_series()
+    s, _, _ = mann_kendall(series)
+    assert s.tolist() == [brute_force_s(row) for row in series]
+
+
+def test_sen_slope_is_median_of_pairwise_slopes():
+    series = random_series(seed=1)
+    x = np.arange(1990, 1990 + series.shape[1], dtype=np.float64)
+    expected = np.array([brute_force_sen(row, x) for row in series])
+    np.testing.assert_allclose(sen_slopes(series, x), expected, equal_nan=True)
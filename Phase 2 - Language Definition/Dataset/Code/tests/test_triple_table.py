@@ -0,0 +1,64 @@
+import os
+import glob
+import itertools
+import pytest
+from paths import PROJECT_DIR
+from triple_table import build_table, TripleTable
+
+rdflib = pytest.importorskip('rdflib')
+
+# The Phase 4 KG plus a file with the literal forms Karma does not write
+KG_FILES = sorted(glob.glob(os.path.join(PROJECT_DIR, 'Phase 4 - Entity Definition', '*.ttl')))
+EXTRA_TRIPLES = '''\
+<http://example.org/a> <http://example.org/p> "quoted \\"text\\" and a \\\\ backslash" .
+<http://example.org/a> <http://example.org/p> "12.50"^^<http://www.w3.org/2001/XMLSchema#decimal> .
+<http://example.org/a> <http://example.org/q> <http://example.org/b> .
+<http://example.org/b> <http://example.org/q> <http://example.org/a> .
+# comment line
+<http://example.org/b> <http://example.org/p> "12.50"^^<http://www.w3.org/2001/XMLSchema#decimal> .
+<http://example.org/b> <http://example.org/p> "12.50"^^<http://www.w3.org/2001/XMLSchema#decimal> .
+'''
+
+
+@pytest.fixture(scope='module')
+def stores(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('triples')
+    extra = folder / 'extra.nt'
+    extra.write_text(EXTRA_TRIPLES, encoding='utf-8')
+    paths = KG_FILES + [str(extra)]
+    build_table(paths, str(folder / 'table'))
+
+    # Lexical forms as in the files ("12.50" stays "12.50")
+    normalize = rdflib.NORMALIZE_LITERALS
+    rdflib.NORMALIZE_LITERALS = False
+    try:
+        graph = rdflib.Graph()
+        for path in paths:
+            graph.parse(path, format='nt')
+    finally:
+        rdflib.NORMALIZE_LITERALS = normalize
+    return TripleTable(str(folder / 'table')), graph
+
+
+def rdflib_matches(graph, pattern):
+    terms = [None if term is None else rdflib.util.from_n3(term) for term in pattern]
+    return {tuple(term.n3() for term in triple) for triple in graph.triples(tuple(terms))}
+
+
+def test_table_has_every_rdflib_triple(stores):
+    table, graph = stores
+    assert len(table) == len(graph)
+    assert set(table.triples()) == rdflib_matches(graph, (None, None, None))
+
+
+def test_match_equals_rdflib_triples_for_every_pattern(stores):
+    table, graph = stores
+    everything = sorted(table.triples())
+    # Patterns bound on the terms of a spread of triples, plus terms absent from the KG
+    samples = everything[::max(1, len(everything) // 60)] + [
+        ('<http://example.org/missing>', '<http://example.org/p>', '"nothing"')]
+    for triple in samples:
+        # (None, None, None) is the whole graph, compared once above
+        for bound in list(itertools.product([False, True], repeat=3))[1:]:
+            pattern = tuple(term if keep else None for term, keep in zip(triple, bound))
+            assert set(table.triples(*pattern)) == rdflib_matches(graph, pattern), pattern
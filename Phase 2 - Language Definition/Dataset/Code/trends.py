@@ -0,0 +1,278 @@
+import re
+import numpy as np
+import pandas as pd
+from scipy.special import erfc
+# This module assumes 'scipy' is installed: pip install scipy
+from openmeteo_loader import load_all
+from store import open_store
+from instrument import traced
+from anomalies import to_matrix
+from seasons import SEASON_NAMES, assign_seasons
+
+# =======================================================
+# 📈 BATCHED TREND ENGINE
+# =======================================================
+# OLS, Sen's slope and Mann-Kendall for every city × variable × window in
+# one pass over stacked NumPy arrays:
+#   - the OLS rate is fitted on the daily values of the window (as the old
+#     linregress call), with the regression sums computed as one matrix product;
+#   - Sen's slope and Mann-Kendall use the annual means of the window (one
+#     value per year, or per year and season), where the serial correlation
+#     of the daily data would make the test meaningless;
+#   - the Mann-Kendall S statistic counts the concordant pairs with a Fenwick
+#     tree over the value ranks, O(n log n), vectorized across all the series.
+
+## 🏷️ Variables (Open-Meteo columns)
+TREND_VARIABLES = [
+    'temperature_2m_mean (°C)',
+    'temperature_2m_min (°C)',
+    'temperature_2m_max (°C)',
+    'precipitation_sum (mm)',
+    'relative_humidity_2m_mean (%)',
+    'wind_speed_10m_mean (km/h)',
+]
+
+## 🪟 Windows: whole period, the last RECENT_YEARS years and each season of the whole period
+RECENT_YEARS = 15
+
+# A year enters the annual series only if the window covers at least this share of its days
+MIN_COVERAGE = 0.9
+
+# Significance level of the Mann-Kendall test
+ALPHA = 0.05
+
+
+def unit_of(column):
+    match = re.search(r'\(([^)]*)\)', column)
+    return match.group(1) if match else ''
+
+
+def build_windows(first_year, last_year, recent_years=RECENT_YEARS):
+    """[(name, first year, last year, season or None)] of the analysed windows."""
+    windows = [('full', first_year, last_year, None)]
+    if last_year - recent_years + 1 > first_year:
+        windows.append((f"last{recent_years}", last_year - recent_years + 1, last_year, None))
+    windows += [(season.lower(), first_year, last_year, season) for season in SEASON_NAMES]
+    return windows
+
+
+# -----------------------------------------------
+# 🧮 STACKED ARRAYS
+# -----------------------------------------------
+def stack_series(df, variables):
+    """(n_cities, n_variables, n_days) float64 array over whole calendar years, NaN where missing."""
+    return stack_matrices(*to_matrix(df, variables), variables)
+
+
+def stack_matrices(matrices, cities, dates, variables):
+    """stack_series from (city, day) matrices, e.g. slices of the daily store."""
+    calendar = pd.date_range(f"{dates[0].year}-01-01", f"{dates[-1].year}-12-31", freq='D')
+    offset = (dates[0] - calendar[0]).days
+    values = np.full((len(cities), len(variables), len(calendar)), np.nan)
+    for v, variable in enumerate(variables):
+        values[:, v, offset:offset + len(dates)] = matrices[variable]
+    return values, cities, calendar
+
+
+def window_masks(calendar, windows):
+    """(n_windows, n_days) boolean masks of the windows."""
+    years = calendar.year.to_numpy()
+    seasons = np.asarray(assign_seasons(calendar))
+    masks = np.zeros((len(windows), len(calendar)), dtype=bool)
+    for w, (_, first, last, season) in enumerate(windows):
+        masks[w] = (years >= first) & (years <= last)
+        if season is not None:
+            masks[w] &= seasons == season
+    return masks
+
+
+# -----------------------------------------------
+# 📐 OLS ON THE DAILY VALUES
+# -----------------------------------------------
+def ols_slopes(values, x, masks):
+    """Slope per year (n_cities, n_variables, n_windows) from the masked regression sums."""
+    valid = ~np.isnan(values)
+    y = np.where(valid, values, 0.0)
+    w = masks.T.astype(np.float64)                 # days × windows
+    n = valid.astype(np.float64) @ w
+    sx = (valid * x) @ w
+    sy = y @ w
+    sxy = (y * x) @ w
+    sxx = (valid * x * x) @ w
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (n * sxy - sx * sy) / (n * sxx - sx * sx)
+
+
+# -----------------------------------------------
+# 📅 ANNUAL MEANS
+# -----------------------------------------------
+def annual_means(values, calendar, masks, min_coverage=MIN_COVERAGE):
+    """Mean of every (city, variable, window, year), NaN if the year is not covered enough."""
+    years = calendar.year.to_numpy()
+    year_list = np.unique(years)
+    year_index = years - year_list[0]
+    # One indicator column per (window, year)
+    indicator = np.zeros((len(calendar), masks.shape[0] * len(year_list)))
+    for w in range(masks.shape[0]):
+        days = np.flatnonzero(masks[w])
+        indicator[days, w * len(year_list) + year_index[days]] = 1.0
+
+    valid = ~np.isnan(values)
+    sums = np.where(valid, values, 0.0) @ indicator
+    counts = valid.astype(np.float64) @ indicator
+    expected = indicator.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where((expected > 0) & (counts >= min_coverage * expected), sums / counts, np.nan)
+    shape = values.shape[:2] + (masks.shape[0], len(year_list))
+    return means.reshape(shape), year_list
+
+
+# -----------------------------------------------
+# 🌲 MANN-KENDALL WITH A FENWICK TREE
+# -----------------------------------------------
+def dense_ranks(series):
+    """1-based dense ranks per row (equal values share a rank), 0 for NaN."""
+    order = np.argsort(series, axis=1, kind='stable')
+    ordered = np.take_along_axis(series, order, axis=1)
+    valid = ~np.isnan(ordered)
+    new_value = np.ones(ordered.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        new_value[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ranks_sorted = np.where(valid, np.cumsum(new_value & valid, axis=1), 0)
+    ranks = np.empty_like(ranks_sorted)
+    np.put_along_axis(ranks, order, ranks_sorted, axis=1)
+    return ranks
+
+
+def _fenwick_prefix(tree, rows, index):
+    """Sum of tree[row, 1..index] for every row."""
+    total = np.zeros(len(rows), dtype=np.int64)
+    index = index.copy()
+    active = index > 0
+    while active.any():
+        total[active] += tree[rows[active], index[active]]
+        index[active] -= index[active] & -index[active]
+        active = index > 0
+    return total
+
+
+def _fenwick_add(tree, rows, index):
+    size = tree.shape[1] - 1
+    index = index.copy()
+    active = (index > 0) & (index <= size)
+    while active.any():
+        tree[rows[active], index[active]] += 1
+        index[active] += index[active] & -index[active]
+        active = (index > 0) & (index <= size)
+
+
+def mann_kendall(series):
+    """S, Z and two-sided p-value of the Mann-Kendall test for every row (time along axis 1)."""
+    n_series, n_times = series.shape
+    ranks = dense_ranks(series)
+    tree = np.zeros((n_series, int(ranks.max()) + 1), dtype=np.int64)
+    rows = np.arange(n_series)
+    s = np.zeros(n_series, dtype=np.int64)
+    seen = np.zeros(n_series, dtype=np.int64)
+
+    for j in range(n_times):
+        rank = ranks[:, j]
+        valid = rank > 0
+        # Earlier values smaller / larger than the current one
+        less = _fenwick_prefix(tree, rows, rank - 1)
+        greater = seen - _fenwick_prefix(tree, rows, rank)
+        s += np.where(valid, less - greater, 0)
+        seen += valid
+        _fenwick_add(tree, rows[valid], rank[valid])
+
+    # Variance with the tie correction Σ t(t-1)(2t+5)
+    n = seen.astype(np.float64)
+    flat = rows[:, None] * tree.shape[1] + ranks
+    groups = np.bincount(flat[ranks > 0], minlength=n_series * tree.shape[1]).reshape(n_series, -1)
+    ties = (groups * (groups - 1) * (2 * groups + 5)).sum(axis=1)
+    variance = (n * (n - 1) * (2 * n + 5) - ties) / 18.0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(variance > 0, (s - np.sign(s)) / np.sqrt(variance), np.nan)
+    p_value = erfc(np.abs(z) / np.sqrt(2.0))
+    return s, z, p_value
+
+
+def sen_slopes(series, x):
+    """Median of the pairwise slopes of every row (NaN pairs ignored)."""
+    i, j = np.triu_indices(series.shape[1], k=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slopes = (series[:, j] - series[:, i]) / (x[j] - x[i])
+    result = np.full(series.shape[0], np.nan)
+    has_pairs = (~np.isnan(slopes)).any(axis=1)
+    result[has_pairs] = np.nanmedian(slopes[has_pairs], axis=1)
+    return result
+
+
+# -----------------------------------------------
+# 🚀 ENGINE
+# -----------------------------------------------
+def describe(variable, slope, p_value, alpha=ALPHA):
+    if not p_value < alpha:
+        return "Stable (Minimal Change)"
+    if variable.startswith('temperature'):
+        return "Warming (Increase)" if slope > 0 else "Cooling (Decrease)"
+    return "Increase" if slope > 0 else "Decrease"
+
+
+def compute_trends(df, variables=TREND_VARIABLES, recent_years=RECENT_YEARS, alpha=ALPHA):
+    """One row per city × variable × window with OLS rate, Sen's slope and Mann-Kendall test."""
+    values, cities, calendar = stack_series(df, variables)
+    return trends_from_stack(values, cities, calendar, variables, recent_years, alpha)
+
+
+def trends_from_stack(values, cities, calendar, variables=TREND_VARIABLES, recent_years=RECENT_YEARS, alpha=ALPHA):
+    """compute_trends on the stacked (city, variable, day) array."""
+    data_years = calendar.year.to_numpy()[(~np.isnan(values)).any(axis=(0, 1))]
+    windows = build_windows(int(data_years.min()), int(data_years.max()), recent_years)
+    masks = window_masks(calendar, windows)
+
+    # Decimal years since the first day (as the old calculate_climate_trend)
+    x = (calendar - calendar[0]).days.to_numpy() / 365.25
+    rates = ols_slopes(values, x, masks)
+
+    means, year_list = annual_means(values, calendar, masks)
+    series = means.reshape(-1, len(year_list))
+    s, z, p_value = mann_kendall(series)
+    sen = sen_slopes(series, year_list.astype(np.float64))
+
+    shape = means.shape[:3]
+    city_index, variable_index, window_index = np.unravel_index(np.arange(series.shape[0]), shape)
+    rows = []
+    for k, (c, v, w) in enumerate(zip(city_index, variable_index, window_index)):
+        name, first, last, season = windows[w]
+        variable = variables[v]
+        unit = unit_of(variable)
+        rate = rates[c, v, w]
+        years_diff = last - first
+        label = f"{first}-{last}" + (f" {season}" if season else '')
+        rows.append({
+            'City': cities[c],
+            'ClimateTrendCustom': describe(variable, sen[k], p_value[k], alpha),
+            'ParameterMeasuredCustom': variable,
+            'TimeWindowCustom': f"{label} ({years_diff:.1f} years)",
+            'VariationCustom': f"{rate * years_diff:.2f}{unit} (total change)",
+            'RateCustom': f"{rate:.4f}{unit}/year",
+            'Window': name,
+            'SenSlope': round(float(sen[k]), 4),
+            'MannKendallS': int(s[k]),
+            'MannKendallZ': round(float(z[k]), 3),
+            'PValue': round(float(p_value[k]), 4),
+            'Years': int((~np.isnan(series[k])).sum()),
+        })
+    return pd.DataFrame(rows)
+
+
+@traced(rows=len)
+def trend_chunk(keys, variables=TREND_VARIABLES, recent_years=RECENT_YEARS, alpha=ALPHA):
+    """Trends of one chunk of stations (process pool worker), from the daily store when up to date."""
+    store = open_store(keys)
+    if store is not None:
+        values, cities, calendar = stack_matrices(*store.matrices(keys, variables), variables)
+        return trends_from_stack(values, cities, calendar, variables, recent_years, alpha)
+    return compute_trends(load_all(keys), variables, recent_years, alpha)
@@ -0,0 +1,343 @@
+import os
+import re
+import glob
+import gzip
+import json
+import time
+import bisect
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from paths import PROJECT_DIR, output_path
+from ttl_export import IRI, Literal, _escape
+from instrument import span, peak_rss_mb
+
+# =======================================================
+# 🔢 DICTIONARY-ENCODED TRIPLE TABLE
+# =======================================================
+# The KG files repeat the same long IRIs on every line. Here every distinct
+# term (in its N-Triples form, <...> or "..."^^<...>) is stored once and
+# replaced by its int32 id; the triples become an (n, 3) int32 array kept
+# twice, sorted SPO and POS, so any pattern with a bound subject or
+# predicate is a couple of binary searches.
+#
+#   triples/triples.json       counts, source files and their signatures
+#   triples/spo.i32            (n, 3) s, p, o sorted by s, p, o
+#   triples/pos.i32            (n, 3) p, o, s sorted by p, o, s
+#   triples/terms.bin          UTF-8 terms one after the other, sorted
+#   triples/term_offsets.i64   start of every term in terms.bin (+ end)
+#
+# The ids follow the sorted order of the terms, so looking a term up is a
+# binary search in terms.bin too: nothing is parsed or hashed when the table
+# is opened, every file is an np.memmap.
+#
+#   python triple_table.py                                  # Phase 4 KG
+#   python triple_table.py ../Output/ttl/*.nt.gz --p '<http://knowdive.disi.unitn.it/etype#has_season_name>'
+
+KG_FILES = os.path.join(PROJECT_DIR, 'Phase 4 - Entity Definition', '*.ttl')
+
+TRIPLE_DIR = output_path('triples')
+HEADER_FILE = 'triples.json'
+FORMAT_VERSION = 1
+
+# One triple per line: subject, predicate, then the object up to the final '.'
+# (the .ttl files of Phase 4 are N-Triples as Karma writes them)
+TRIPLE_LINE = re.compile(r'^[ \t]*(\S+)[ \t]+(\S+)[ \t]+(.*\S)[ \t]*\.[ \t]*$', re.M)
+CONTENT_LINE = re.compile(r'^[ \t]*[^#\s]', re.M)
+
+# Lines parsed and encoded at a time: the text of one chunk is in memory, plus
+# the int32 codes of the triples read so far and every distinct term once
+CHUNK_LINES = 100_000
+
+
+def _signature(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _open_text(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    return opener(path, 'rt', encoding='utf-8')
+
+
+def encode_term(term):
+    """N-Triples text of a term: IRI → <...>, Literal → "..."^^<...>, str already in N-Triples form."""
+    if isinstance(term, IRI):
+        return f"<{term}>"
+    if isinstance(term, Literal):
+        text = f'"{_escape(term.value)}"'
+        return text + f"^^<{term.datatype}>" if term.datatype else text
+    return str(term)
+
+
+def term_value(text):
+    """Plain value of an N-Triples term: the IRI without <>, the literal without quotes and datatype."""
+    if text.startswith('<') and text.endswith('>'):
+        return text[1:-1]
+    if text.startswith('"'):
+        end = text.rfind('"')
+        return (text[1:end].replace('\\"', '"').replace('\\n', '\n')
+                .replace('\\r', '\r').replace('\\\\', '\\'))
+    return text
+
+
+# -----------------------------------------------
+# 📄 LINE-ORIENTED PARSER
+# -----------------------------------------------
+def parse_ntriples(path, blank_prefix='', chunk_lines=CHUNK_LINES):
+    """(subjects, predicates, objects) lists of N-Triples terms, one chunk of lines at a time.
+
+    One regex pass over the text of the chunk instead of one call per line;
+    a file with lines that are not triples (e.g. Turtle with prefixes) is
+    rejected. blank_prefix keeps the blank nodes of different files apart.
+    """
+    with _open_text(path) as f:
+        first_line = 1
+        while True:
+            lines = list(itertools.islice(f, chunk_lines))
+            if not lines:
+                return
+            text = ''.join(lines).replace('\r', '')
+            found = TRIPLE_LINE.findall(text)
+            if len(found) != len(CONTENT_LINE.findall(text)):
+                for number, line in enumerate(lines, first_line):
+                    if line.strip() and not line.lstrip().startswith('#') and not TRIPLE_LINE.match(line):
+                        raise ValueError(f"{path}:{number}: not an N-Triples line "
+                                         f"(export with --ntriples): {line.strip()[:80]}")
+            first_line += len(lines)
+            if not found:
+                continue
+            subjects, predicates, objects = (list(column) for column in zip(*found))
+            if '_:' in text:
+                rename = lambda term: f"_:{blank_prefix}{term[2:]}" if term.startswith('_:') else term
+                subjects, objects = [rename(t) for t in subjects], [rename(t) for t in objects]
+            yield subjects, predicates, objects
+
+
+# -----------------------------------------------
+# ✍️ WRITER
+# -----------------------------------------------
+def _write_array(path, values):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(np.ascontiguousarray(values).tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def build_table(paths, table_dir=TRIPLE_DIR):
+    """Parses the files and writes the encoded table; returns its header."""
+    paths = [os.path.abspath(path) for path in paths]
+    # Every chunk is remapped onto one dictionary of the terms met so far (in order of
+    # appearance): the chunk keeps only its int32 codes, each distinct term is stored once
+    known = pd.Index([], dtype=object)
+    chunk_codes = []
+    for index, path in enumerate(paths):
+        with span('parse', file=os.path.basename(path)) as current:
+            current.rows = 0
+            for subjects, predicates, objects in parse_ntriples(path, blank_prefix=f"f{index}_"):
+                codes, local = pd.factorize(np.array(subjects + predicates + objects, dtype=object))
+                ids = known.get_indexer(local)
+                unseen = ids < 0
+                if unseen.any():
+                    ids[unseen] = len(known) + np.arange(unseen.sum())
+                    known = known.append(pd.Index(local[unseen], dtype=object))
+                    if len(known) >= 2 ** 31:
+                        raise ValueError(f"{len(known)} distinct terms do not fit int32 ids")
+                chunk_codes.append(ids.astype(np.int32)[codes].reshape(3, len(subjects)).T)
+                current.rows += len(subjects)
+
+    n = sum(len(codes) for codes in chunk_codes)
+    with span('encode', rows=n):
+        # Ids in the sorted order of the terms: one rank lookup per code
+        order = np.argsort(known.to_numpy())
+        terms = known.to_numpy()[order]
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        spo = rank[np.concatenate(chunk_codes)] if chunk_codes else np.zeros((0, 3), dtype=np.int32)
+        del chunk_codes, known, rank, order
+
+        # Sorted SPO without duplicates (a KG is a set), then the POS copy
+        spo = spo[np.lexsort((spo[:, 2], spo[:, 1], spo[:, 0]))]
+        keep = np.ones(n, dtype=bool)
+        keep[1:] = (spo[1:] != spo[:-1]).any(axis=1)
+        spo = spo[keep]
+        pos = spo[:, [1, 2, 0]]
+        pos = pos[np.lexsort((pos[:, 2], pos[:, 1], pos[:, 0]))]
+
+        encoded = [term.encode('utf-8') for term in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+
+    os.makedirs(table_dir, exist_ok=True)
+    _write_array(os.path.join(table_dir, 'spo.i32'), spo)
+    _write_array(os.path.join(table_dir, 'pos.i32'), pos)
+    _write_array(os.path.join(table_dir, 'term_offsets.i64'), offsets)
+    with open(os.path.join(table_dir, 'terms.bin.tmp'), 'wb') as f:
+        f.writelines(encoded)
+    os.replace(os.path.join(table_dir, 'terms.bin.tmp'), os.path.join(table_dir, 'terms.bin'))
+
+    header = {
+        'version': FORMAT_VERSION,
+        'triples': int(len(spo)),
+        'duplicates': int(n - len(spo)),
+        'terms': int(len(terms)),
+        'dtype': 'int32',
+        'sources': {path: _signature(path) for path in paths},
+    }
+    tmp_path = os.path.join(table_dir, HEADER_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(table_dir, HEADER_FILE))
+    return header
+
+
+# -----------------------------------------------
+# 📖 READER
+# -----------------------------------------------
+class TermDictionary:
+    """Sorted sequence of the terms, decoded on access from the memmapped blob."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, term_id):
+        return bytes(self.blob[self.offsets[term_id]:self.offsets[term_id + 1]]).decode('utf-8')
+
+    def id(self, text):
+        """Id of an N-Triples term, None if the KG does not contain it."""
+        position = bisect.bisect_left(self, text)
+        return position if position < len(self) and self[position] == text else None
+
+
+class TripleTable:
+    """Read-only view of an encoded table: memmapped SPO/POS arrays and term dictionary."""
+
+    def __init__(self, table_dir=TRIPLE_DIR):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, HEADER_FILE), encoding='utf-8') as f:
+            self.header = json.load(f)
+        n = self.header['triples']
+        self.spo = self._map('spo.i32', np.int32, (n, 3))
+        self.pos = self._map('pos.i32', np.int32, (n, 3))
+        offsets = self._map('term_offsets.i64', np.int64, (self.header['terms'] + 1,))
+        self.terms = TermDictionary(self._map('terms.bin', np.uint8, (int(offsets[-1]),)), offsets)
+
+    def _map(self, name, dtype, shape):
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.table_dir, name), dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return self.header['triples']
+
+    def is_fresh(self):
+        """True if no source file changed since the table was written."""
+        return all(_signature(path) == signature for path, signature in self.header['sources'].items())
+
+    def term_id(self, term):
+        """Id of a term given as id, IRI, Literal or N-Triples text (None if absent)."""
+        if isinstance(term, (int, np.integer)):
+            return int(term)
+        return self.terms.id(encode_term(term))
+
+    def match(self, s=None, p=None, o=None):
+        """(k, 3) int32 array of the (s, p, o) ids matching the pattern; None is a wildcard.
+
+        Bound subject → SPO index, bound predicate → POS index, object only →
+        a vectorized scan of the object column.
+        """
+        bound = [None if term is None else self.term_id(term) for term in (s, p, o)]
+        if any(term is not None and term_id is None for term, term_id in zip((s, p, o), bound)):
+            return np.zeros((0, 3), dtype=np.int32)
+        s, p, o = bound
+        if s is not None:
+            return np.asarray(_prefix_range(self.spo, [s, p, o]))
+        if p is not None:
+            found = np.asarray(_prefix_range(self.pos, [p, o]))
+            return found[:, [2, 0, 1]]
+        if o is not None:
+            return np.asarray(self.spo[self.spo[:, 2] == o])
+        return np.asarray(self.spo)
+
+    def count(self, s=None, p=None, o=None):
+        return len(self.match(s, p, o))
+
+    def triples(self, s=None, p=None, o=None):
+        """Matching triples as N-Triples text tuples."""
+        for row in self.match(s, p, o):
+            yield tuple(self.terms[int(term_id)] for term_id in row)
+
+
+def _prefix_range(index, key):
+    """Rows of a sorted (n, 3) index whose leading columns equal the bound values of key.
+
+    The bound values are used from the left up to the first None, the rest
+    of the pattern is filtered on the (small) range found.
+    """
+    low, high = 0, len(index)
+    column = 0
+    while column < len(key) and key[column] is not None:
+        values = index[low:high, column]
+        low, high = low + np.searchsorted(values, key[column], 'left'), low + np.searchsorted(values, key[column], 'right')
+        column += 1
+    rows = index[low:high]
+    for later in range(column + 1, len(key)):
+        if key[later] is not None:
+            rows = rows[rows[:, later] == key[later]]
+    return rows
+
+
+def open_table(paths=None, table_dir=TRIPLE_DIR, rebuild=False):
+    """The table of the files, rebuilt only when they changed since the last build."""
+    paths = sorted(os.path.abspath(path) for path in (paths or glob.glob(KG_FILES)))
+    if not rebuild and os.path.exists(os.path.join(table_dir, HEADER_FILE)):
+        table = TripleTable(table_dir)
+        if sorted(table.header['sources']) == paths and table.is_fresh():
+            return table
+    build_table(paths, table_dir)
+    return TripleTable(table_dir)
+
+
+# =======================================================
+# ⚙️ COMMAND LINE
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Builds or queries the dictionary-encoded triple table of the KG")
+    parser.add_argument('files', nargs='*', help="N-Triples files (.ttl/.nt, optionally .gz); default: Phase 4 KG")
+    parser.add_argument('--table-dir', default=TRIPLE_DIR)
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild even if the files did not change")
+    parser.add_argument('--s', help="Subject of the pattern (N-Triples form, e.g. '<http://...>')")
+    parser.add_argument('--p', help="Predicate of the pattern")
+    parser.add_argument('--o', help="Object of the pattern (e.g. '\"Autumn\"')")
+    parser.add_argument('--limit', type=int, default=10, help="Triples printed for a pattern")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(KG_FILES))
+    if not paths:
+        raise SystemExit(f"❌ No KG files in {KG_FILES}")
+    start = time.perf_counter()
+    with span('open_table') as current:
+        table = open_table(paths, args.table_dir, args.rebuild)
+        current.rows = len(table)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(args.table_dir, name))
+               for name in ('spo.i32', 'pos.i32', 'terms.bin', 'term_offsets.i64'))
+    print(f"✅ {len(table)} triples, {table.header['terms']} terms from {len(paths)} files "
+          f"in {elapsed:.3f}s ({size / 1e6:.1f} MB on disk, peak RSS {peak_rss_mb():.0f} MB) → {args.table_dir}")
+
+    if args.s or args.p or args.o:
+        start = time.perf_counter()
+        found = table.match(args.s, args.p, args.o)
+        print(f"🔎 {len(found)} matching triples in {(time.perf_counter() - start) * 1000:.2f} ms")
+        for row in found[:args.limit]:
+            print('   ' + ' '.join(table.terms[int(term_id)] for term_id in row) + ' .')
+
+
+if __name__ == '__main__':
+    main()
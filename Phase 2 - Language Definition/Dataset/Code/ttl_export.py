@@ -0,0 +1,453 @@
+import os
+import re
+import gzip
+import argparse
+from urllib.parse import quote
+import pandas as pd
+from paths import DATASET_DIR, output_path
+from instrument import span
+
+# =======================================================
+# 📝 1. CONFIGURATION
+# =======================================================
+# Native replacement of the Karma mapping: the Season, Microclimate,
+# ClimateTrend, WeatherReport, Anomaly, City and WeatherStation tables are
+# read in chunks and written as Turtle (prefixes + one block per subject)
+# or N-Triples, optionally gzip-compressed. Only the current chunk and the
+# set of already written City/Station/Point nodes are kept in memory.
+
+ETYPE = 'http://knowdive.disi.unitn.it/etype#'
+ENTITY = 'http://knowdive.disi.unitn.it/etype/'
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+# Rows read from the CSV at a time
+CHUNK_ROWS = 50_000
+
+# Entity classes of the KG: each one gets its own prefix in Turtle
+ENTITY_CLASSES = [
+    'City', 'Point', 'WeatherStation', 'YearSeason', 'Microclimate', 'ClimateTrend',
+    'WeatherReport', 'Temperature', 'Precipitation', 'Wind', 'Humidity', 'Anomaly', 'Rollup'
+]
+
+PREFIXES = {
+    'etype': ETYPE,
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'xsd': XSD,
+}
+PREFIXES.update({cls.lower(): f"{ENTITY}{cls}/" for cls in ENTITY_CLASSES})
+
+# Turtle local names we can write without escaping
+SAFE_LOCAL_NAME = re.compile(r'^[A-Za-z0-9_](?:[A-Za-z0-9_.\-]|%[0-9A-Fa-f]{2})*(?<!\.)$')
+
+
+# =======================================================
+# 🧱 2. RDF TERMS
+# =======================================================
+class IRI(str):
+    """An IRI node (plain strings are written as literals)."""
+
+
+class Literal:
+    __slots__ = ('value', 'datatype')
+
+    def __init__(self, value, datatype=None):
+        self.value = str(value)
+        self.datatype = datatype
+
+
+def entity(cls, local_id):
+    """IRI of an entity, e.g. entity('City', 'Trento') → .../etype/City/Trento."""
+    return IRI(f"{ENTITY}{cls}/{quote(str(local_id), safe='_-.()~')}")
+
+
+def prop(name):
+    return IRI(ETYPE + name)
+
+
+def etype_class(name):
+    return IRI(ETYPE + name)
+
+
+def _escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+# =======================================================
+# ✍️ 3. STREAMING WRITER
+# =======================================================
+class TripleWriter:
+    """Writes subject blocks as Turtle or N-Triples, gzip-compressed if requested.
+
+    The triples go to a temporary file, renamed onto the path only when the
+    export completes: a failed run never replaces (or truncates) a good export.
+    """
+
+    def __init__(self, path, fmt='turtle', compress=None):
+        if fmt not in ('turtle', 'ntriples'):
+            raise ValueError(f"Unknown format '{fmt}', expected 'turtle' or 'ntriples'")
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.fmt = fmt
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.triples = 0
+        # Longest namespaces first so that etype/City/ wins over etype/
+        self._prefixes = sorted(PREFIXES.items(), key=lambda item: -len(item[1]))
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        opener = gzip.open if self.compress else open
+        self._file = opener(self.tmp_path, 'wt', encoding='utf-8')
+        if self.fmt == 'turtle':
+            for name, namespace in PREFIXES.items():
+                self._file.write(f"@prefix {name}: <{namespace}> .\n")
+            self._file.write('\n')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    def _term(self, term):
+        if isinstance(term, IRI):
+            if self.fmt == 'turtle':
+                if term == RDF_TYPE:
+                    return 'a'
+                for name, namespace in self._prefixes:
+                    if term.startswith(namespace) and SAFE_LOCAL_NAME.match(term[len(namespace):]):
+                        return f"{name}:{term[len(namespace):]}"
+            return f"<{term}>"
+        if isinstance(term, Literal):
+            text = f'"{_escape(term.value)}"'
+            if term.datatype:
+                text += '^^' + self._term(IRI(term.datatype))
+            return text
+        return f'"{_escape(str(term))}"'
+
+    def write(self, subject, pairs):
+        """All (predicate, object) pairs of one subject; None/NaN objects are dropped."""
+        pairs = [(p, o) for p, o in pairs if o is not None and not (isinstance(o, float) and o != o)]
+        if not pairs:
+            return
+        self.triples += len(pairs)
+        s = self._term(subject)
+        if self.fmt == 'ntriples':
+            self._file.write(''.join(f"{s} <{p}> {self._term(o)} .\n" for p, o in pairs))
+            return
+        body = ' ;\n    '.join(f"{self._term(p)} {self._term(o)}" for p, o in pairs)
+        self._file.write(f"{s} {body} .\n\n")
+
+
+# =======================================================
+# 🗺️ 4. TABLE → TRIPLES MAPPINGS
+# =======================================================
+# Each mapping turns one chunk of its CSV into (subject, pairs) blocks.
+# `seen` holds the shared nodes (cities, stations, points) already written.
+
+def _city(name, seen):
+    subject = entity('City', name)
+    if subject in seen:
+        return subject, []
+    seen.add(subject)
+    return subject, [(IRI(RDF_TYPE), etype_class('City')), (prop('has_name'), name)]
+
+
+def _value(row, col):
+    value = row.get(col)
+    if value is None or (isinstance(value, float) and value != value) or value == '':
+        return None
+    return value
+
+
+def season_blocks(chunk, seen):
+    for row in chunk.to_dict('records'):
+        city, city_pairs = _city(row['City'], seen)
+        if city_pairs:
+            yield city, city_pairs
+        yield entity('YearSeason', f"{row['City']}_{row['Year']}_{row['Season']}"), [
+            (IRI(RDF_TYPE), etype_class('YearSeason')),
+            (prop('has_season_name'), row['Season']),
+            (prop('has_season_year'), row['Year']),
+            (prop('has_average_temperature'), _value(row, 'AverageTemperature')),
+            (prop('has_average_precipitation'), _value(row, 'AveragePrecipitation')),
+            (prop('has_start_date'), _value(row, 'ThermalStartDate')),
+            (prop('has_end_date'), _value(row, 'ThermalEndDate')),
+            (prop('has_been_observed_in'), city),
+        ]
+
+
+def microclimate_blocks(chunk, seen):
+    for row in chunk.to_dict('records'):
+        city, city_pairs = _city(row['City'], seen)
+        if city_pairs:
+            yield city, city_pairs
+        yield entity('Microclimate', f"{row['City']}_{row['TypeMicro']}"), [
+            (IRI(RDF_TYPE), etype_class('Microclimate')),
+            (prop('has_microclimate_type'), row['TypeMicro']),
+            (prop('has_temperature_range'), _value(row, 'TemperatureRange')),
+            (prop('has_humidity_range'), _value(row, 'HumidityRange')),
+            (prop('has_wind_pattern'), _value(row, 'WindPattern')),
+            (prop('has_shown_in'), city),
+        ]
+
+
+def climate_trend_blocks(chunk, seen):
+    for row in chunk.to_dict('records'):
+        window = str(row['TimeWindow'])
+        trend = entity('ClimateTrend', f"{row['ParameterMeasured']}_{row['City']}_{window.replace(' ', '_')}")
+        city, city_pairs = _city(row['City'], seen)
+        yield city, city_pairs + [(prop('has_climate_trend'), trend)]
+        yield trend, [
+            (IRI(RDF_TYPE), etype_class('ClimateTrend')),
+            (prop('has_parameter_measured'), row['ParameterMeasured']),
+            (prop('has_time_window'), window),
+            (prop('has_variation'), _value(row, 'Variation')),
+            (prop('has_rate'), _value(row, 'Rate')),
+        ]
+
+
+def weather_report_blocks(chunk, seen):
+    for row in chunk.to_dict('records'):
+        date_time = row['DateTime_xsd']
+        day = date_time[:10]
+        key = f"{row['City']}_{day}"
+        city, city_pairs = _city(row['City'], seen)
+        if city_pairs:
+            yield city, city_pairs
+
+        report = entity('WeatherReport', key)
+        temperature = entity('Temperature', key)
+        precipitation = entity('Precipitation', key)
+        wind = entity('Wind', key)
+        humidity = entity('Humidity', key)
+        station = _value(row, 'StationCode')
+
+        yield report, [
+            (IRI(RDF_TYPE), etype_class('WeatherReport')),
+            (prop('has_report_datetime'), Literal(date_time, XSD + 'dateTime')),
+            (prop('has_weather_code'), _value(row, 'WeatherCode')),
+            (prop('has_city_report'), city),
+            (prop('has_been_recorded_at'), entity('WeatherStation', station) if station else None),
+            (prop('has_mean_temperature'), temperature),
+            (prop('has_precipitation_mm'), precipitation),
+            (prop('has_wind_information'), wind),
+            (prop('has_humidity_information'), humidity),
+        ]
+        yield temperature, [
+            (IRI(RDF_TYPE), etype_class('Temperature')),
+            (prop('has_temperature_value'), _value(row, 'MeanTemperature')),
+            (prop('has_max_temperature'), _value(row, 'MaxTemperature')),
+            (prop('has_min_temperature'), _value(row, 'MinTemperature')),
+        ]
+        yield precipitation, [
+            (IRI(RDF_TYPE), etype_class('Precipitation')),
+            (prop('has_intensity'), _value(row, 'Precipitation')),
+            (prop('has_precipitation_hours'), _value(row, 'PrecipitationHours')),
+        ]
+        yield wind, [
+            (IRI(RDF_TYPE), etype_class('Wind')),
+            (prop('has_speed'), _value(row, 'WindSpeed')),
+            (prop('has_direction'), _value(row, 'WindDirection')),
+            (prop('has_gust'), _value(row, 'WindGusts')),
+        ]
+        yield humidity, [
+            (IRI(RDF_TYPE), etype_class('Humidity')),
+            (prop('has_humidity_value'), _value(row, 'MeanHumidity')),
+            (prop('has_max_humidity'), _value(row, 'MaxHumidity')),
+            (prop('has_min_humidity'), _value(row, 'MinHumidity')),
+        ]
+
+
+def anomaly_blocks(chunk, seen):
+    for index, row in zip(chunk.index, chunk.to_dict('records')):
+        city, city_pairs = _city(row['City'], seen)
+        if city_pairs:
+            yield city, city_pairs
+        detection = row['DetectionDateTime']
+        yield entity('Anomaly', f"{row['City']}_{detection.replace(':', '')}_{index}"), [
+            (IRI(RDF_TYPE), etype_class('Anomaly')),
+            (prop('has_anomaly_type'), row['TypeAnomaly']),
+            (prop('has_anomaly_severity'), _value(row, 'Severity')),
+            (prop('has_detection_datetime'), Literal(detection, XSD + 'dateTime')),
+            (prop('has_anomaly_city'), city),
+        ]
+
+
+def _point(lon, lat, altitude, seen):
+    subject = entity('Point', f"{lon}_{lat}")
+    if subject in seen:
+        return subject, []
+    seen.add(subject)
+    return subject, [
+        (IRI(RDF_TYPE), etype_class('Point')),
+        (prop('has_latitude'), lat),
+        (prop('has_longitude'), lon),
+        (prop('has_altitude'), altitude),
+    ]
+
+
+def city_blocks(chunk, seen):
+    for row in chunk.to_dict('records'):
+        point, point_pairs = _point(row['longitude'], row['latitude'], None, seen)
+        if point_pairs:
+            yield point, point_pairs
+        city, city_pairs = _city(row['Name'], seen)
+        yield city, city_pairs + [(prop('has_city_location'), point)]
+
+
+def weather_station_blocks(chunk, seen):
+    for row in chunk.to_dict('records'):
+        point, point_pairs = _point(row['longitude'], row['latitude'], _value(row, 'elevation'), seen)
+        if point_pairs:
+            yield point, point_pairs
+        yield entity('WeatherStation', row['code']), [
+            (IRI(RDF_TYPE), etype_class('WeatherStation')),
+            (prop('has_station_code'), row['code']),
+            (prop('has_station_name'), _value(row, 'shortname')),
+            (prop('has_start_date'), _value(row, 'startdate')),
+            (prop('has_end_date'), _value(row, 'enddate')),
+            (prop('has_station_location'), point),
+        ]
+
+
+# =======================================================
+# 📋 5. TABLE DEFINITIONS
+# =======================================================
+# The column aliases accept both the CSVs produced by the Create-* scripts
+# and the cleaned versions stored in Dataset/ (the ones mapped with Karma).
+TABLES = {
+    'season': {
+        'input': output_path('season.csv'),
+        'blocks': season_blocks,
+        'aliases': {},
+    },
+    'microclimate': {
+        'input': output_path('microclima.csv'),
+        'blocks': microclimate_blocks,
+        'aliases': {
+            'TypeMicroCustom': 'TypeMicro',
+            'TemperatureRange (Celsius)': 'TemperatureRange',
+            'HumidityRange (Percentage)': 'HumidityRange',
+            'WindPattern  (km/h, degree)': 'WindPattern',
+        },
+    },
+    'climatetrend': {
+        'input': output_path('climate_trend_analysis.csv'),
+        'blocks': climate_trend_blocks,
+        'aliases': {
+            'ParameterMeasuredCustom': 'ParameterMeasured',
+            'ParameterMeasured (Celsius)': 'ParameterMeasured',
+            'TimeWindowCustom': 'TimeWindow',
+            'VariationCustom': 'Variation',
+            'Variation (Celsius)': 'Variation',
+            'RateCustom': 'Rate',
+            'Rate (Celsius/Year)': 'Rate',
+        },
+    },
+    'weatherreport': {
+        'input': output_path('WeatherReport_Station.csv'),
+        'blocks': weather_report_blocks,
+        'aliases': {
+            'CityCode': 'StationCode',
+            'MaxHumidity (Percentage)': 'MaxHumidity',
+            'MinHumidity (Percentage)': 'MinHumidity',
+            'MeanHumidity (Percentage)': 'MeanHumidity',
+            'WindDirection (Degree)': 'WindDirection',
+            'MaxTemperature (Celsius)': 'MaxTemperature',
+            'MinTemperature (Celsius)': 'MinTemperature',
+            'MeanTemperature (Celsius)': 'MeanTemperature',
+            'Precipitation (mm)': 'Precipitation',
+            'PrecipitationHours (h)': 'PrecipitationHours',
+            'WindGusts (km/h)': 'WindGusts',
+            'WindSpeed (km/h)': 'WindSpeed',
+        },
+    },
+    'anomaly': {
+        'input': output_path('anomaly.csv'),
+        'blocks': anomaly_blocks,
+        'aliases': {},
+    },
+    'city': {
+        'input': os.path.join(DATASET_DIR, 'City.csv'),
+        'blocks': city_blocks,
+        'aliases': {},
+    },
+    'weatherstation': {
+        'input': os.path.join(DATASET_DIR, 'WeatherStation.csv'),
+        'blocks': weather_station_blocks,
+        'aliases': {},
+    },
+}
+
+
+def normalize_chunk(table, chunk):
+    """Canonical column names, plus the derived columns some layouts lack."""
+    chunk = chunk.rename(columns=TABLES[table]['aliases'])
+    if table == 'weatherreport' and 'DateTime_xsd' not in chunk:
+        # WeatherReportMinimum.csv: Date is already an xsd:dateTime
+        chunk = chunk.rename(columns={'Date': 'DateTime_xsd'})
+    if table == 'anomaly' and 'DetectionDateTime' not in chunk:
+        detection = pd.to_datetime(chunk['DetectionDate'] + ' ' + chunk['DetectionTime'], format='%d/%m/%Y %H:%M:%S')
+        chunk['DetectionDateTime'] = detection.dt.strftime('%Y-%m-%dT%H:%M:%S')
+    if table == 'climatetrend':
+        # "2.48°C (total change)" / "0.0708°C/year" → plain numbers
+        for col in ('Variation', 'Rate'):
+            chunk[col] = chunk[col].str.extract(r'(-?[0-9.]+)', expand=False)
+        chunk['ParameterMeasured'] = chunk['ParameterMeasured'].str.replace(' (°C)', ' ', regex=False)
+    return chunk
+
+
+def export_table(table, input_path=None, output_file=None, fmt='turtle', compress=None, chunk_rows=CHUNK_ROWS):
+    """Streams one table to RDF and returns (output path, number of triples).
+
+    compress=None lets the extension of output_file decide (.gz → gzip).
+    """
+    definition = TABLES[table]
+    input_path = input_path or definition['input']
+    if output_file is None:
+        extension = 'ttl' if fmt == 'turtle' else 'nt'
+        output_file = output_path(os.path.join('ttl', f"{table}.{extension}" + ('.gz' if compress else '')))
+
+    seen = set()
+    with TripleWriter(output_file, fmt=fmt, compress=compress) as writer:
+        # dtype=str keeps the literals exactly as written in the CSV
+        for chunk in pd.read_csv(input_path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+            for subject, pairs in definition['blocks'](normalize_chunk(table, chunk), seen):
+                writer.write(subject, pairs)
+    return output_file, writer.triples
+
+
+# =======================================================
+# ⚙️ 6. MAIN
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Exports the pipeline CSVs as RDF (Turtle or N-Triples)")
+    parser.add_argument('tables', nargs='*',
+                        help=f"Tables to export among {', '.join(TABLES)} (default: all whose input exists)")
+    parser.add_argument('--input', help="Input CSV (only with a single table)")
+    parser.add_argument('--output', help="Output file (only with a single table)")
+    parser.add_argument('--ntriples', action='store_true', help="Write N-Triples instead of Turtle")
+    parser.add_argument('--gzip', action='store_true', help="gzip-compress the output (implied by --output *.gz)")
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.tables) - set(TABLES))
+    if unknown:
+        parser.error(f"unknown tables {unknown}")
+    tables = args.tables or [t for t in TABLES if os.path.exists(TABLES[t]['input'])]
+    if (args.input or args.output) and len(tables) != 1:
+        parser.error("--input/--output need exactly one table")
+
+    fmt = 'ntriples' if args.ntriples else 'turtle'
+    for table in tables:
+        with span('export_table', table=table) as current:
+            path, triples = export_table(table, args.input, args.output, fmt=fmt, compress=True if args.gzip else None)
+            current.rows = triples
+        print(f"✅ {table}: {triples} triples → {path}")
+
+
+if __name__ == '__main__':
+    main()
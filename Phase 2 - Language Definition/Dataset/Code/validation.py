@@ -0,0 +1,325 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from stations import data_keys, map_chunks
+from openmeteo_loader import MEASURE_COLS, WEATHER_CODE_COL, FILE_PATTERN, load_city
+from paths import output_path
+from instrument import traced
+
+# =======================================================
+# 🩺 DATA-QUALITY CHECKS OF THE INGESTED FILES
+# =======================================================
+# Every check is one vectorized expression over whole columns, grouped by
+# source file with np.bincount: the monthly ilmeteo.it files of a city are
+# checked together, right after they are parsed and before they are merged,
+# so the cost is a few array passes per city instead of per file. The result
+# is one flat dict of counters per file; the run writes them as a CSV report
+# and a JSON summary:
+#
+#   Output/quality/<source>_quality.csv    one row per file
+#   Output/quality/<source>_summary.json   totals, status counts, files to look at
+#
+# Status of a file:
+#   error    it cannot be trusted (unreadable, missing required columns,
+#            unparseable dates or dates of another month): it is not merged
+#   warning  values out of range, TMIN > TMEDIA > TMAX, duplicate or missing days
+#   ok       none of the above
+#
+# The values of an ilmeteo.it file that fail the range or order checks are
+# set to NaN before the merge (masked_values in the report): the rest of the
+# file is merged, the implausible values never reach the clean series.
+
+QUALITY_DIR = 'quality'
+OK, WARNING, ERROR = 'ok', 'warning', 'error'
+STATUS_ORDER = [OK, WARNING, ERROR]
+
+## 📏 Plausible ranges (inclusive) of the ilmeteo.it clean columns
+ILMETEO_RANGES = {
+    'MeanTemp': (-40, 45),
+    'MinTemperature': (-45, 45),
+    'MaxTemperature': (-40, 48),
+    'MeanHumidity': (0, 100),
+    'WindSpeed': (0, 200),
+    'WindGusts': (0, 300),
+    'Rainfall': (0, 500),
+}
+ILMETEO_ORDER = ('MinTemperature', 'MeanTemp', 'MaxTemperature')
+
+## 📏 ... and of the Open-Meteo columns
+OPENMETEO_RANGES = {
+    WEATHER_CODE_COL: (0, 99),
+    'temperature_2m_max (°C)': (-40, 48),
+    'temperature_2m_min (°C)': (-45, 45),
+    'temperature_2m_mean (°C)': (-40, 45),
+    'precipitation_sum (mm)': (0, 500),
+    'precipitation_hours (h)': (0, 24),
+    'winddirection_10m_dominant (°)': (0, 360),
+    'wind_gusts_10m_mean (km/h)': (0, 300),
+    'wind_speed_10m_mean (km/h)': (0, 200),
+    'relative_humidity_2m_max (%)': (0, 100),
+    'relative_humidity_2m_min (%)': (0, 100),
+    'relative_humidity_2m_mean (%)': (0, 100),
+}
+OPENMETEO_ORDERS = [
+    ('temperature_2m_min (°C)', 'temperature_2m_mean (°C)', 'temperature_2m_max (°C)'),
+    ('relative_humidity_2m_min (%)', 'relative_humidity_2m_mean (%)', 'relative_humidity_2m_max (%)'),
+]
+
+# Rounding of the sources: TMIN ≤ TMEDIA ≤ TMAX is checked with this slack
+ORDER_TOLERANCE = 0.5
+
+
+# -----------------------------------------------
+# 🔍 VECTORIZED CHECKS (one counter array per check, one slot per file)
+# -----------------------------------------------
+def _count(mask, groups, n_groups):
+    return np.bincount(groups[mask], minlength=n_groups)
+
+
+def check_values(df, ranges, orders=(), groups=None, n_groups=1):
+    """Null, out-of-range and min ≤ mean ≤ max counters of the numeric columns, per group."""
+    if groups is None:
+        groups = np.zeros(len(df), dtype=np.int64)
+    result = {}
+    for col, (low, high) in ranges.items():
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy(dtype=np.float64)
+        name = col.split(' (')[0]
+        result[f"null_{name}"] = _count(np.isnan(values), groups, n_groups)
+        with np.errstate(invalid='ignore'):
+            result[f"range_{name}"] = _count((values < low) | (values > high), groups, n_groups)
+    violations = np.zeros(n_groups, dtype=np.int64)
+    for low_col, mean_col, high_col in orders:
+        if not all(col in df.columns for col in (low_col, mean_col, high_col)):
+            continue
+        low, mean, high = (df[col].to_numpy(dtype=np.float64) for col in (low_col, mean_col, high_col))
+        with np.errstate(invalid='ignore'):
+            violations += _count((low > mean + ORDER_TOLERANCE) | (mean > high + ORDER_TOLERANCE), groups, n_groups)
+    result['order_violations'] = violations
+    return result
+
+
+def mask_invalid(df, ranges, orders=(), groups=None, n_groups=1):
+    """Sets the out-of-range values, then the min/mean/max triples out of order, to NaN (in place).
+
+    Returns the number of masked values per group.
+    """
+    if groups is None:
+        groups = np.zeros(len(df), dtype=np.int64)
+    masked = np.zeros(n_groups, dtype=np.int64)
+    for col, (low, high) in ranges.items():
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            bad = (values < low) | (values > high)
+        if bad.any():
+            df.loc[bad, col] = np.nan
+            masked += _count(bad, groups, n_groups)
+    for cols in orders:
+        if not all(col in df.columns for col in cols):
+            continue
+        low, mean, high = (df[col].to_numpy(dtype=np.float64) for col in cols)
+        with np.errstate(invalid='ignore'):
+            bad = (low > mean + ORDER_TOLERANCE) | (mean > high + ORDER_TOLERANCE)
+        if bad.any():
+            # The wrong value of the triple is unknown: none of the three is kept
+            for values in (low, mean, high):
+                masked += _count(bad & ~np.isnan(values), groups, n_groups)
+            df.loc[bad, list(cols)] = np.nan
+    return masked
+
+
+def check_dates(dates, groups=None, first_days=None, last_days=None):
+    """Unparseable, duplicate, out-of-period and missing days of a datetime column, per group.
+
+    first_days/last_days are the periods the groups must cover (datetime64[D]
+    arrays); by default a group covers its own first to last day.
+    """
+    dates = pd.DatetimeIndex(dates)
+    if groups is None:
+        groups = np.zeros(len(dates), dtype=np.int64)
+    n_groups = len(first_days) if first_days is not None else int(groups.max(initial=-1)) + 1
+    valid = ~dates.isna()
+    days = dates.to_numpy('datetime64[D]').astype(np.int64)
+    if first_days is None:
+        first = np.full(n_groups, np.iinfo(np.int64).max)
+        last = np.full(n_groups, np.iinfo(np.int64).min)
+        np.minimum.at(first, groups[valid], days[valid])
+        np.maximum.at(last, groups[valid], days[valid])
+    else:
+        first = np.asarray(first_days, dtype='datetime64[D]').astype(np.int64)
+        last = np.asarray(last_days, dtype='datetime64[D]').astype(np.int64)
+    inside = valid & (days >= first[groups]) & (days <= last[groups])
+
+    # Distinct (group, day) pairs among the valid days
+    order = np.lexsort((days[valid], groups[valid]))
+    g, d = groups[valid][order], days[valid][order]
+    repeated = np.zeros(len(g), dtype=bool)
+    repeated[1:] = (g[1:] == g[:-1]) & (d[1:] == d[:-1])
+    distinct_inside = _count(~repeated & inside[valid][order], g, n_groups)
+
+    has_days = last >= first
+    expected = np.where(has_days, last - first + 1, 0)
+    return {
+        'bad_dates': _count(~valid, groups, n_groups),
+        'duplicate_days': _count(repeated, g, n_groups),
+        'days_outside_period': _count(valid & ~inside, groups, n_groups),
+        'missing_days': expected - distinct_inside,
+        'first_day': np.where(has_days, first, 0).astype('datetime64[D]').astype(str),
+        'last_day': np.where(has_days, last, 0).astype('datetime64[D]').astype(str),
+    }
+
+
+def file_status(quality):
+    if quality.get('read_error') or quality.get('missing_required') or quality.get('bad_dates') \
+            or quality.get('days_outside_period'):
+        return ERROR
+    warnings = ['order_violations', 'duplicate_days', 'missing_days', 'missing_columns', 'unparsed_values']
+    if any(quality.get(key) for key in warnings) or any(v for k, v in quality.items() if k.startswith('range_')):
+        return WARNING
+    return OK
+
+
+def _per_group(counters, n_groups):
+    """{name: array} → one {name: value} dict per group."""
+    rows = [{} for _ in range(n_groups)]
+    for name, values in counters.items():
+        for row, value in zip(rows, values.tolist()):
+            row[name] = value
+    return rows
+
+
+# -----------------------------------------------
+# 📄 FILES OF EACH SOURCE
+# -----------------------------------------------
+def validate_ilmeteo_files(df, groups, years, months, missing_columns=None, unparsed_values=None):
+    """Quality dict of every monthly ilmeteo.it file of a batch.
+
+    df is the concatenation of the parsed files (clean column names, Date as
+    d/m/yyyy text), groups the index of the file of every row, years/months
+    the month every file must contain. The values failing the range and
+    order checks are set to NaN in df once counted.
+    """
+    n_files = len(years)
+    missing_columns = missing_columns or [[] for _ in range(n_files)]
+    unparsed_values = unparsed_values or [0] * n_files
+    first_days = np.array([f"{y:04d}-{m:02d}" for y, m in zip(years, months)], dtype='datetime64[M]')
+    last_days = (first_days + 1).astype('datetime64[D]') - 1
+    dates = pd.to_datetime(df['Date'], format='%d/%m/%Y', errors='coerce')
+
+    counters = {'rows': np.bincount(groups, minlength=n_files)}
+    counters.update(check_dates(dates, groups, first_days.astype('datetime64[D]'), last_days))
+    counters.update(check_values(df, ILMETEO_RANGES, [ILMETEO_ORDER], groups, n_files))
+    counters['masked_values'] = mask_invalid(df, ILMETEO_RANGES, [ILMETEO_ORDER], groups, n_files)
+    rows = _per_group(counters, n_files)
+    for row, missing, unparsed in zip(rows, missing_columns, unparsed_values):
+        row['missing_columns'] = ' '.join(missing)
+        row['missing_required'] = int('Date' in missing or all(col in missing for col in ILMETEO_RANGES))
+        row['unparsed_values'] = int(unparsed)
+        row['status'] = file_status(row)
+    return rows
+
+
+def validate_openmeteo(city, df=None):
+    """Quality dict of one Open-Meteo series (the typed frame of load_city)."""
+    quality = {'City': city, 'File': FILE_PATTERN.format(city=city)}
+    try:
+        df = load_city(city) if df is None else df
+    except Exception as e:
+        quality.update({'read_error': str(e), 'status': ERROR})
+        return quality
+    missing = [col for col in [WEATHER_CODE_COL] + MEASURE_COLS if col not in df.columns]
+    counters = {'rows': np.array([len(df)])}
+    counters.update(check_dates(df.index))
+    counters.update(check_values(df, OPENMETEO_RANGES, OPENMETEO_ORDERS))
+    quality.update(_per_group(counters, 1)[0])
+    quality['missing_columns'] = ' '.join(missing)
+    quality['missing_required'] = int(len(missing) == len(MEASURE_COLS) + 1)
+    quality['status'] = file_status(quality)
+    return quality
+
+
+@traced(rows=lambda quality: sum(q.get('rows', 0) for q in quality))
+def openmeteo_chunk(keys):
+    """Quality dicts of a chunk of Open-Meteo series (process pool worker)."""
+    return [validate_openmeteo(city) for city in keys]
+
+
+# -----------------------------------------------
+# 💾 REPORT AND SUMMARY
+# -----------------------------------------------
+def report_paths(source):
+    return (output_path(os.path.join(QUALITY_DIR, f"{source}_quality.csv")),
+            output_path(os.path.join(QUALITY_DIR, f"{source}_summary.json")))
+
+
+def read_report(source):
+    """Previous per-file report of a source (empty if there is none)."""
+    report_path, _ = report_paths(source)
+    if not os.path.exists(report_path):
+        return pd.DataFrame()
+    return pd.read_csv(report_path, keep_default_na=False, low_memory=False)
+
+
+def write_report(source, rows, previous=None, key='File', drop_keys=()):
+    """Writes the per-file CSV and the JSON summary; rows replace the previous ones with the same key."""
+    report = pd.DataFrame(rows)
+    if previous is not None and len(previous):
+        stale = set(report[key]) if len(report) else set()
+        previous = previous[~previous[key].isin(stale | set(drop_keys))]
+        report = pd.concat([previous, report], ignore_index=True)
+    if not len(report):
+        return report, {}
+    report = report.sort_values(key, kind='stable').reset_index(drop=True)
+    # Status first, counters after the identifying columns
+    front = [col for col in [key, 'City', 'Year', 'Month', 'status', 'rows'] if col in report.columns]
+    report = report[front + [col for col in report.columns if col not in front]]
+    counters = [col for col in report.columns if col not in front and report[col].dtype.kind in 'if']
+    report[counters] = report[counters].fillna(0).astype(np.int64)
+
+    summary = {
+        'source': source,
+        'files': len(report),
+        'rows': int(report['rows'].sum()) if 'rows' in report else 0,
+        'status': {status: int((report['status'] == status).sum()) for status in STATUS_ORDER},
+        'issues': {col: int(report[col].sum()) for col in counters if report[col].sum()},
+        'errors': report.loc[report['status'] == ERROR, key].tolist(),
+        'warnings': report.loc[report['status'] == WARNING, key].tolist(),
+    }
+    report_path, summary_path = report_paths(source)
+    report.to_csv(report_path + '.tmp', index=False)
+    os.replace(report_path + '.tmp', report_path)
+    with open(summary_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=1, ensure_ascii=False)
+    os.replace(summary_path + '.tmp', summary_path)
+    return report, summary
+
+
+def print_summary(summary, report_path):
+    status = summary.get('status', {})
+    print(f"🩺 Quality: {status.get(OK, 0)} ok, {status.get(WARNING, 0)} warning, "
+          f"{status.get(ERROR, 0)} error files → {report_path}")
+    for key in summary.get('errors', [])[:10]:
+        print(f"   ❌ {key}")
+
+
+# =======================================================
+# ⚙️ COMMAND LINE (Open-Meteo series; the ilmeteo.it files are checked by the merge)
+# =======================================================
+def main():
+    parser = argparse.ArgumentParser(description="Data-quality report of the Open-Meteo series")
+    parser.add_argument('--city', action='append', help="Only these station keys (repeatable)")
+    args = parser.parse_args()
+
+    keys = args.city or data_keys()
+    rows = [row for chunk in map_chunks(openmeteo_chunk, keys) for row in chunk]
+    _, summary = write_report('openmeteo', rows, read_report('openmeteo') if args.city else None)
+    print_summary(summary, report_paths('openmeteo')[0])
+
+
+if __name__ == '__main__':
+    main()